@@ -0,0 +1,96 @@
+"""
+Aho-Corasick automaton for matching many keywords in one pass over a text.
+
+The automaton is built once from the patterns; every occurrence of every pattern
+is then found in time linear in the text length plus the number of matches,
+instead of one regex scan per keyword.
+
+After construction the trie is flattened into typed arrays (states numbered in
+breadth-first order, the edges of each state contiguous and sorted by character),
+so a pickled automaton is a handful of byte buffers and loads in milliseconds.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+class AhoCorasick:
+    """Exact multi-pattern matcher (case handling is left to the caller)."""
+
+    def __init__(self, patterns: Sequence[str]):
+        """
+        Args:
+            patterns: Strings to look for; a match reports the index of its pattern.
+                Empty patterns are ignored.
+        """
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append([])
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state].append(index)
+
+        # Breadth-first: a state's failure link points to the longest proper suffix
+        # that is also a prefix of some pattern, and it inherits that state's outputs
+        # (children of the root keep the root as their failure link)
+        fail = [0] * len(goto)
+        order = [0]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        renumber = {old: new for new, old in enumerate(order)}
+        self._edge_start = array('I', [0])
+        self._edge_char = array('I')
+        self._edge_target = array('I')
+        self._fail = array('I')
+        self._out_start = array('I', [0])
+        self._out = array('I')
+        for old in order:
+            for ch, nxt in sorted(goto[old].items()):
+                self._edge_char.append(ord(ch))
+                self._edge_target.append(renumber[nxt])
+            self._edge_start.append(len(self._edge_char))
+            self._fail.append(renumber[fail[old]])
+            self._out.extend(out[old])
+            self._out_start.append(len(self._out))
+        self._lengths = array('I', (len(p) for p in patterns))
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yields `(start, end, pattern_index)` for every occurrence, ordered by end position."""
+        edge_start, edge_char, edge_target = self._edge_start, self._edge_char, self._edge_target
+        fail, out_start, out, lengths = self._fail, self._out_start, self._out, self._lengths
+        state = 0
+        for pos, ch in enumerate(text):
+            code = ord(ch)
+            while True:
+                lo, hi = edge_start[state], edge_start[state + 1]
+                i = bisect_left(edge_char, code, lo, hi)
+                if i < hi and edge_char[i] == code:
+                    state = edge_target[i]
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            for j in range(out_start[state], out_start[state + 1]):
+                index = out[j]
+                yield pos + 1 - lengths[index], pos + 1, index
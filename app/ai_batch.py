@@ -0,0 +1,205 @@
+"""
+Backlog rewrites through batch jobs.
+
+When many extracted articles are waiting for the AI rewrite, they are packed into
+batch jobs instead of one synchronous call each. Jobs are recorded in the store
+(ai_batch_jobs) with their articles marked BATCHED; every pipeline cycle polls the
+open jobs and saves each valid result as the REWRITTEN stage, so the regular
+queue publishes it like any other resumed article. Articles without a usable
+result go back to EXTRACTED and are rewritten one by one.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import TooManyRequests
+
+from .ai_processor import AIProcessor
+from .config import AI_BATCH_CONFIG
+from .exceptions import AIProcessorError
+from .keys import OUTCOME_ERROR, OUTCOME_RATE_LIMITED, OUTCOME_SUCCESS, key_hash
+from .store import Database
+from . import ai_client_gemini as ai_client
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED', 'EXPIRED')
+
+
+class LocalBatchBackend:
+    """
+    In-process stand-in for the batch API: `generate` is applied to every prompt
+    and the job reports SUCCEEDED after `polls_until_done` polls. Used offline, in
+    tests and with AI_BATCH_BACKEND=local.
+    """
+
+    def __init__(self, generate: Callable[[str], str], polls_until_done: int = 1):
+        self.generate = generate
+        self.polls_until_done = polls_until_done
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, prompts: List[Tuple[str, str]], display_name: str, **generation_config: Any) -> str:
+        job_id = f"local/{display_name}-{len(self.jobs) + 1}"
+        self.jobs[job_id] = {'prompts': list(prompts), 'polls': 0}
+        return job_id
+
+    def poll(self, job_id: str) -> Dict[str, Any]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {'state': 'EXPIRED', 'results': {}, 'errors': {}, 'error': 'Unknown job'}
+        job['polls'] += 1
+        if job['polls'] < self.polls_until_done:
+            return {'state': 'RUNNING', 'results': {}, 'errors': {}, 'error': None}
+        results, errors = {}, {}
+        for key, prompt in job['prompts']:
+            try:
+                results[key] = self.generate(prompt)
+            except Exception as e:
+                errors[key] = str(e)
+        return {'state': 'SUCCEEDED', 'results': results, 'errors': errors, 'error': None}
+
+
+def make_backend(api_key: str) -> Any:
+    """Builds the batch backend selected by AI_BATCH_CONFIG['backend'] for `api_key`."""
+    if AI_BATCH_CONFIG['backend'] == 'local':
+        client = ai_client.get_client(api_key)
+        return LocalBatchBackend(
+            lambda prompt: client.generate_text(prompt, generation_config={"response_mime_type": "application/json"})
+        )
+    return ai_client.GeminiBatchBackend(api_key)
+
+
+class BatchRunner:
+    """Submits rewrite backlogs as batch jobs and applies their results."""
+
+    def __init__(
+        self,
+        db: Database,
+        ai_processor: AIProcessor,
+        backend_factory: Callable[[str], Any] = make_backend,
+        max_batch_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            db: Store holding the jobs and the article stages.
+            ai_processor: Builds the prompts, picks the keys and validates results.
+            backend_factory: Returns the batch backend for an API key.
+            max_batch_size: Articles per job (AI_BATCH_CONFIG by default).
+        """
+        self.db = db
+        self.ai_processor = ai_processor
+        self.backend_factory = backend_factory
+        self.max_batch_size = max_batch_size or AI_BATCH_CONFIG['max_batch_size']
+        self._backends: Dict[str, Any] = {}
+
+    def _backend(self, api_key: str) -> Any:
+        backend = self._backends.get(api_key)
+        if backend is None:
+            backend = self._backends[api_key] = self.backend_factory(api_key)
+        return backend
+
+    def submit(self, articles: List[Tuple[int, Dict[str, Any]]]) -> List[str]:
+        """
+        Packs articles into jobs of at most `max_batch_size`.
+
+        Args:
+            articles: `(article_id, rewrite_kwargs)` pairs; the kwargs are the ones
+                AIProcessor.rewrite_content takes.
+
+        Returns:
+            The IDs of the jobs created. Articles of a job that could not be
+            submitted are left as they were.
+        """
+        scheduler = self.ai_processor.key_scheduler
+        job_ids = []
+        for start in range(0, len(articles), self.max_batch_size):
+            chunk = articles[start:start + self.max_batch_size]
+            key_index = scheduler.acquire()
+            if key_index is None:
+                logger.warning("No API key available for a batch submission; leaving the rest of the backlog.")
+                break
+            outcome = OUTCOME_ERROR
+            try:
+                api_key = scheduler.api_key(key_index)
+                prompts = [(str(article_id), self.ai_processor.build_prompt(**kwargs)) for article_id, kwargs in chunk]
+                job_id = self._backend(api_key).submit(
+                    prompts, f"rewrite-{int(time.time())}-{start // self.max_batch_size}",
+                    response_mime_type="application/json",
+                )
+                outcome = OUTCOME_SUCCESS
+                if self.db.save_batch_job(job_id, key_hash(api_key), [article_id for article_id, _ in chunk]):
+                    job_ids.append(job_id)
+                    logger.info(f"Submitted batch job {job_id} with {len(chunk)} articles (key index {key_index}).")
+            except TooManyRequests as e:
+                outcome = OUTCOME_RATE_LIMITED
+                logger.warning(f"Batch submission hit the quota on key index {key_index}: {e}")
+            except Exception as e:
+                logger.error(f"Batch submission failed on key index {key_index}: {e}")
+            finally:
+                scheduler.release(key_index, outcome)
+        return job_ids
+
+    def poll(self) -> int:
+        """
+        Checks every open job once and applies the results of the finished ones.
+
+        Returns:
+            The number of articles that got their REWRITTEN stage.
+        """
+        scheduler = self.ai_processor.key_scheduler
+        key_indexes = {key_hash(scheduler.api_key(i)): i for i in range(len(scheduler))}
+        rewritten = 0
+        for job in self.db.get_open_batch_jobs():
+            job_id = job['job_id']
+            key_index = key_indexes.get(job['key_hash'])
+            if key_index is None:
+                logger.error(f"Batch job {job_id} was created with a key that is no longer configured.")
+                self.db.update_batch_job(job_id, 'FAILED', error='API key removed', finished=True)
+                continue
+            try:
+                status = self._backend(scheduler.api_key(key_index)).poll(job_id)
+            except Exception as e:
+                logger.warning(f"Could not poll batch job {job_id}: {e}")
+                continue
+
+            state = status['state']
+            if state not in FINAL_STATES:
+                if state != job['state']:
+                    self.db.update_batch_job(job_id, state)
+                continue
+
+            if state == 'SUCCEEDED':
+                rewritten += self._apply_results(job, key_index, status)
+            else:
+                logger.warning(f"Batch job {job_id} ended as {state}: {status.get('error')}")
+            self.db.update_batch_job(job_id, state, error=status.get('error'), finished=True)
+        return rewritten
+
+    def _apply_results(self, job: Dict[str, Any], key_index: int, status: Dict[str, Any]) -> int:
+        archive = self.ai_processor.response_archive
+        rewritten = 0
+        for article_id in job['article_ids']:
+            text = status['results'].get(str(article_id))
+            if not text:
+                error = status['errors'].get(str(article_id), 'no result')
+                logger.warning(f"Batch job {job['job_id']} has no result for article DB ID {article_id}: {error}")
+                continue
+            archive_outcome = OUTCOME_ERROR
+            try:
+                data, rejection = self.ai_processor.validate_response(text, key_index, article_id)
+                if rejection is not None:
+                    archive_outcome = 'rejected'
+                    self.db.update_article_status(article_id, 'FAILED', reason=rejection)
+                elif not data.get("titulo_final", "").strip() or not data.get("conteudo_final", "").strip():
+                    logger.warning(f"Batch result for article DB ID {article_id} has an empty title or body.")
+                elif self.db.save_stage_artifact(article_id, 'REWRITTEN', data):
+                    archive_outcome = OUTCOME_SUCCESS
+                    rewritten += 1
+            except AIProcessorError as e:
+                logger.warning(f"Batch result for article DB ID {article_id} is invalid: {e}")
+            finally:
+                if archive:
+                    archive.record(text, article_id, key_index, archive_outcome)
+        logger.info(f"Batch job {job['job_id']}: {rewritten}/{len(job['article_ids'])} articles rewritten.")
+        return rewritten
@@ -1,13 +1,134 @@
 # app/ai_client_gemini.py
 import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
+import requests
+from google.api_core import exceptions as api_exceptions
 
 MODEL = os.getenv("GEMINI_MODEL_ID", "gemini-2.5-flash-lite")
+API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
+
+class GeminiClient:
+    """
+    A model bound to a single API key.
+
+    genai.configure() swaps the key for the whole process, so each key gets its own
+    service client instead. The underlying gRPC channel is thread-safe: one instance
+    can serve concurrent calls, and different keys can be used at the same time.
+    """
+
+    def __init__(self, api_key: str, model_name: str = MODEL):
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        # GenerativeModel falls back to the process-wide client when _client is unset
+        self.model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        resp = self.model.generate_content(prompt, **kwargs)
+        return (resp.text or "").strip()
+
+    def stream_text(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Yields the response text chunk by chunk. Closing the generator early (e.g.
+        after the caller found the output invalid) cancels the server-side stream.
+        """
+        resp = self.model.generate_content(prompt, stream=True, **kwargs)
+        try:
+            for chunk in resp:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            # The SDK keeps the gRPC stream on a private attribute; cancelling a
+            # finished stream is a no-op
+            cancel = getattr(getattr(resp, '_iterator', None), 'cancel', None)
+            if cancel:
+                cancel()
+
+
+class GeminiBatchBackend:
+    """
+    Gemini batch mode over REST (the installed SDK has no batch API).
+
+    A job takes many generateContent requests at once and finishes asynchronously
+    (usually within minutes, at most 24h), at a lower price per token and outside
+    the per-minute quota of the synchronous calls.
+    """
+
+    def __init__(self, api_key: str, model_name: str = MODEL, session: Optional[requests.Session] = None):
+        self.model_name = model_name
+        self.session = session or requests.Session()
+        self.session.headers.update({"x-goog-api-key": api_key, "Content-Type": "application/json"})
+
+    def submit(self, prompts: List[Tuple[str, str]], display_name: str, **generation_config: Any) -> str:
+        """
+        Creates a batch job from `(key, prompt)` pairs.
+
+        Returns:
+            The job name (e.g. 'batches/123'), used to poll it.
+        """
+        body = {"batch": {
+            "display_name": display_name,
+            "input_config": {"requests": {"requests": [
+                {
+                    "request": {
+                        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                        "generation_config": generation_config,
+                    },
+                    "metadata": {"key": key},
+                }
+                for key, prompt in prompts
+            ]}},
+        }}
+        resp = self.session.post(f"{API_BASE}/models/{self.model_name}:batchGenerateContent", json=body, timeout=60)
+        data = self._json(resp)
+        return data.get("name") or data.get("metadata", {}).get("name")
+
+    def poll(self, job_id: str) -> Dict[str, Any]:
+        """
+        Returns the job state ('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED'
+        or 'EXPIRED') and, once finished, the text or error of each request by key.
+        """
+        data = self._json(self.session.get(f"{API_BASE}/{job_id}", timeout=30))
+        metadata = data.get("metadata", {})
+        state = str(metadata.get("state", "PENDING"))
+        for prefix in ("BATCH_STATE_", "JOB_STATE_"):
+            state = state.replace(prefix, "")
+        result: Dict[str, Any] = {"state": state, "results": {}, "errors": {}, "error": None}
+        if data.get("error"):
+            result["error"] = data["error"].get("message")
+
+        output = data.get("response") or metadata.get("output") or {}
+        inlined = output.get("inlinedResponses", {})
+        for item in inlined.get("inlinedResponses", []) if isinstance(inlined, dict) else inlined:
+            key = str(item.get("metadata", {}).get("key"))
+            if item.get("error"):
+                result["errors"][key] = item["error"].get("message", "error")
+                continue
+            candidates = item.get("response", {}).get("candidates") or [{}]
+            parts = candidates[0].get("content", {}).get("parts", [])
+            result["results"][key] = "".join(part.get("text", "") for part in parts).strip()
+        return result
+
+    @staticmethod
+    def _json(resp: requests.Response) -> Dict[str, Any]:
+        if resp.status_code >= 400:
+            # Same exception types as the gRPC client (ResourceExhausted for 429...)
+            raise api_exceptions.from_http_response(resp)
+        return resp.json()
+
+
+_clients: Dict[str, GeminiClient] = {}
+_clients_lock = threading.Lock()
 
-def configure_api(api_key: str):
-    genai.configure(api_key=api_key)
 
-def generate_text(prompt: str, **kwargs) -> str:
-    m = genai.GenerativeModel(MODEL)
-    resp = m.generate_content(prompt, **kwargs)
-    return (resp.text or "").strip()
+def get_client(api_key: str) -> GeminiClient:
+    """Returns the process-wide client for `api_key`, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = GeminiClient(api_key)
+        return client
@@ -2,16 +2,26 @@
 """
 Handles content rewriting using a Generative AI model with API key failover.
 """
+import hashlib
 import json
 import logging
-import random
+import re
 from urllib.parse import urlparse
-import time
-from pathlib import Path 
+from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, ClassVar
 
-from .config import AI_API_KEYS, SCHEDULE_CONFIG
-from .exceptions import AIProcessorError, AllKeysFailedError
+from .config import AI_API_KEYS, AI_STREAM_CONFIG, PROMPT_CONFIG, SCHEDULE_CONFIG
+from .exceptions import AIProcessorError, AllKeysFailedError, StreamValidationError
+from .json_stream import JSONStreamValidator
+from .keys import (
+    KeyScheduler, OUTCOME_ERROR, OUTCOME_INVALID, OUTCOME_RATE_LIMITED,
+    OUTCOME_SUCCESS, OUTCOME_TRANSIENT,
+)
+from .store import Database
+from .rate_limit import RateLimiter, get_rate_limiter
+from .prompt_builder import PromptTemplate, count_tokens, prepare_content
+from .response_archive import ResponseArchive, get_response_archive
+from .rewrite_cache import RewriteCache, content_key, get_rewrite_cache
 from . import ai_client_gemini as ai_client
 
 logger = logging.getLogger(__name__)
@@ -28,39 +38,74 @@ Somente produzir o conteúdo jornalístico reescrito do artigo principal.
 Se algum desses itens aparecer no texto de origem, exclua-os do resultado.
 """
 
+# Placeholders the prompt template may use
+PROMPT_FIELDS = (
+    "titulo_original", "url_original", "content", "domain", "fonte_nome", "categoria",
+    "schema_original", "tag", "tags", "videos_list", "imagens_list",
+)
+
+REQUIRED_KEYS = (
+    "titulo_final", "conteudo_final", "meta_description",
+    "focus_keyphrase", "tags_sugeridas", "yoast_meta",
+)
+REQUIRED_YOAST_KEYS = (
+    "_yoast_wpseo_title", "_yoast_wpseo_metadesc",
+    "_yoast_wpseo_focuskw", "_yoast_news_keywords",
+)
+
+# Pedido de reparo: só os campos que faltaram, com o mínimo de contexto do artigo
+REPAIR_PROMPT = """
+O JSON que você gerou para o artigo abaixo ficou sem estes campos obrigatórios: {fields}.
+Responda SOMENTE com um objeto JSON contendo esses campos (campos "yoast_meta.X" vão
+dentro do objeto "yoast_meta"), coerentes com o artigo. Não repita os demais campos.
+
+Campos já gerados: {context}
+Início do artigo: {body}
+"""
+REPAIR_CONTEXT_CHARS = 1500
+
 
 class AIProcessor:
     """
     Handles content rewriting using a Generative AI model with API key failover.
     """
     _prompt_template: ClassVar[Optional[str]] = None
+    # Hash of the template and model; cached rewrites from another version are not reused
+    _prompt_version: ClassVar[Optional[str]] = None
+    _compiled_prompt: ClassVar[Optional[PromptTemplate]] = None
 
-    def __init__(self):
+    def __init__(
+        self,
+        rate_limiter: Optional[RateLimiter] = None,
+        db: Optional[Database] = None,
+        key_scheduler: Optional[KeyScheduler] = None,
+        rewrite_cache: Optional[RewriteCache] = None,
+        response_archive: Optional[ResponseArchive] = None,
+    ):
         """
         Initializes the AI processor.
-        It uses a single pool of API keys and rotates through them on failure.
+        Keys are handed out by a KeyScheduler, whose cooldowns and stats are kept in
+        `db` when one is given. Each key has its own client and 'gemini:<index>' token
+        bucket, so the processor can be shared by worker threads: concurrent calls
+        run in parallel on different keys. Validated rewrites are kept in
+        `rewrite_cache` (REWRITE_CACHE_CONFIG by default) and raw responses are
+        archived, by article ID, in `response_archive` (RESPONSE_ARCHIVE_CONFIG).
         """
         self.api_keys: List[str] = AI_API_KEYS
         if not self.api_keys:
             raise AIProcessorError("No GEMINI_ API keys found in the environment. Please set at least one GEMINI_... key.")
 
         logger.info(f"AI Processor initialized with {len(self.api_keys)} API key(s).")
-        self.current_key_index = 0
-
-    def _failover_to_next_key(self):
-        """Switches to the next available API key and returns True if successful."""
-        self.current_key_index += 1
-        if self.current_key_index >= len(self.api_keys):
-            self.current_key_index = 0 # Reset for next cycle
-            logger.critical("All API keys have been exhausted. Resetting to first key.")
-            return False
-        logger.warning(f"Failing over to next API key index: {self.current_key_index}.")
-        return True
+        self.key_scheduler = key_scheduler or KeyScheduler(self.api_keys, db=db)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.rewrite_cache = rewrite_cache if rewrite_cache is not None else get_rewrite_cache()
+        self.response_archive = response_archive if response_archive is not None else get_response_archive()
 
     @classmethod
     def _load_prompt_template(cls) -> str:
-        """Loads the universal prompt from 'universal_prompt.txt'."""
-        if cls._prompt_template is None:
+        """Loads the universal prompt from 'universal_prompt.txt' and compiles it once."""
+        # _compiled_prompt is assigned last, so a worker thread never sees it half set up
+        if cls._compiled_prompt is None:
             try:
                 prompt_path = Path('universal_prompt.txt')
                 if not prompt_path.exists():
@@ -68,28 +113,18 @@ class AIProcessor:
 
                 with open(prompt_path, 'r', encoding='utf-8') as f:
                     base_template = f.read()
-                cls._prompt_template = f"{AI_SYSTEM_RULES}\n\n{base_template}"
+                template = f"{AI_SYSTEM_RULES}\n\n{base_template}"
+                cls._prompt_template = template
+                cls._prompt_version = hashlib.sha256(
+                    f"{ai_client.MODEL}\n{template}".encode('utf-8')
+                ).hexdigest()[:16]
+                cls._compiled_prompt = PromptTemplate(template, PROMPT_FIELDS)
             except FileNotFoundError:
                 logger.critical("'universal_prompt.txt' not found in the project root.")
                 raise AIProcessorError("Prompt template file not found.")
         return cls._prompt_template
 
-    @staticmethod
-    def _safe_format_prompt(template: str, fields: Dict[str, Any]) -> str:
-        """
-        Safely formats a string template that may contain literal curly braces.
-        """
-        class _SafeDict(dict):
-            def __missing__(self, key: str) -> str:
-                return ""
-
-        s = template.replace('{', '{{').replace('}', '}}')
-        for key in fields:
-            s = s.replace('{{' + key + '}}', '{' + key + '}')
-        
-        return s.format_map(_SafeDict(fields))
-
-    def rewrite_content(
+    def build_prompt(
         self,
         title: Optional[str] = None,
         content_html: Optional[str] = None,
@@ -101,17 +136,27 @@ class AIProcessor:
         fonte_nome: Optional[str] = None,
         source_name: Optional[str] = None,
         **kwargs: Any,
-    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
-        """
-        Rewrites the given article content using the AI model with a robust retry
-        and failover mechanism.
-        """
-        from google.api_core.exceptions import ResourceExhausted
-
-        MAX_RETRIES = 4
-        INITIAL_BACKOFF = 4  # seconds
+    ) -> str:
+        """Renders the rewrite prompt for an article (same arguments as rewrite_content)."""
+        return self._render_prompt(self._prompt_fields(
+            title, content_html, source_url, category, videos, images, tags, fonte_nome, source_name, **kwargs
+        ))
 
-        prompt_template = self._load_prompt_template()
+    def _prompt_fields(
+        self,
+        title: Optional[str] = None,
+        content_html: Optional[str] = None,
+        source_url: Optional[str] = None,
+        category: Optional[str] = None,
+        videos: Optional[List[Dict[str, str]]] = None,
+        images: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        fonte_nome: Optional[str] = None,
+        source_name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Dict[str, str]:
+        """Values for the prompt template's placeholders."""
+        self._load_prompt_template()
 
         # Prepare prompt fields
         videos = videos or []
@@ -127,7 +172,9 @@ class AIProcessor:
         fields = {
             "titulo_original": title or "",
             "url_original": source_url or "",
-            "content": content_html or "",
+            "content": prepare_content(
+                content_html or "", PROMPT_CONFIG['max_content_tokens'], PROMPT_CONFIG['lead_blocks']
+            ),
             "domain": kwargs.get("domain", ""),
             "fonte_nome": fonte,
             "categoria": category or "",
@@ -137,68 +184,249 @@ class AIProcessor:
             "videos_list": "\n".join([v.get("embed_url", "") for v in videos if isinstance(v, dict) and v.get("embed_url")]) or "Nenhum",
             "imagens_list": "\n".join(images) if images else "Nenhuma",
         }
-        prompt = self._safe_format_prompt(prompt_template, fields)
+        return fields
+
+    def _render_prompt(self, fields: Dict[str, str]) -> str:
+        prompt = self._compiled_prompt.render(fields)
+        logger.debug(f"Prompt built: ~{count_tokens(prompt)} tokens.")
+        return prompt
+
+    def rewrite_content(
+        self,
+        title: Optional[str] = None,
+        content_html: Optional[str] = None,
+        source_url: Optional[str] = None,
+        category: Optional[str] = None,
+        videos: Optional[List[Dict[str, str]]] = None,
+        images: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        fonte_nome: Optional[str] = None,
+        source_name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Rewrites the given article content using the AI model, failing over to the
+        next key picked by the scheduler on any error.
+
+        Raises:
+            AllKeysFailedError: if every key failed with a quota/timeout/5xx error or
+                all keys are cooling down, so the caller can defer the article
+                instead of dropping it.
+        """
+        from google.api_core.exceptions import (
+            DeadlineExceeded, InternalServerError, PermissionDenied, ResourceExhausted,
+            ServiceUnavailable, Unauthenticated,
+        )
+
+        fields = self._prompt_fields(
+            title, content_html, source_url, category, videos, images, tags, fonte_nome, source_name, **kwargs
+        )
+
+        cache_key = None
+        if self.rewrite_cache:
+            # Source, category, tags and media lists shape the output too, so they are part of the key
+            context = {k: v for k, v in fields.items() if k not in ('titulo_original', 'content')}
+            cache_key = content_key(title, content_html, self._prompt_version, context)
+            cached = self.rewrite_cache.get(cache_key)
+            if cached:
+                logger.info(f"Rewrite cache hit for '{title}' ({cache_key[:12]}); skipping AI call.")
+                return cached, None
+
+        prompt = self._render_prompt(fields)
 
         last_error = "Unknown error"
-        
-        # Loop through each API key, allowing retries on each
-        for _ in range(len(self.api_keys)):
-            api_key = self.api_keys[self.current_key_index]
-            ai_client.configure_api(api_key)
-            
-            retries = 0
-            while retries < MAX_RETRIES:
-                try:
-                    logger.info(f"Sending content to AI. Key index: {self.current_key_index}, Attempt: {retries + 1}/{MAX_RETRIES}")
-                    
-                    generation_config = {"response_mime_type": "application/json"}
-                    response_text = ai_client.generate_text(prompt, generation_config=generation_config)
-                    
-                    parsed_data = self._parse_response(response_text)
-
-                    if not parsed_data:
-                        raise AIProcessorError("Failed to parse or validate AI response.")
-
-                    if "erro" in parsed_data:
-                        logger.warning(f"AI returned a handled error: {parsed_data['erro']}")
-                        return None, parsed_data["erro"]
-
-                    # SUCCESS: Do not failover, just return the data
-                    logger.info(f"Successfully processed content with key index: {self.current_key_index}.")
-                    return parsed_data, None
-
-                except ResourceExhausted as e:
-                    last_error = str(e)
-                    retries += 1
-                    if retries >= MAX_RETRIES:
-                        logger.warning(f"Rate limit exhausted for key index {self.current_key_index} after {MAX_RETRIES} retries. Failing over.")
-                        break  # Break inner loop to failover to the next key
-
-                    # Exponential backoff with jitter
-                    wait_time = INITIAL_BACKOFF * (2 ** (retries - 1)) + random.uniform(0, 1)
-                    logger.warning(f"Rate limit hit (429). Waiting for {wait_time:.2f}s before retry {retries}/{MAX_RETRIES}.")
-                    time.sleep(wait_time)
-
-                except Exception as e:
-                    last_error = str(e)
-                    logger.error(f"An unexpected error occurred with key index {self.current_key_index}: {last_error}")
-                    # For non-rate-limit errors, fail over immediately
-                    break 
-
-            # If we exit the while loop, it means all retries for the current key failed.
-            # Time to try the next key.
-            if not self._failover_to_next_key():
-                break  # All keys have been tried and failed
-
-        final_reason = f"All available API keys failed after retries. Last error: {last_error}"
+        last_error_transient = False
+        tried: List[int] = []
+
+        # Each attempt goes to the best key not tried yet for this article; a key that
+        # hits its quota is put in cooldown by the scheduler instead of being waited on.
+        article_id = kwargs.get("article_id")
+        while True:
+            key_index = self.key_scheduler.acquire(exclude=tried)
+            if key_index is None:
+                break
+            tried.append(key_index)
+            outcome = OUTCOME_ERROR
+            response_text, archive_outcome = None, OUTCOME_ERROR
+            try:
+                client = ai_client.get_client(self.key_scheduler.api_key(key_index))
+                logger.info(f"Sending content to AI. Key index: {key_index}, Attempt: {len(tried)}/{len(self.key_scheduler)}")
+
+                self.rate_limiter.acquire(f"gemini:{key_index}")
+                generation_config = {"response_mime_type": "application/json"}
+                if AI_STREAM_CONFIG['enabled']:
+                    response_text = self._generate_streaming(client, prompt, generation_config)
+                else:
+                    response_text = client.generate_text(prompt, generation_config=generation_config)
+
+                parsed_data, rejection = self.validate_response(response_text, key_index, article_id)
+                if rejection is not None:
+                    outcome, archive_outcome = OUTCOME_SUCCESS, "rejected"
+                    return None, rejection
+                outcome = archive_outcome = OUTCOME_SUCCESS
+
+                logger.info(f"Successfully processed content with key index: {key_index}.")
+                if cache_key:
+                    self.rewrite_cache.put(cache_key, parsed_data)
+                return parsed_data, None
+
+            except ResourceExhausted as e:
+                last_error = str(e)
+                last_error_transient = True
+                outcome = OUTCOME_RATE_LIMITED
+                logger.warning(f"Rate limit hit (429) on key index {key_index}. Failing over.")
+
+            except (DeadlineExceeded, ServiceUnavailable, InternalServerError) as e:
+                last_error = str(e)
+                last_error_transient = True
+                outcome = OUTCOME_TRANSIENT
+                logger.warning(f"Transient AI error with key index {key_index}: {last_error}")
+
+            except (PermissionDenied, Unauthenticated) as e:
+                # Can be temporary (API disabled, model access); the key cools down for hours
+                last_error = str(e)
+                last_error_transient = True
+                outcome = OUTCOME_INVALID
+                logger.error(f"Key index {key_index} was rejected: {last_error}")
+
+            except StreamValidationError as e:
+                last_error = str(e)
+                last_error_transient = False
+                response_text, archive_outcome = e.partial_text, "aborted"
+                logger.warning(f"Aborted streamed response from key index {key_index}: {last_error}")
+
+            except Exception as e:
+                last_error = str(e)
+                last_error_transient = False
+                logger.error(f"An unexpected error occurred with key index {key_index}: {last_error}")
+
+            finally:
+                self.key_scheduler.release(key_index, outcome)
+                if response_text is not None and self.response_archive:
+                    self.response_archive.record(response_text, article_id, key_index, archive_outcome)
+
+        if not tried:
+            # Every key is cooling down: defer the article rather than sleep here
+            wait = self.key_scheduler.next_available_in()
+            final_reason = (
+                "No API keys configured." if wait is None
+                else f"All API keys are cooling down (next one free in {wait:.0f}s)."
+            )
+            logger.warning(final_reason)
+            if wait is None:
+                return None, final_reason
+            raise AllKeysFailedError(final_reason)
+
+        final_reason = f"All available API keys failed. Last error: {last_error}"
         logger.critical(final_reason)
+        if last_error_transient:
+            raise AllKeysFailedError(final_reason)
         return None, final_reason
 
-    @staticmethod
-    def _parse_response(text: str) -> Optional[Dict[str, Any]]:
+    def validate_response(
+        self, response_text: str, key_index: int, article_id: Optional[int] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Parses and validates a raw model response, asking the same key for any missing
+        fields (AI_STREAM_CONFIG['repair_missing_fields']).
+
+        Returns:
+            (data, None) for a valid rewrite, or (None, reason) when the model declined
+            the article with an 'erro' object.
+
+        Raises:
+            AIProcessorError: if the response is not valid JSON or still lacks fields.
+        """
+        parsed_data = self._parse_json(response_text)
+        if not parsed_data:
+            raise AIProcessorError("Failed to parse or validate AI response.")
+
+        if "erro" in parsed_data:
+            logger.warning(f"AI returned a handled error: {parsed_data['erro']}")
+            return None, parsed_data["erro"]
+
+        missing = self._missing_fields(parsed_data)
+        if missing and AI_STREAM_CONFIG['repair_missing_fields']:
+            client = ai_client.get_client(self.key_scheduler.api_key(key_index))
+            parsed_data = self._repair_missing_fields(client, key_index, parsed_data, missing, article_id)
+            missing = self._missing_fields(parsed_data)
+        if missing:
+            raise AIProcessorError(f"AI response is missing required keys: {', '.join(missing)}")
+        return parsed_data, None
+
+    def _generate_streaming(self, client: Any, prompt: str, generation_config: Dict[str, Any]) -> str:
+        """
+        Streams the response through a JSONStreamValidator and stops reading as soon
+        as the object is complete, the model rejects the task, or the output can no
+        longer be valid JSON.
+
+        Raises:
+            StreamValidationError: on a structural violation or a truncated object.
         """
-        Parses the JSON response from the AI and validates its structure.
+        validator = JSONStreamValidator()
+        received: List[str] = []
+        stream = client.stream_text(prompt, generation_config=generation_config)
+        try:
+            for chunk in stream:
+                received.append(chunk)
+                if not validator.feed(chunk):
+                    break
+        except StreamValidationError as e:
+            e.partial_text = "".join(received)
+            raise
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+        if validator.rejection is not None:
+            return json.dumps({"erro": validator.rejection}, ensure_ascii=False)
+        if not validator.complete:
+            raise StreamValidationError("Stream ended before the JSON object was complete.", "".join(received))
+        return validator.text
+
+    def _repair_missing_fields(
+        self, client: Any, key_index: int, data: Dict[str, Any], missing: List[str],
+        article_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Asks the model for the missing fields only, instead of regenerating the article.
+
+        Returns:
+            `data` with whatever fields the repair supplied merged in.
         """
+        logger.warning(f"AI response is missing {', '.join(missing)}; requesting only those fields.")
+        context = {k: data[k] for k in ("titulo_final", "meta_description", "focus_keyphrase") if data.get(k)}
+        body = re.sub(r"<[^>]+>", " ", str(data.get("conteudo_final", "")))
+        prompt = REPAIR_PROMPT.format(
+            fields=", ".join(missing),
+            context=json.dumps(context, ensure_ascii=False),
+            body=" ".join(body.split())[:REPAIR_CONTEXT_CHARS],
+        )
+        self.rate_limiter.acquire(f"gemini:{key_index}")
+        response_text = client.generate_text(prompt, generation_config={"response_mime_type": "application/json"})
+        if self.response_archive:
+            self.response_archive.record(response_text, article_id, key_index, "repair")
+        patch = self._parse_json(response_text)
+        if not patch:
+            return data
+
+        merged = dict(data)
+        for field in missing:
+            parent, _, child = field.partition(".")
+            if not child:
+                if field in patch:
+                    merged[field] = patch[field]
+                continue
+            nested = patch.get(parent) if isinstance(patch.get(parent), dict) else {}
+            value = nested.get(child, patch.get(child))
+            if value is not None:
+                current = merged.get(parent) if isinstance(merged.get(parent), dict) else {}
+                merged[parent] = {**current, child: value}
+        return merged
+
+    @staticmethod
+    def _parse_json(text: str) -> Optional[Dict[str, Any]]:
+        """Parses the JSON object in an AI response (code fences allowed)."""
         try:
             clean_text = text.strip()
             if clean_text.startswith("```json"):
@@ -206,50 +434,7 @@ class AIProcessor:
             elif clean_text.startswith("```"):
                 clean_text = clean_text[3:-3].strip()
 
-            # Debug: Save raw response to a file
-            debug_dir = Path("debug")
-            debug_dir.mkdir(exist_ok=True)
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            with open(debug_dir / f"ai_response_{timestamp}.json", "w", encoding="utf-8") as f:
-                f.write(clean_text)
-
             data = json.loads(clean_text)
-
-            if not isinstance(data, dict):
-                logger.error(f"AI response is not a dictionary. Received type: {type(data)}")
-                return None
-
-            if "erro" in data:
-                logger.warning(f"AI returned a rejection error: {data['erro']}")
-                return data
-
-            required_keys = [
-                "titulo_final", "conteudo_final", "meta_description",
-                "focus_keyphrase", "tags_sugeridas", "yoast_meta"
-            ]
-            missing_keys = [key for key in required_keys if key not in data]
-
-            if missing_keys:
-                logger.error(f"AI response is missing required keys: {', '.join(missing_keys)}")
-                logger.debug(f"Received data: {data}")
-                return None
-
-            if 'yoast_meta' in data and isinstance(data['yoast_meta'], dict):
-                required_yoast_keys = [
-                    "_yoast_wpseo_title", "_yoast_wpseo_metadesc",
-                    "_yoast_wpseo_focuskw", "_yoast_news_keywords"
-                ]
-                missing_yoast_keys = [key for key in required_yoast_keys if key not in data['yoast_meta']]
-                if missing_yoast_keys:
-                    logger.error(f"AI response 'yoast_meta' is missing keys: {', '.join(missing_yoast_keys)}")
-                    return None
-            else:
-                logger.error("AI response is missing 'yoast_meta' object or it's not a dictionary.")
-                return None
-
-            logger.info("Successfully parsed and validated AI response.")
-            return data
-
         except json.JSONDecodeError as e:
             logger.error(f"Error decoding JSON from AI response: {e}")
             logger.debug(f"Received text: {text[:500]}...")
@@ -258,3 +443,22 @@ class AIProcessor:
             logger.error(f"An unexpected error occurred while parsing AI response: {e}")
             logger.debug(f"Received text: {text[:500]}...")
             return None
+
+        if not isinstance(data, dict):
+            logger.error(f"AI response is not a dictionary. Received type: {type(data)}")
+            return None
+        return data
+
+    @staticmethod
+    def _missing_fields(data: Dict[str, Any]) -> List[str]:
+        """
+        Lists the required fields absent from a parsed response; keys of yoast_meta are
+        reported as 'yoast_meta.<key>'.
+        """
+        missing = [key for key in REQUIRED_KEYS if key not in data]
+        yoast = data.get("yoast_meta")
+        if "yoast_meta" in data and not isinstance(yoast, dict):
+            missing.append("yoast_meta")
+        elif isinstance(yoast, dict):
+            missing.extend(f"yoast_meta.{key}" for key in REQUIRED_YOAST_KEYS if key not in yoast)
+        return missing
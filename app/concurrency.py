@@ -0,0 +1,58 @@
+"""
+Named concurrency limits shared by the pipeline workers.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """
+    Keeps one bounded semaphore per named resource (an API or a source host),
+    so each pipeline stage only waits for the resource it actually uses.
+    """
+
+    def __init__(self, limits: Dict[str, int], per_host_limit: int = 2):
+        """
+        Initializes the limiter.
+
+        Args:
+            limits: Maximum simultaneous holders for each named resource (e.g. {'gemini': 1}).
+            per_host_limit: Limit applied to every 'host:<netloc>' resource created on demand.
+        """
+        self._limits = {name: max(1, int(value)) for name, value in limits.items()}
+        self._per_host_limit = max(1, int(per_host_limit))
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, name: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(name)
+            if sem is None:
+                if name.startswith('host:'):
+                    size = self._per_host_limit
+                else:
+                    size = self._limits.get(name, 1)
+                sem = threading.BoundedSemaphore(size)
+                self._semaphores[name] = sem
+            return sem
+
+    @contextmanager
+    def limit(self, name: str) -> Iterator[None]:
+        """Blocks until a slot for `name` is free and holds it for the duration of the block."""
+        sem = self._get_semaphore(name)
+        sem.acquire()
+        try:
+            yield
+        finally:
+            sem.release()
+
+    def limit_host(self, url: Optional[str]):
+        """Shortcut for `limit('host:<netloc>')` derived from a URL."""
+        host = (urlparse(url or '').netloc or 'unknown').lower()
+        return self.limit(f"host:{host}")
@@ -147,6 +147,32 @@ PROMPT_FILE_PATH = os.path.join(
 
 AI_MODEL = os.getenv('AI_MODEL', 'gemini-2.5-flash-lite')
 
+# Orçamento do corpo do artigo no prompt (tokens estimados localmente). Acima disso
+# ficam o lead (lead_blocks primeiros blocos) e os parágrafos com mais números/valores.
+PROMPT_CONFIG = {
+    'max_content_tokens': int(os.getenv('PROMPT_MAX_CONTENT_TOKENS', 3000)),
+    'lead_blocks': int(os.getenv('PROMPT_LEAD_BLOCKS', 3)),
+}
+
+# Streaming: o JSON é validado enquanto chega e a geração é abortada cedo se sair do
+# formato. repair_missing_fields pede só os campos faltantes em vez de gerar tudo de novo.
+AI_STREAM_CONFIG = {
+    'enabled': os.getenv('AI_STREAMING', 'true').lower() in ('1', 'true', 'yes'),
+    'repair_missing_fields': os.getenv('AI_REPAIR_MISSING_FIELDS', 'true').lower() in ('1', 'true', 'yes'),
+}
+
+# Modo backlog: com muitos artigos EXTRACTED esperando reescrita (queda da API, chaves em
+# cooldown), eles são enviados juntos como jobs batch do Gemini (mais baratos e fora da
+# cota por minuto) e o resultado é consultado a cada ciclo. backend 'local' roda os jobs
+# no próprio processo, com chamadas síncronas (desenvolvimento e testes offline).
+AI_BATCH_CONFIG = {
+    'enabled': os.getenv('AI_BATCH_MODE', 'false').lower() in ('1', 'true', 'yes'),
+    'backend': os.getenv('AI_BATCH_BACKEND', 'gemini'),
+    'backlog_threshold': int(os.getenv('AI_BATCH_BACKLOG_THRESHOLD', 20)),
+    'max_batch_size': int(os.getenv('AI_BATCH_MAX_SIZE', 100)),
+    'max_jobs_per_cycle': int(os.getenv('AI_BATCH_MAX_JOBS_PER_CYCLE', 2)),
+}
+
 AI_GENERATION_CONFIG = {
     'temperature': 0.7,
     'top_p': 1.0,
@@ -190,8 +216,128 @@ SCHEDULE_CONFIG = {
     'check_interval_minutes': int(os.getenv('CHECK_INTERVAL_MINUTES', 15)),
     'max_articles_per_feed': int(os.getenv('MAX_ARTICLES_PER_FEED', 3)),
     'per_article_delay_seconds': int(os.getenv('PER_ARTICLE_DELAY_SECONDS', 8)),
-    'per_feed_delay_seconds': int(os.getenv('PER_FEED_DELAY_SECONDS', 15)),
     'cleanup_after_hours': int(os.getenv('CLEANUP_AFTER_HOURS', 72)),
+    'new_article_max_age_hours': int(os.getenv('NEW_ARTICLE_MAX_AGE_HOURS', 24)),
+}
+
+# --- Retentativas de falhas transitórias (429, timeouts, 5xx) ---
+# O atraso dobra a cada falha: base, 2*base, 4*base... limitado a max_delay_seconds.
+RETRY_CONFIG = {
+    'base_delay_seconds': int(os.getenv('RETRY_BASE_DELAY_SECONDS', 300)),
+    'max_delay_seconds': int(os.getenv('RETRY_MAX_DELAY_SECONDS', 6 * 3600)),
+    'max_attempts': int(os.getenv('RETRY_MAX_ATTEMPTS', 5)),
+}
+
+# --- Escalonamento das chaves Gemini ---
+# Uma chave que recebe 429 fica em cooldown (base, 2*base, 4*base... até max) e a
+# requisição passa na hora para outra chave. Estado salvo na tabela api_key_status.
+GEMINI_KEY_CONFIG = {
+    'base_cooldown_seconds': int(os.getenv('GEMINI_KEY_COOLDOWN_SECONDS', 60)),
+    'max_cooldown_seconds': int(os.getenv('GEMINI_KEY_MAX_COOLDOWN_SECONDS', 3600)),
+    'transient_cooldown_seconds': int(os.getenv('GEMINI_KEY_TRANSIENT_COOLDOWN_SECONDS', 15)),
+    # Chave rejeitada (PermissionDenied/Unauthenticated): volta a ser tentada depois disso
+    'invalid_cooldown_seconds': int(os.getenv('GEMINI_KEY_INVALID_COOLDOWN_HOURS', 6)) * 3600,
+    # Requisições simultâneas por chave; com N chaves, até N reescritas em paralelo
+    'max_in_flight_per_key': int(os.getenv('GEMINI_MAX_IN_FLIGHT_PER_KEY', 1)),
+}
+
+# --- Concorrência do pipeline ---
+# max_workers <= 1 mantém o modo sequencial (um artigo por vez).
+# discovery_workers: quantos feeds são lidos ao mesmo tempo na fase de descoberta.
+# gemini: reescritas simultâneas; por padrão uma por chave GEMINI_* configurada.
+CONCURRENCY_CONFIG = {
+    'max_workers': int(os.getenv('PIPELINE_MAX_WORKERS', 4)),
+    'discovery_workers': int(os.getenv('DISCOVERY_MAX_WORKERS', 8)),
+    'per_host': int(os.getenv('PER_HOST_CONCURRENCY', 2)),
+    'gemini': int(os.getenv('GEMINI_CONCURRENCY', max(1, len(AI_API_KEYS)))),
+    'wordpress': int(os.getenv('WORDPRESS_CONCURRENCY', 2)),
+}
+
+# --- Rate limits (token buckets) ---
+# Cada grupo vale por recurso: uma chave Gemini, um endpoint do WordPress, um host de origem.
+# Por padrão cada chave Gemini faz uma chamada a cada PER_ARTICLE_DELAY_SECONDS.
+RATE_LIMITS = {
+    'gemini': {
+        'per_minute': float(os.getenv(
+            'GEMINI_RPM_PER_KEY',
+            60 / max(1, SCHEDULE_CONFIG['per_article_delay_seconds'])
+        )),
+        'burst': int(os.getenv('GEMINI_BURST', 1)),
+    },
+    'wordpress': {
+        'per_minute': float(os.getenv('WORDPRESS_RPM', 60)),
+        'burst': int(os.getenv('WORDPRESS_BURST', 5)),
+    },
+    'host': {
+        'per_minute': float(os.getenv('SOURCE_HOST_RPM', 30)),
+        'burst': int(os.getenv('SOURCE_HOST_BURST', 3)),
+    },
+}
+
+# --- Cache HTTP das páginas de artigos ---
+# fresh_seconds: dentro desse intervalo a cópia é usada sem ir à rede.
+# Depois disso é revalidada com If-None-Match/If-Modified-Since.
+# ttl_seconds e max_bytes controlam a remoção de entradas antigas.
+# offline=true só lê do cache (útil para reprocessar extrações sem rede).
+HTTP_CACHE_CONFIG = {
+    'enabled': os.getenv('HTTP_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'directory': os.getenv('HTTP_CACHE_DIR', 'data/http_cache'),
+    'fresh_seconds': int(os.getenv('HTTP_CACHE_FRESH_SECONDS', 600)),
+    'ttl_seconds': int(os.getenv('HTTP_CACHE_TTL_SECONDS', SCHEDULE_CONFIG['cleanup_after_hours'] * 3600)),
+    'max_bytes': int(os.getenv('HTTP_CACHE_MAX_MB', 256)) * 1024 * 1024,
+    'offline': os.getenv('HTTP_CACHE_OFFLINE', 'false').lower() in ('1', 'true', 'yes'),
+}
+
+# --- Cache das reescritas da IA ---
+# Chave: hash do título e do texto normalizados + versão do prompt (hash do template e
+# do modelo) + os demais campos do prompt (fonte, categoria, tags, vídeos, imagens).
+# Um retry, ou a mesma matéria com o mesmo contexto, não gasta nova geração.
+REWRITE_CACHE_CONFIG = {
+    'enabled': os.getenv('REWRITE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'path': os.getenv('REWRITE_CACHE_PATH', 'data/rewrite_cache.db'),
+    'ttl_seconds': int(os.getenv('REWRITE_CACHE_TTL_HOURS', 7 * 24)) * 3600,
+    'max_bytes': int(os.getenv('REWRITE_CACHE_MAX_MB', 64)) * 1024 * 1024,
+}
+
+# --- Arquivo de respostas da IA ---
+# Respostas brutas vão para segmentos gzip em data/responses (gravados por uma thread
+# própria), indexados por artigo. Respostas válidas podem ser amostradas; falhas sempre
+# são guardadas. Segmentos antigos saem por idade ou quando o total passa do limite.
+RESPONSE_ARCHIVE_CONFIG = {
+    'enabled': os.getenv('RESPONSE_ARCHIVE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'path': os.getenv('RESPONSE_ARCHIVE_PATH', 'data/responses'),
+    'segment_max_bytes': int(os.getenv('RESPONSE_ARCHIVE_SEGMENT_MB', 8)) * 1024 * 1024,
+    'max_total_bytes': int(os.getenv('RESPONSE_ARCHIVE_MAX_MB', 256)) * 1024 * 1024,
+    'retention_seconds': int(os.getenv('RESPONSE_ARCHIVE_RETENTION_DAYS', 14)) * 24 * 3600,
+    'sample_rate': float(os.getenv('RESPONSE_ARCHIVE_SAMPLE_RATE', 1.0)),
+    'queue_size': int(os.getenv('RESPONSE_ARCHIVE_QUEUE_SIZE', 1000)),
+}
+
+# --- Detecção de matérias quase duplicadas ---
+# SimHash do texto extraído; a mesma notícia já processada (de qualquer fonte) dentro de
+# window_hours, a até max_distance bits de distância (máximo 3), é marcada DUPLICATE.
+# Se a original terminar FAILED, suas duplicatas voltam para a fila.
+# min_words: textos mais curtos não são comparados.
+DEDUP_CONFIG = {
+    'enabled': os.getenv('DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'max_distance': int(os.getenv('DEDUP_MAX_DISTANCE', 3)),
+    'window_hours': int(os.getenv('DEDUP_WINDOW_HOURS', 48)),
+    'min_words': int(os.getenv('DEDUP_MIN_WORDS', 50)),
+}
+
+# --- Mapa de links internos ---
+# build_link_map.py faz a carga completa; depois, só os posts modificados desde a última
+# carga são buscados (modified_after), com páginas em paralelo e nomes de tags em cache.
+# refresh_each_cycle: atualiza o mapa de forma incremental no início de cada ciclo.
+# live_updates: cada post publicado pelo pipeline vira alvo de links na hora, só em
+# memória (título + até max_keywords - 1 tags, substituindo o mesmo ID/link); os
+# arquivos são regravados uma vez no fim do ciclo, com o mapa limitado a max_posts.
+LINK_MAP_CONFIG = {
+    'max_posts': int(os.getenv('LINK_MAP_MAX_POSTS', 1000)),
+    'max_keywords': int(os.getenv('LINK_MAP_MAX_KEYWORDS', 11)),
+    'live_updates': os.getenv('LINK_MAP_LIVE_UPDATES', 'true').lower() in ('1', 'true', 'yes'),
+    'page_workers': int(os.getenv('LINK_MAP_PAGE_WORKERS', 4)),
+    'refresh_each_cycle': os.getenv('LINK_MAP_REFRESH_EACH_CYCLE', 'true').lower() in ('1', 'true', 'yes'),
 }
 
 PIPELINE_CONFIG = {
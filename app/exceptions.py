@@ -3,6 +3,15 @@
 Custom exception classes for the RSS-to-WordPress automation app.
 """
 
+class TransientError(Exception):
+    """
+    Raised for failures that are expected to go away on their own, such as
+    rate limits (HTTP 429), timeouts, connection errors or server-side 5xx
+    responses. Articles failing this way are deferred and retried later.
+    """
+    pass
+
+
 class AIProcessorError(Exception):
     """
     Custom exception for errors related to the AI content processor.
@@ -12,14 +21,25 @@ class AIProcessorError(Exception):
     pass
 
 
-class AllKeysFailedError(AIProcessorError):
+class AllKeysFailedError(AIProcessorError, TransientError):
     """
-    Raised when all available API keys for a specific category have been tried
-    and have failed, preventing further AI processing for that category.
+    Raised when all available API keys have been tried and have failed because
+    of quota exhaustion or timeouts, preventing further AI processing until a
+    key recovers.
     """
     pass
 
 
+class StreamValidationError(AIProcessorError):
+    """
+    Raised while a streamed AI response is still arriving, as soon as it can no
+    longer be a valid JSON object (see JSONStreamValidator).
+    """
+    def __init__(self, message: str, partial_text: str = ''):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
 class WordPressPublisherError(Exception):
     """Custom exception for errors related to publishing content to WordPress."""
     pass
@@ -1,6 +1,7 @@
 import logging
 import trafilatura
 from bs4 import BeautifulSoup
+import lxml.html
 import requests
 import html # New import for html.unescape
 from typing import Dict, Optional, Any, Set, List, Tuple, Union
@@ -10,6 +11,10 @@ import os
 from urllib.parse import urljoin, urlparse, parse_qs
 
 from .config import USER_AGENT
+from .exceptions import TransientError
+from .http_cache import HttpCache, get_http_cache
+from .precleaner import get_precleaner
+from .rate_limit import RateLimiter, get_rate_limiter
 from trafilatura.metadata import extract_metadata as trafilatura_extract_metadata # New import
 
 logger = logging.getLogger(__name__)
@@ -275,7 +280,14 @@ def _find_article_body(soup: BeautifulSoup) -> BeautifulSoup:
             best, best_score = c, score
     return best or soup
 
-def collect_images_from_article(soup: BeautifulSoup, base_url: str) -> list[str]:
+def parse_html(html: str) -> BeautifulSoup:
+    """
+    Parses a page once with the lxml builder. The resulting soup is meant to be shared
+    by the domain cleaners and every extraction step (see ContentExtractor.extract).
+    """
+    return BeautifulSoup(html or "", 'lxml')
+
+def collect_images_from_article(soup: BeautifulSoup, base_url: str, root: Optional[BeautifulSoup] = None) -> list[str]:
     """
     Coleta URLs de imagens relevantes SOMENTE DO CORPO DO ARTIGO.
     Fontes consideradas:
@@ -285,8 +297,10 @@ def collect_images_from_article(soup: BeautifulSoup, base_url: str) -> list[str]
       - estilos inline: background-image
       - <figure> contendo <img>
     Aplica filtros de junk/thumb e prioriza CDNs conhecidas.
+    `root` evita recalcular o corpo do artigo quando o chamador já o localizou.
     """
-    root = _find_article_body(soup)
+    if root is None:
+        root = _find_article_body(soup)
     urls: list[str] = []
 
     def _push(candidate: Optional[str]) -> None:
@@ -514,121 +528,79 @@ def _find_news_article_in_json_ld(json_ld_data: List[Dict[str, Any]]) -> Optiona
                 return item
     return None
 
-# --- New constants for related content removal ---
-LEIA_HEADING_RE = re.compile(r"(leia também|veja também|relacionad[oa]s|recomendad[oa]s|tópicos relacionados)", re.I)
-
-# Site-specific rules for related content
-SITE_SPECIFIC_RELATED_SELECTORS = {
-    "infomoney.com.br": [
-        ".single__related", ".article__related", ".post-related", ".related-posts",
-        ".rm-related", ".block-related", ".single__sidebar", ".article__sidebar",
-        "section.single__see-also", ".wp-block-infomoney-blocks-infomoney-read-more",
-    ],
-    "estadao.com.br": [
-        ".links-relacionados", ".mat-relacionadas", ".es-relacionadas",
-        ".stories-related", ".see-also", ".link-relacionado", ".box-relacionadas",
-    ],
-}
-
-
 class ContentExtractor:
     """Extrai e limpa conteúdo para o pipeline."""
-    def __init__(self):
+    def __init__(self, rate_limiter: Optional[RateLimiter] = None, http_cache: Optional[HttpCache] = None):
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': USER_AGENT})
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.http_cache = http_cache if http_cache is not None else get_http_cache()
 
     def _fetch_html(self, url: str) -> Optional[str]:
+        """
+        Downloads the article page, going through the HTTP cache when it is enabled.
+
+        A fresh cached copy is returned without touching the network; an older one is
+        revalidated with a conditional GET. In offline mode only the cache is used.
+
+        Returns None for permanent failures (e.g. 404). Raises TransientError for
+        timeouts, connection errors, 429 and 5xx responses, so the caller can retry later.
+        """
+        cache = self.http_cache
+        cached = cache.lookup(url) if cache else None
+        if cache and cache.offline:
+            if cached is None:
+                logger.warning(f"Offline mode: {url} is not in the HTTP cache.")
+                return None
+            return cached['body']
+        if cached and cached['fresh']:
+            logger.debug(f"HTTP cache hit for {url}")
+            return cached['body']
+
+        self.rate_limiter.acquire(f"host:{(urlparse(url).netloc or '').lower()}")
         try:
-            resp = self.session.get(url, timeout=20.0, allow_redirects=True)
+            resp = self.session.get(
+                url, timeout=20.0, allow_redirects=True,
+                headers=HttpCache.conditional_headers(cached)
+            )
+            if resp.status_code == 304 and cached:
+                logger.debug(f"HTTP cache revalidated {url} (304)")
+                cache.mark_validated(url)
+                return cached['body']
             resp.raise_for_status()
+            if cache:
+                cache.store(url, resp.text, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
             return resp.text
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if cached:
+                logger.warning(f"Transient error fetching {url}, serving stale cached copy: {e}")
+                return cached['body']
+            logger.warning(f"Transient error fetching HTML from {url}: {e}")
+            raise TransientError(f"Fetch failed: {e}") from e
         except requests.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 429 or (status and status >= 500):
+                if cached:
+                    logger.warning(f"Transient HTTP {status} fetching {url}, serving stale cached copy")
+                    return cached['body']
+                logger.warning(f"Transient HTTP {status} fetching HTML from {url}")
+                raise TransientError(f"Fetch failed with HTTP {status}") from e
             logger.error(f"Failed to fetch HTML from {url}: {e}")
             return None
 
     def _pre_clean_html(self, soup: BeautifulSoup, url: str):
         """Remove widgets/ads/blocos óbvios ANTES da extração."""
-        # --- New robust related content removal logic from user patch ---
+        # Regras compiladas uma vez por host e aplicadas numa única passada
+        precleaner = get_precleaner((urlparse(url).hostname or "").lower())
         try:
-            # 1. Remove sections by heading text (e.g., "Leia também")
-            # Iterate backwards to avoid issues with modifying the list while iterating
-            for h in reversed(soup.find_all(re.compile("^h[1-6]$"))):
-                heading_text = h.get_text(" ", strip=True)
-                if heading_text and LEIA_HEADING_RE.search(heading_text):
-                    parent_container = h.find_parent(('section', 'aside', 'div'))
-                    if parent_container and len(parent_container.find_all(re.compile("^h[1-6]$"))) <= 2:
-                        logger.debug(f"Decomposing parent container '{parent_container.name}' of related heading: {heading_text}")
-                        parent_container.decompose()
-                    else:
-                        logger.debug(f"Decomposing related heading and its sibling: {heading_text}")
-                        next_sibling = h.find_next_sibling()
-                        if next_sibling and next_sibling.name in ("div", "ul", "section", "ol"):
-                            next_sibling.decompose()
-                        h.decompose()
-            
-            # 2. Remove by site-specific selectors
-            source_host = (urlparse(url).hostname or "").replace("www.", "")
-            if source_host in SITE_SPECIFIC_RELATED_SELECTORS:
-                for sel in SITE_SPECIFIC_RELATED_SELECTORS[source_host]:
-                    for el in soup.select(sel):
-                        el.decompose()
-            
-            # 3. Remove links that are likely related content wrappers
-            for a in soup.select("a"):
-                cls = " ".join(a.get("class", [])).lower()
-                if any(k in cls for k in ["relacion", "related", "leia", "veja"]) or a.get("data-gtm-cta") in ("related", "see_more"):
-                    a.decompose()
-
+            removed = precleaner.clean(soup)
         except Exception as e:
-            logger.warning(f"Error during advanced related content removal for {url}: {e}", exc_info=False)
-        # --- End of new logic ---
-
-        # Merged list from original and user suggestions for more robust cleaning
-        selectors_to_remove = {
-            # User-suggested selectors for CTAs, ads, and social sharing
-            ".cta-middle", ".infomoney-read-more", ".read-more", ".post__related",
-            ".sharing", ".share", ".social", ".banner", ".ads", ".advertisement",
-            "[data-ad]", "[data-ad-slot]",
-            ".sponsored", ".paid-content", ".partner", ".outbrain", ".taboola",
-            
-            # Original selectors
-            '[class*="srdb"]', '[class*="rating"]', '.review', '.score', '.meter',
-            'header', 'footer', 'nav', 'aside',
-            '[class*="related"]', '[id*="related"]',
-            # From user's patch (GENERIC_REL_SELECTORS)
-            "[class*='relacionad']", "[class*='relaciona']", "[class*='recommend']",
-            "[class*='veja-tambem']", "[class*='leia-tambem']", "[id*='relacionad']",
-            "[id*='leia']", "section[aria-label*='Leia']", "section[aria-label*='Relacionad']",
-            '[class*="trending"]', '[id*="trending"]', 'div.widget',
-            '[class*="sidebar"]',  '[id*="sidebar"]',
-            '[class*="recommend"]','[class*="recommended"]',
-            '[class*="screen-hub"]','[class*="screenhub"]',
-            '[class*="most-popular"]','[id*="most-popular"]',
-            '[class*="popular"]','[id*="popular"]',
-            '[class*="newsletter"]','[id*="newsletter"]',
-            '[class*="ad-"]','[id*="ad-"]','[class*="advert"]','[id*="advert"]',
-            '.comments', '#comments',
-            '.author', '.author-box', '.post-author', '.byline', '.entry-author',
-            '.avatar', '.author__image', '.author-profile',
-            '.subscribe',
-        }
-        for sel in selectors_to_remove:
-            for el in soup.select(sel):
-                try:
-                    el.decompose()
-                except Exception:
-                    pass
-
-        # remover texto "powered by srdb"
-        for text_node in soup.find_all(string=lambda t: isinstance(t, str) and "powered by srdb" in t.lower()):
-            p = text_node.find_parent()
-            if p:
-                try:
-                    p.decompose()
-                except Exception:
-                    pass
+            logger.warning(f"Error during pre-cleaning for {url}: {e}", exc_info=False)
+            return
 
-        logger.info("Pre-cleaned HTML, removing unwanted widgets and blocks.")
+        top_rules = ", ".join(f"{rule}={count}" for rule, count in removed.most_common(5))
+        logger.info(f"Pre-cleaned HTML, removed {sum(removed.values())} blocks ({top_rules or 'none'}).")
+        logger.debug(f"Pre-clean removals for {url}: {dict(removed)}")
 
     def _remove_forbidden_blocks(self, soup: BeautifulSoup) -> None:
         """Remove infobox técnica e mensagens indesejadas do html extraído."""
@@ -663,12 +635,13 @@ class ContentExtractor:
                 except Exception:
                     pass
 
-    def _convert_data_img_to_figure(self, soup: BeautifulSoup):
+    def _convert_data_img_to_figure(self, soup: BeautifulSoup, root: Optional[BeautifulSoup] = None):
         """
         Converte divs com 'data-img-url' em <figure><img>.
         Faz APENAS dentro do corpo do artigo para não pegar sidebar.
         """
-        root = _find_article_body(soup)
+        if root is None:
+            root = _find_article_body(soup)
         converted = 0
         for div in root.select('div[data-img-url]') :
             img_url = div['data-img-url']
@@ -823,15 +796,16 @@ class ContentExtractor:
         return [{"id": v, "embed_url": f"https://www.youtube.com/embed/{v}",
                  "watch_url": f"https://www.youtube.com/watch?v={v}"} for v in ordered]
 
-    def _extract_with_trafilatura(self, html: str, url: str) -> Optional[Dict[str, Any]]:
+    def _extract_with_trafilatura(self, soup: BeautifulSoup, url: str) -> Optional[Dict[str, Any]]:
         """
         Generic extraction method using Trafilatura as the core engine.
         This was the original `extract` method.
+
+        Works on the already-parsed page (`soup` is cleaned in place); trafilatura gets a
+        native lxml tree built from the cleaned document instead of re-parsing a string.
         """
         logger.debug(f"Using generic (trafilatura) extractor for {url}")
         try:
-            soup = BeautifulSoup(html, 'lxml')
-
             # Preserve twitter embeds
             twitter_embeds = soup.find_all('blockquote', class_='twitter-tweet')
 
@@ -842,14 +816,15 @@ class ContentExtractor:
             # 2) limpeza prévia pesada
             self._pre_clean_html(soup, url)
 
-            # 3) normaliza data-img-url -> <figure>
-            self._convert_data_img_to_figure(soup)
+            # 3) normaliza data-img-url -> <figure> (o corpo do artigo é localizado uma vez só)
+            article_root = _find_article_body(soup)
+            self._convert_data_img_to_figure(soup, root=article_root)
 
             # 4) Extrai imagem destacada com a nova lógica de priorização
             featured_image_url = self._pick_featured_image(soup, url)
 
             # 5) Extrai imagens do corpo do artigo
-            body_images = collect_images_from_article(soup, base_url=url)
+            body_images = collect_images_from_article(soup, base_url=url, root=article_root)
 
             # 6) vídeos
             videos = self._extract_youtube_videos(soup)
@@ -868,10 +843,10 @@ class ContentExtractor:
                 excerpt = (meta_desc.get('content') if (meta_desc := soup.find('meta', attrs={'name': 'description'})) else None) or \
                           (og_desc.get('content') if (og_desc := soup.find('meta', property='og:description')) else '')
 
-            # 8) extrair corpo com trafilatura
-            cleaned_html_str = str(soup)
+            # 8) extrair corpo com trafilatura, entregando uma árvore lxml pronta
+            cleaned_tree = lxml.html.document_fromstring(str(soup))
             content_html = trafilatura.extract(
-                cleaned_html_str,
+                cleaned_tree,
                 include_images=False, # Images are handled separately
                 include_links=True,
                 include_comments=False,
@@ -1039,28 +1014,38 @@ class ContentExtractor:
         logger.info("INFO (GE): Limpeza concluída. Retornando HTML final.")
         return main_container
 
-    def extract(self, html: str, url: str) -> Optional[Dict[str, Any]]:
+    def extract(self, html: Union[str, BeautifulSoup], url: str) -> Optional[Dict[str, Any]]:
         """
         Main extraction flow. Uses a modular, site-specific cleaning method.
         If no specific rule is found, it falls back to a generic extractor.
+
+        `html` may be the raw page or a soup from `parse_html`; passing the soup lets the
+        caller's domain cleaners and every step below share a single parse. The soup is
+        modified in place.
         """
-        soup = BeautifulSoup(html, 'lxml')
+        soup = html if isinstance(html, BeautifulSoup) else parse_html(html)
         domain = urlparse(url).netloc.lower().replace('www.', '')
 
-        # --- Step 1: Get metadata from the full page ---
-        featured_image_url = self._pick_featured_image(soup, url)
-        title = (og_title.get('content') if (og_title := soup.find('meta', property='og:title')) else None) or (soup.title.string if soup.title else 'No Title Found')
-        excerpt = (meta_desc.get('content') if (meta_desc := soup.find('meta', attrs={'name': 'description'})) else None) or \
-                  (og_desc.get('content') if (og_desc := soup.find('meta', property='og:description')) else '')
-        videos_full_page = self._extract_youtube_videos(soup)
-
-        # --- Step 2: Route to the correct site-specific cleaner ---
-        cleaned_container = None
+        # --- Step 1: Get metadata from the full page (before the cleaners touch it) ---
+        featured_image_url = None
+        title = excerpt = None
+        videos_full_page: List[Dict[str, str]] = []
+        site_cleaner = None
         if 'lance.com.br' in domain:
-            cleaned_container = self._clean_html_for_lance_definitivo(soup)
+            site_cleaner = self._clean_html_for_lance_definitivo
         elif 'ge.globo.com' in domain:
-            cleaned_container = self._clean_html_for_ge(soup)
-        
+            site_cleaner = self._clean_html_for_ge
+
+        if site_cleaner:
+            featured_image_url = self._pick_featured_image(soup, url)
+            title = (og_title.get('content') if (og_title := soup.find('meta', property='og:title')) else None) or (soup.title.string if soup.title else 'No Title Found')
+            excerpt = (meta_desc.get('content') if (meta_desc := soup.find('meta', attrs={'name': 'description'})) else None) or \
+                      (og_desc.get('content') if (og_desc := soup.find('meta', property='og:description')) else '')
+            videos_full_page = self._extract_youtube_videos(soup)
+
+        # --- Step 2: Route to the correct site-specific cleaner ---
+        cleaned_container = site_cleaner(soup) if site_cleaner else None
+
         # --- Step 3: Process content if a cleaned container was returned ---
         if cleaned_container:
             logger.info(f"Successfully cleaned content for {domain} using specific extractor.")
@@ -1091,4 +1076,4 @@ class ContentExtractor:
         else:
             # --- Step 4: Fallback for unhandled sites ---
             logger.warning(f"No specific extractor rule found for {domain}. Falling back to generic (trafilatura) extractor.")
-            return self._extract_with_trafilatura(html, url)
+            return self._extract_with_trafilatura(soup, url)
@@ -1,13 +1,20 @@
 import feedparser
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import xml.etree.ElementTree as ET
 from typing import List, Dict, Any, Optional
 import gzip
 import time
 import hashlib
+import threading
 from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from .concurrency import ConcurrencyLimiter
+from .rate_limit import RateLimiter, get_rate_limiter
+from .store import Database
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +73,15 @@ def _sort_key(item: dict):
     return dt if dt else datetime.min.replace(tzinfo=timezone.utc)
 # --- End of new helper functions ---
 
+def published_timestamp(value) -> float:
+    """Unix timestamp of a feed/DB publish date; 0.0 when it can't be parsed, so it sorts as oldest."""
+    dt = value if isinstance(value, datetime) else _parse_dt(_normalize_published(value))
+    if not dt:
+        return 0.0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
 def _stable_id_from(text: str) -> str:
     return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
 
@@ -117,13 +133,94 @@ def normalize_item(raw: dict) -> dict:
     }
 
 class FeedReader:
-    def __init__(self, user_agent: str):
+    def __init__(
+        self,
+        user_agent: str,
+        rate_limiter: Optional[RateLimiter] = None,
+        db: Optional[Database] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        pool_size: int = 10,
+    ):
+        """
+        Args:
+            user_agent: User-Agent header for feed requests.
+            rate_limiter: Token buckets shared with the rest of the pipeline.
+            db: When given, the ETag/Last-Modified and body hash of each feed URL are
+                persisted there, so unchanged feeds are skipped across cycles and restarts.
+            limiter: Caps simultaneous requests per host when feeds are read in parallel.
+            pool_size: Connections kept per host by the shared session. Should be at
+                least the number of threads calling read_feeds.
+        """
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': user_agent})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.limiter = limiter
+        self.db = db
+        self._http_state: Dict[str, Dict[str, Any]] = {}
+        # source_id -> {url: state}, so parallel sources commit independently
+        self._pending_state: Dict[Optional[str], Dict[str, Dict[str, Any]]] = {}
+        self._state_lock = threading.Lock()
 
-    def _fetch_content(self, url: str) -> Optional[bytes]:
+    def _load_http_state(self, urls: List[str]) -> None:
+        """Loads validators for `urls` that are not in memory yet."""
+        with self._state_lock:
+            missing = [u for u in urls if u not in self._http_state]
+        if not missing or not self.db:
+            return
+        states = self.db.get_feed_http_states(missing)
+        with self._state_lock:
+            for url in missing:
+                self._http_state.setdefault(url, states.get(url) or {})
+
+    def commit_feed_state(self, source_id: Optional[str] = None) -> None:
+        """
+        Persists the validators seen by read_feeds for `source_id` since its last commit.
+
+        Call it only after the items returned by read_feeds were registered: until then a
+        crash must not leave the feed marked as unchanged.
+        """
+        with self._state_lock:
+            pending = self._pending_state.pop(source_id, {})
+            self._http_state.update(pending)
+        if pending and self.db:
+            self.db.save_feed_http_states(pending)
+
+    def discard_feed_state(self, source_id: Optional[str] = None) -> None:
+        """Drops the validators pending for `source_id` (its items could not be registered)."""
+        with self._state_lock:
+            self._pending_state.pop(source_id, None)
+
+    def _fetch_content(self, url: str, source_id: Optional[str] = None, conditional: bool = True) -> Optional[bytes]:
+        """
+        Downloads a feed or sitemap with a conditional GET.
+
+        Returns None on failure and also when the feed did not change since the last
+        committed fetch (304, or a 200 whose body hash is the same), so callers skip
+        parsing and DB work for it. With `conditional=False` the body is always
+        returned (used for top-level sitemaps, see read_feeds).
+        """
+        self._load_http_state([url])
+        with self._state_lock:
+            previous = (self._http_state.get(url) or {}) if conditional else {}
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+        self.rate_limiter.acquire(f"host:{(urlparse(url).netloc or '').lower()}")
         try:
-            response = self.session.get(url, timeout=20)
+            if self.limiter:
+                with self.limiter.limit_host(url):
+                    response = self.session.get(url, timeout=20, headers=headers)
+            else:
+                response = self.session.get(url, timeout=20, headers=headers)
+            if response.status_code == 304:
+                logger.info(f"Feed {url} not modified (304), skipping.")
+                return None
             response.raise_for_status()
             
             content = response.content
@@ -141,7 +238,17 @@ class FeedReader:
                 except Exception as e:
                     logger.error(f"An unexpected error occurred during gzip decompression for {url}: {e}")
                     return None
-            
+
+            content_hash = hashlib.sha256(content).hexdigest()
+            with self._state_lock:
+                self._pending_state.setdefault(source_id, {})[url] = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_hash': content_hash,
+                }
+            if previous.get('content_hash') == content_hash:
+                logger.info(f"Feed {url} unchanged since last fetch, skipping.")
+                return None
             return content
         except requests.RequestException as e:
             logger.error(f"Failed to fetch feed/sitemap from {url}: {e}")
@@ -152,7 +259,8 @@ class FeedReader:
         xml_bytes: bytes,
         limit: int = 50,
         allow_regex: Optional[str] = None,
-        deny_regex: Optional[str] = None
+        deny_regex: Optional[str] = None,
+        source_id: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
         """
         Parses a sitemap.xml (or sitemapindex.xml) and returns a list of article-like dicts.
@@ -172,20 +280,21 @@ class FeedReader:
         if root.tag.endswith("sitemapindex"):
             logger.info("Detected sitemap index. Fetching child sitemaps.")
             child_sitemap_urls = [
-                sm.findtext("ns:loc", NS)
+                sm.findtext("ns:loc", namespaces=NS)
                 for sm in root.findall(".//ns:sitemap", NS)
-                if sm.findtext("ns:loc", NS)
+                if sm.findtext("ns:loc", namespaces=NS)
             ]
 
             for url in child_sitemap_urls:
                 if len(items) >= limit:
                     break
                 logger.debug(f"Fetching child sitemap from {url}")
-                child_bytes = self._fetch_content(url)
+                child_bytes = self._fetch_content(url, source_id)
                 if child_bytes:
                     # Recursive call to parse the child sitemap, passing regexes
                     items.extend(self._parse_sitemap(
-                        child_bytes, limit=limit, allow_regex=allow_regex, deny_regex=deny_regex
+                        child_bytes, limit=limit, allow_regex=allow_regex, deny_regex=deny_regex,
+                        source_id=source_id,
                     ))
                     time.sleep(0.2)  # Be polite
             
@@ -205,7 +314,7 @@ class FeedReader:
             if allow and not allow.search(loc):
                 continue
 
-            lastmod = url_element.findtext("ns:lastmod", NS)
+            lastmod = url_element.findtext("ns:lastmod", namespaces=NS)
             
             title = None
             news_block = url_element.find("news:news", NS)
@@ -235,9 +344,13 @@ class FeedReader:
         deny_regex = feed_config.get('deny_regex')
         deny = re.compile(deny_regex) if deny_regex else None
 
-        for url in feed_config.get('urls', []):
+        feed_urls = feed_config.get('urls', [])
+        self._load_http_state(feed_urls)
+        for url in feed_urls:
             logger.info(f"Reading {feed_type} feed from {url} for source '{source_id}'")
-            content = self._fetch_content(url)
+            # A sitemap index rarely changes while its child sitemaps do, so top-level
+            # sitemaps are always downloaded and walked; the children get the conditional GET
+            content = self._fetch_content(url, source_id, conditional=feed_type != 'sitemap')
             if not content:
                 continue
 
@@ -245,7 +358,8 @@ class FeedReader:
                 raw_items.extend(self._parse_sitemap(
                     content, limit=50,
                     allow_regex=feed_config.get('allow_regex'),
-                    deny_regex=deny_regex
+                    deny_regex=deny_regex,
+                    source_id=source_id,
                 ))
             else:  # Default to 'rss'
                 feed = feedparser.parse(content)
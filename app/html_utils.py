@@ -1,12 +1,66 @@
 # app/html_utils.py
 import re
 import logging
-from typing import List, Dict, Optional
+import time
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, parse_qs
 
 logger = logging.getLogger(__name__)
 
+# =========================
+# Cadeia de transformações (um parse, um serialize)
+# =========================
+
+HtmlPass = Callable[..., None]
+
+
+def parse_fragment(html: str) -> BeautifulSoup:
+    """Parses an HTML fragment with lxml (wrapped in <html><body>)."""
+    return BeautifulSoup(html or "", "lxml")
+
+
+def serialize_fragment(soup: BeautifulSoup) -> str:
+    """Inverse of parse_fragment: the contents of <body>, without the wrapper."""
+    return soup.body.decode_contents() if soup.body else str(soup)
+
+
+class HtmlTransformChain:
+    """
+    Ordered DOM passes over one parsed document.
+
+    Each pass is a function that mutates the soup in place (the `*_pass`
+    functions below and internal_linking.internal_links_pass). `run` parses the
+    HTML once, applies the passes in order and serializes once, instead of one
+    parse/serialize round trip per transform. The time spent in each pass is kept
+    in `timings` (milliseconds) and logged.
+    """
+
+    def __init__(self):
+        self.passes: List[Tuple[str, HtmlPass, Tuple[Any, ...], Dict[str, Any]]] = []
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, html_pass: HtmlPass, *args: Any, **kwargs: Any) -> "HtmlTransformChain":
+        """Appends `html_pass(soup, *args, **kwargs)` to the chain; returns the chain."""
+        self.passes.append((name, html_pass, args, kwargs))
+        return self
+
+    def run(self, html: str) -> str:
+        """Applies every pass to `html` and returns the resulting fragment."""
+        self.timings = {}
+        started = time.perf_counter()
+        soup = parse_fragment(html)
+        self.timings['parse'] = (time.perf_counter() - started) * 1000
+        for name, html_pass, args, kwargs in self.passes:
+            started = time.perf_counter()
+            html_pass(soup, *args, **kwargs)
+            self.timings[name] = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        result = serialize_fragment(soup)
+        self.timings['serialize'] = (time.perf_counter() - started) * 1000
+        logger.info("HTML transforms: " + ", ".join(f"{name} {ms:.1f}ms" for name, ms in self.timings.items()))
+        return result
+
 # =========================
 # YouTube helpers/normalizer
 # =========================
@@ -51,8 +105,13 @@ def strip_credits_and_normalize_youtube(html: str) -> str:
     if not html:
         return html
 
-    soup = BeautifulSoup(html, "lxml")
+    soup = parse_fragment(html)
+    strip_credits_and_normalize_youtube_pass(soup)
+    return serialize_fragment(soup)
 
+
+def strip_credits_and_normalize_youtube_pass(soup: BeautifulSoup) -> None:
+    """DOM pass of strip_credits_and_normalize_youtube."""
     # 1) Remover “Crédito:”, “Credito:”, “Fonte:”
     for node in soup.find_all(["figcaption", "p", "span"]):
         t = (node.get_text() or "").strip().lower()
@@ -94,8 +153,6 @@ def strip_credits_and_normalize_youtube(html: str) -> str:
         if not p.get_text(strip=True) and not p.find(True):
             p.decompose()
 
-    return soup.body.decode_contents() if soup.body else str(soup)
-
 
 def hard_filter_forbidden_html(html: str) -> str:
     """
@@ -191,10 +248,13 @@ def merge_images_into_content(content_html: str, image_urls: List[str], max_imag
       - não adiciona créditos/legendas
       - insere após o primeiro parágrafo; se não houver, ao final
     """
-    if not content_html:
-        content_html = ""
-    soup = BeautifulSoup(content_html, "lxml")
+    soup = parse_fragment(content_html)
+    merge_images_pass(soup, image_urls, max_images)
+    return serialize_fragment(soup)
+
 
+def merge_images_pass(soup: BeautifulSoup, image_urls: List[str], max_images: int = 6) -> None:
+    """DOM pass of merge_images_into_content."""
     # conjunto de URLs já presentes
     present: set[str] = set()
     for img in soup.find_all("img"):
@@ -232,8 +292,6 @@ def merge_images_into_content(content_html: str, image_urls: List[str], max_imag
             else:
                 parent.append(fig)
 
-    return soup.body.decode_contents() if soup.body else str(soup)
-
 
 def rewrite_img_srcs_with_wp(content_html: str, uploaded_src_map: Dict[str, str]) -> str:
     """
@@ -243,10 +301,19 @@ def rewrite_img_srcs_with_wp(content_html: str, uploaded_src_map: Dict[str, str]
     if not content_html or not uploaded_src_map:
         return content_html
 
+    soup = parse_fragment(content_html)
+    rewrite_img_srcs_pass(soup, uploaded_src_map)
+    return serialize_fragment(soup)
+
+
+def rewrite_img_srcs_pass(soup: BeautifulSoup, uploaded_src_map: Dict[str, str]) -> None:
+    """DOM pass of rewrite_img_srcs_with_wp."""
+    if not uploaded_src_map:
+        return
+
     # normalizar chaves do mapping
     norm_map: Dict[str, str] = {_norm_key(k): v for k, v in uploaded_src_map.items() if k and v}
 
-    soup = BeautifulSoup(content_html, "lxml")
     for img in soup.find_all("img"):
         # src
         src = (img.get("src") or "").strip()
@@ -265,8 +332,6 @@ def rewrite_img_srcs_with_wp(content_html: str, uploaded_src_map: Dict[str, str]
                 if k2 in norm_map:
                     img[a] = norm_map[k2]
 
-    return soup.body.decode_contents() if soup.body else str(soup)
-
 # --- Stub para compatibilidade com pipeline: não adiciona crédito nenhum ---
 from typing import Optional
 
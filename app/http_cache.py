@@ -0,0 +1,251 @@
+"""
+On-disk HTTP cache for article pages.
+
+Entries are indexed by URL in a small SQLite database, while the bodies are stored
+once per content hash (sha256) as zlib-compressed blobs. The same story published
+under two feeds, or fetched again on a retry, therefore costs one blob and, once
+the fresh window has passed, one conditional GET.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .config import HTTP_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Evictions also run every N writes, not only when the size limit is exceeded
+EVICT_EVERY_WRITES = 50
+
+
+class HttpCache:
+    """Content-addressed page cache with validators, TTL and size based eviction."""
+
+    def __init__(
+        self,
+        directory: str,
+        fresh_seconds: int = 600,
+        ttl_seconds: int = 72 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+        offline: bool = False,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Opens (or creates) the cache in `directory`.
+
+        Args:
+            directory: Where the index and the blobs are stored.
+            fresh_seconds: Age since the last validation under which an entry is served
+                without contacting the origin.
+            ttl_seconds: Entries not fetched or validated for this long are evicted.
+            max_bytes: Upper bound for the compressed blobs; least recently used entries
+                are evicted first.
+            offline: Serve only from the cache and never touch the network.
+            clock: Time source, injectable for tests.
+        """
+        self.directory = Path(directory)
+        self.blob_dir = self.directory / 'blobs'
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.fresh_seconds = fresh_seconds
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.conn = sqlite3.connect(str(self.directory / 'index.db'), timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                validated_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries (content_hash);
+            CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used_at);
+        ''')
+        self.conn.commit()
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.blob_dir / content_hash[:2] / f"{content_hash}.z"
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """
+        Returns the cached entry for `url` as a dict with 'body', 'etag', 'last_modified',
+        'validated_at' and 'fresh', or None if the URL is not cached.
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT * FROM entries WHERE url = ?', (url,)).fetchone()
+            if not row:
+                return None
+            try:
+                body = zlib.decompress(self._blob_path(row['content_hash']).read_bytes()).decode('utf-8')
+            except (OSError, zlib.error) as e:
+                logger.warning(f"HTTP cache blob for {url} is unreadable, dropping entry: {e}")
+                self.conn.execute('DELETE FROM entries WHERE url = ?', (url,))
+                self.conn.commit()
+                return None
+            now = self._clock()
+            self.conn.execute('UPDATE entries SET last_used_at = ? WHERE url = ?', (now, url))
+            self.conn.commit()
+        return {
+            'body': body,
+            'etag': row['etag'],
+            'last_modified': row['last_modified'],
+            'validated_at': row['validated_at'],
+            'fresh': now - row['validated_at'] < self.fresh_seconds,
+        }
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+        """Builds If-None-Match / If-Modified-Since headers from a cached entry."""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> str:
+        """
+        Saves `body` for `url`, writing the blob only if that content is not stored yet.
+
+        Returns:
+            The sha256 of the body.
+        """
+        data = body.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(content_hash)
+        with self._lock:
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                compressed = zlib.compress(data, 6)
+                tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+                tmp_path.write_bytes(compressed)
+                os.replace(tmp_path, path)
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO blobs (content_hash, size) VALUES (?, ?)',
+                    (content_hash, len(compressed))
+                )
+            now = self._clock()
+            self.conn.execute('''
+                INSERT INTO entries (url, content_hash, etag, last_modified, fetched_at, validated_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    content_hash = excluded.content_hash, etag = excluded.etag,
+                    last_modified = excluded.last_modified, fetched_at = excluded.fetched_at,
+                    validated_at = excluded.validated_at, last_used_at = excluded.last_used_at
+            ''', (url, content_hash, etag, last_modified, now, now, now))
+            self.conn.commit()
+            self._writes += 1
+            should_evict = self._writes % EVICT_EVERY_WRITES == 0
+        if should_evict or self.total_bytes() > self.max_bytes:
+            self.evict()
+        return content_hash
+
+    def mark_validated(self, url: str) -> None:
+        """Records a 304 response: the cached body is still current."""
+        with self._lock:
+            now = self._clock()
+            self.conn.execute(
+                'UPDATE entries SET validated_at = ?, last_used_at = ? WHERE url = ?', (now, now, url)
+            )
+            self.conn.commit()
+
+    def total_bytes(self) -> int:
+        """Size of all stored (compressed) blobs."""
+        with self._lock:
+            return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drops expired entries, then least recently used ones until the blobs fit in
+        max_bytes, and deletes blobs no longer referenced by any URL.
+
+        Returns:
+            The number of entries removed.
+        """
+        with self._lock:
+            cutoff = self._clock() - self.ttl_seconds
+            removed = self.conn.execute('DELETE FROM entries WHERE validated_at < ?', (cutoff,)).rowcount
+            self._drop_orphan_blobs()
+
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.conn.execute('''
+                    SELECT e.url, e.content_hash, b.size FROM entries e
+                    JOIN blobs b ON b.content_hash = e.content_hash
+                    ORDER BY e.last_used_at ASC
+                ''').fetchall()
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute('DELETE FROM entries WHERE url = ?', (row['url'],))
+                    removed += 1
+                    still_used = self.conn.execute(
+                        'SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1', (row['content_hash'],)
+                    ).fetchone()
+                    if not still_used:
+                        self._delete_blob(row['content_hash'])
+                        total -= row['size']
+            self.conn.commit()
+        if removed:
+            logger.info(f"HTTP cache eviction removed {removed} entries.")
+        return removed
+
+    def _drop_orphan_blobs(self) -> None:
+        orphans = self.conn.execute('''
+            SELECT content_hash FROM blobs
+            WHERE content_hash NOT IN (SELECT content_hash FROM entries)
+        ''').fetchall()
+        for row in orphans:
+            self._delete_blob(row['content_hash'])
+
+    def _delete_blob(self, content_hash: str) -> None:
+        self.conn.execute('DELETE FROM blobs WHERE content_hash = ?', (content_hash,))
+        try:
+            self._blob_path(content_hash).unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_default_cache: Optional[HttpCache] = None
+_default_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """Returns the process-wide cache built from HTTP_CACHE_CONFIG, or None when it is disabled."""
+    global _default_cache
+    if not HTTP_CACHE_CONFIG['enabled']:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache(
+                HTTP_CACHE_CONFIG['directory'],
+                fresh_seconds=HTTP_CACHE_CONFIG['fresh_seconds'],
+                ttl_seconds=HTTP_CACHE_CONFIG['ttl_seconds'],
+                max_bytes=HTTP_CACHE_CONFIG['max_bytes'],
+                offline=HTTP_CACHE_CONFIG['offline'],
+            )
+        return _default_cache
@@ -1,61 +1,264 @@
 import logging
-import re
-from typing import Dict, List, Set, Any
-from bs4 import BeautifulSoup
+from array import array
+from typing import Collection, Dict, List, Set, Any, Optional, Tuple, Union
+from bs4 import BeautifulSoup, NavigableString
+from app.aho_corasick import AhoCorasick
 from app.config import PILAR_POSTS
 
 logger = logging.getLogger(__name__)
 
 EXCLUDED_TAGS = ['a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'code', 'pre', 'figure', 'figcaption']
 
+PRIORITY_NAMES = ("PILAR", "CATEGORY", "OTHER")
+
+
+def _fold(text: str) -> str:
+    """Lowercases without changing the length, so offsets map back to the original text."""
+    return ''.join(low if len(low) == 1 else ch for ch, low in ((ch, ch.lower()) for ch in text))
+
+
+def _is_word(text: str, pos: int) -> bool:
+    return 0 <= pos < len(text) and (text[pos].isalnum() or text[pos] == '_')
+
+
+def _at_boundary(text: str, pos: int) -> bool:
+    """Same rule as the regex \\b: a word character on exactly one side."""
+    return _is_word(text, pos - 1) != _is_word(text, pos)
+
+
+class LinkMatcher:
+    """
+    Keyword index over a link map, built once and reused for every article.
+
+    All keywords (titles and tags) of all posts go into one Aho-Corasick automaton
+    over lowercased text, so each text node is scanned once whatever the size of
+    the map. Categories are kept as bitsets and PILAR posts as flags, so the
+    priority of a post for an article is two integer tests. Instances are
+    picklable (see app.link_map).
+    """
+
+    def __init__(self, posts: List[Dict[str, Any]], pilar_posts: Optional[List[str]] = None):
+        """
+        Args:
+            posts: The 'posts' list of the link map (link, keywords, categories).
+            pilar_posts: Links that always come first (PILAR_POSTS by default).
+        """
+        posts = [p for p in posts if p.get('keywords') and p.get('link')]
+        self.links: List[str] = [p['link'] for p in posts]
+        # WordPress category ID -> bit; each post keeps the mask of its categories
+        self._category_bits: Dict[int, int] = {}
+        self._category_masks: List[int] = []
+        for post in posts:
+            mask = 0
+            for category_id in post.get('categories', []):
+                bit = self._category_bits.setdefault(category_id, len(self._category_bits))
+                mask |= 1 << bit
+            self._category_masks.append(mask)
+        self.set_pilar_posts(PILAR_POSTS if pilar_posts is None else pilar_posts)
+
+        patterns: List[str] = []
+        pattern_ids: Dict[str, int] = {}
+        # pattern index -> [(post index, rank of the keyword within the post)]
+        owners: List[List[Tuple[int, int]]] = []
+        for post_index, post in enumerate(posts):
+            # Longer keywords first: "Real Madrid Club de Fútbol" before "Real Madrid"
+            keywords = sorted((k for k in post['keywords'] if k and k.strip()), key=len, reverse=True)
+            for rank, keyword in enumerate(keywords):
+                folded = _fold(keyword)
+                index = pattern_ids.get(folded)
+                if index is None:
+                    index = pattern_ids[folded] = len(patterns)
+                    patterns.append(folded)
+                    owners.append([])
+                owners[index].append((post_index, rank))
+        self._automaton = AhoCorasick(patterns)
+        # Flattened like the automaton: owners of pattern i are [_owner_start[i], _owner_start[i + 1])
+        self._owner_start = array('I', [0])
+        self._owner_post = array('I')
+        self._owner_rank = array('I')
+        for entries in owners:
+            for post_index, rank in entries:
+                self._owner_post.append(post_index)
+                self._owner_rank.append(rank)
+            self._owner_start.append(len(self._owner_post))
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def set_pilar_posts(self, pilar_posts: List[str]) -> None:
+        """Recomputes the PILAR flags (the list lives in config, not in the map)."""
+        self.pilar_posts = tuple(pilar_posts)
+        pilar = set(pilar_posts)
+        self._pilar = [link in pilar for link in self.links]
+
+    def category_mask(self, categories: Optional[List[int]]) -> int:
+        """Bitset of the article's categories, in this map's bit numbering."""
+        mask = 0
+        for category_id in categories or []:
+            bit = self._category_bits.get(category_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def priority(self, post_index: int, category_mask: int) -> int:
+        """Priority group of a post for an article: 0 PILAR, 1 shared category, 2 other."""
+        if self._pilar[post_index]:
+            return 0
+        return 1 if self._category_masks[post_index] & category_mask else 2
+
+    def best_match(self, text: str, category_mask: int, used_urls: Set[str]) -> Optional[Tuple[int, int, int]]:
+        """
+        Picks the link for a text node: the first post in priority order with a
+        keyword in the node, its longest matching keyword, first occurrence.
+
+        Returns:
+            `(start, end, post_index)`, or None if no unused post matches.
+        """
+        return self.ranked_match(text, category_mask, used_urls)[1]
+
+    def ranked_match(
+        self,
+        text: str,
+        category_mask: int,
+        used_urls: Set[str],
+        skip: Collection[int] = (),
+    ) -> Tuple[Optional[Tuple[int, int, int, int]], Optional[Tuple[int, int, int]]]:
+        """
+        best_match with its sort key `(priority, post_index, rank, start)`, so the
+        results of several matchers can be compared. Posts in `skip` are ignored.
+        """
+        best_key, best = None, None
+        for start, end, index in self._automaton.iter_matches(_fold(text)):
+            if not (_at_boundary(text, start) and _at_boundary(text, end)):
+                continue
+            for j in range(self._owner_start[index], self._owner_start[index + 1]):
+                post_index, rank = self._owner_post[j], self._owner_rank[j]
+                key = (self.priority(post_index, category_mask), post_index, rank, start)
+                if (best_key is None or key < best_key) and self.links[post_index] not in used_urls \
+                        and post_index not in skip:
+                    best_key, best = key, (start, end, post_index)
+        return best_key, best
+
+
+class LayeredLinkMatcher:
+    """
+    A compiled LinkMatcher plus a small one for posts published since it was built.
+
+    Rebuilding the full index takes hundreds of milliseconds, so new posts go into
+    the `recent` layer (a few keywords, built in microseconds) and win over base
+    posts in the same priority group, as the newest posts of the map. Base posts
+    with the link of a recent post are hidden. Same interface as LinkMatcher; the
+    category mask is a pair, one per layer.
+    """
+
+    def __init__(self, base: LinkMatcher, recent: LinkMatcher):
+        self.base = base
+        self.recent = recent
+        recent_links = set(recent.links)
+        self._hidden = {i for i, link in enumerate(base.links) if link in recent_links}
+        self.links: List[str] = recent.links + base.links
+        self.pilar_posts = base.pilar_posts
+
+    def __len__(self) -> int:
+        return len(self.links) - len(self._hidden)
+
+    def set_pilar_posts(self, pilar_posts: List[str]) -> None:
+        self.base.set_pilar_posts(pilar_posts)
+        self.recent.set_pilar_posts(pilar_posts)
+        self.pilar_posts = self.base.pilar_posts
+
+    def category_mask(self, categories: Optional[List[int]]) -> Tuple[int, int]:
+        return self.base.category_mask(categories), self.recent.category_mask(categories)
+
+    def priority(self, post_index: int, category_mask: Tuple[int, int]) -> int:
+        offset = len(self.recent.links)
+        if post_index < offset:
+            return self.recent.priority(post_index, category_mask[1])
+        return self.base.priority(post_index - offset, category_mask[0])
+
+    def best_match(self, text: str, category_mask: Tuple[int, int], used_urls: Set[str]) -> Optional[Tuple[int, int, int]]:
+        offset = len(self.recent.links)
+        recent_key, recent = self.recent.ranked_match(text, category_mask[1], used_urls)
+        base_key, base = self.base.ranked_match(text, category_mask[0], used_urls, self._hidden)
+        if base is not None:
+            base_key = (base_key[0], base_key[1] + offset) + base_key[2:]
+            base = (base[0], base[1], base[2] + offset)
+        if recent is None or (base is not None and base_key < recent_key):
+            return base
+        return recent
+
+
+# The link map is loaded once per cycle; its matcher is kept for as long as the same object is used
+_matcher_cache: Tuple[Optional[Dict[str, Any]], Optional[LinkMatcher]] = (None, None)
+
+
+def get_link_matcher(link_map_data: Dict[str, Any]) -> LinkMatcher:
+    """Returns the matcher for `link_map_data`, building it on first use."""
+    global _matcher_cache
+    cached_map, matcher = _matcher_cache
+    if cached_map is not link_map_data or matcher is None:
+        matcher = LinkMatcher(link_map_data.get('posts', []))
+        _matcher_cache = (link_map_data, matcher)
+    return matcher
+
+
+def _resolve_matcher(link_map_data: Union[LinkMatcher, LayeredLinkMatcher, Dict[str, List[Dict[str, Any]]], None]):
+    if isinstance(link_map_data, (LinkMatcher, LayeredLinkMatcher)):
+        matcher = link_map_data
+    elif link_map_data and link_map_data.get('posts'):
+        matcher = get_link_matcher(link_map_data)
+    else:
+        return None
+    if not len(matcher):
+        return None
+    if matcher.pilar_posts != tuple(PILAR_POSTS):
+        matcher.set_pilar_posts(PILAR_POSTS)
+    return matcher
+
+
 def add_internal_links(
-    html_content: str, 
-    link_map_data: Dict[str, List[Dict[str, Any]]],
+    html_content: str,
+    link_map_data: Union[LinkMatcher, LayeredLinkMatcher, Dict[str, List[Dict[str, Any]]]],
     current_post_categories: List[int] = None,
     max_links: int = 6
 ) -> str:
     """
     Analyzes HTML and inserts internal links based on a prioritized strategy,
     using a list of keywords (title + tags) for each link.
+
+    `link_map_data` is either a compiled LinkMatcher (see app.link_map) or the raw
+    link map, compiled here on first use. Posts are tried PILAR first, then posts
+    sharing a category with the article, then the rest; at most one link per text
+    node and per URL.
     """
-    if not html_content or not link_map_data or not link_map_data.get('posts'):
+    if not html_content or _resolve_matcher(link_map_data) is None:
         return html_content
 
     soup = BeautifulSoup(html_content, 'html.parser')
-    links_inserted = 0
-    used_urls: Set[str] = set()
-    
-    all_link_options = link_map_data['posts']
-
-    # --- Prioritization Logic ---
-    pilar_options = []
-    category_options = []
-    other_options = []
-
-    current_cat_set = set(current_post_categories or [])
+    internal_links_pass(soup, link_map_data, current_post_categories, max_links)
+    return str(soup)
 
-    for post_data in all_link_options:
-        # Skip if the post has no keywords to match
-        if not post_data.get('keywords'):
-            continue
 
-        is_pilar = post_data['link'] in PILAR_POSTS
-        shares_category = current_cat_set and not current_cat_set.isdisjoint(post_data.get('categories', []))
+def internal_links_pass(
+    soup: BeautifulSoup,
+    link_map_data: Union[LinkMatcher, LayeredLinkMatcher, Dict[str, List[Dict[str, Any]]], None],
+    current_post_categories: List[int] = None,
+    max_links: int = 6
+) -> int:
+    """
+    DOM pass of add_internal_links, for html_utils.HtmlTransformChain.
 
-        if is_pilar:
-            pilar_options.append(post_data)
-        elif shares_category:
-            category_options.append(post_data)
-        else:
-            other_options.append(post_data)
+    Returns:
+        The number of links inserted.
+    """
+    matcher = _resolve_matcher(link_map_data)
+    if matcher is None:
+        return 0
 
-    # Within each priority group, sort keywords by length, descending.
-    # This ensures we try to match "Real Madrid Club de Fútbol" before "Real Madrid".
-    for group in [pilar_options, category_options, other_options]:
-        for post_data in group:
-            post_data['keywords'].sort(key=len, reverse=True)
+    links_inserted = 0
+    used_urls: Set[str] = set()
 
-    prioritized_link_options = pilar_options + category_options + other_options
+    category_mask = matcher.category_mask(current_post_categories)
 
     text_nodes = soup.find_all(string=True)
 
@@ -67,32 +270,21 @@ def add_internal_links(
             continue
 
         original_text = str(node)
-        modified_in_node = False
-
-        for link_option in prioritized_link_options:
-            if modified_in_node or links_inserted >= max_links:
-                break
+        match = matcher.best_match(original_text, category_mask, used_urls)
+        if match is None:
+            continue
 
-            url = link_option['link']
-            if url in used_urls:
-                continue
+        start, end, post_index = match
+        url = matcher.links[post_index]
+        keyword = original_text[start:end]
+        link_tag = soup.new_tag('a', href=url)
+        link_tag.string = keyword
+        node.insert_after(NavigableString(original_text[end:]))
+        node.insert_after(link_tag)
+        node.replace_with(NavigableString(original_text[:start]))
 
-            # Iterate through all keywords for this link option (title, tags)
-            for keyword in link_option['keywords']:
-                pattern = re.compile(r'\b(' + re.escape(keyword) + r')\b', re.IGNORECASE)
-                
-                if pattern.search(original_text):
-                    link_tag_str = f'<a href="{url}">{keyword}</a>'
-                    new_html = pattern.sub(link_tag_str, original_text, count=1)
-                    
-                    node.replace_with(BeautifulSoup(new_html, 'html.parser'))
-                    
-                    links_inserted += 1
-                    used_urls.add(url)
-                    modified_in_node = True # Mark that we modified this node
-                    
-                    priority = "PILAR" if link_option in pilar_options else "CATEGORY" if link_option in category_options else "OTHER"
-                    logger.info(f"Inserted link for keyword: '{keyword}' (Priority: {priority})")
-                    break # Stop searching keywords for this link_option
+        links_inserted += 1
+        used_urls.add(url)
+        logger.info(f"Inserted link for keyword: '{keyword}' (Priority: {PRIORITY_NAMES[matcher.priority(post_index, category_mask)]})")
 
-    return str(soup)
+    return links_inserted
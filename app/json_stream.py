@@ -0,0 +1,145 @@
+"""
+Incremental validation of a JSON object streamed by the model.
+
+The validator scans each chunk as it arrives, so a response that does not start
+as an object, breaks its nesting or uses unquoted keys is rejected after a few
+tokens instead of after the whole generation. It also notices the end of the
+top-level object (anything after it is not needed) and an `erro` rejection, whose
+message is all the pipeline uses.
+"""
+
+import json
+from typing import List, Optional
+
+from .exceptions import StreamValidationError
+
+_CLOSERS = {'}': '{', ']': '['}
+
+
+class JSONStreamValidator:
+    """Character-level checker for a streamed top-level JSON object."""
+
+    def __init__(self, rejection_key: str = 'erro'):
+        """
+        Args:
+            rejection_key: Top-level key whose string value means the model declined
+                the task; the stream can stop as soon as that value is complete.
+        """
+        self.rejection_key = rejection_key
+        self.top_level_keys: List[str] = []
+        self.rejection: Optional[str] = None
+        self.complete = False
+        self._parts: List[str] = []
+        self._started = False
+        self._in_fence_header = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._expect_colon = False
+        self._capture: Optional[List[str]] = None
+        self._current_key: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """The JSON received so far (without a leading code fence)."""
+        return ''.join(self._parts)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Scans the next chunk.
+
+        Returns:
+            True while more input is needed; False once the object is complete or
+            the model returned a rejection.
+
+        Raises:
+            StreamValidationError: on a structural violation.
+        """
+        start = 0
+        for i, ch in enumerate(chunk):
+            if not self._started:
+                # Skip whitespace and an optional ```json fence before the object
+                if self._in_fence_header:
+                    if ch == '\n':
+                        self._in_fence_header = False
+                    continue
+                if ch.isspace():
+                    continue
+                if ch == '`':
+                    self._in_fence_header = True
+                    continue
+                if ch != '{':
+                    raise StreamValidationError(f"Response does not start with a JSON object (got {ch!r}).")
+                self._started = True
+                start = i
+            if self._step(ch):
+                self._parts.append(chunk[start:i + 1])
+                return False
+        if self._started:
+            self._parts.append(chunk[start:])
+        return True
+
+    def _step(self, ch: str) -> bool:
+        """Advances the state machine by one character; True means stop reading."""
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                return self._string_done()
+            if self._capture is not None:
+                self._capture.append(ch)
+            return False
+
+        if ch.isspace():
+            return False
+        top_object = len(self._stack) == 1
+        if top_object and self._expect_key and ch not in '"}':
+            raise StreamValidationError(f"Expected a quoted key at the top level, got {ch!r}.")
+        if top_object and self._expect_colon:
+            if ch != ':':
+                raise StreamValidationError(f"Expected ':' after key {self._current_key!r}, got {ch!r}.")
+            self._expect_colon = False
+            return False
+        if ch == '"':
+            self._in_string = True
+            capture = top_object and (self._expect_key or self._current_key == self.rejection_key)
+            self._capture = [] if capture else None
+        elif ch in '{[':
+            self._stack.append(ch)
+            if len(self._stack) == 1:
+                self._expect_key = True
+        elif ch in '}]':
+            if not self._stack or self._stack[-1] != _CLOSERS[ch]:
+                raise StreamValidationError(f"Unbalanced {ch!r} in the response.")
+            self._stack.pop()
+            if not self._stack:
+                self.complete = True
+                return True
+        elif top_object and ch == ',':
+            self._expect_key = True
+            self._current_key = None
+        return False
+
+    def _string_done(self) -> bool:
+        if self._capture is None:
+            return False
+        value = ''.join(self._capture)
+        self._capture = None
+        try:
+            value = json.loads(f'"{value}"')
+        except ValueError:
+            pass
+        if self._expect_key:
+            self._current_key = value
+            self.top_level_keys.append(value)
+            self._expect_key = False
+            self._expect_colon = True
+            return False
+        if self._current_key == self.rejection_key:
+            self.rejection = value
+            return True
+        return False
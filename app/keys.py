@@ -1,83 +1,270 @@
+import hashlib
 import logging
+import threading
 import time
-from datetime import datetime, timedelta
-from itertools import cycle
-from typing import Dict, List, Optional, Any
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .config import GEMINI_KEY_CONFIG
 
 logger = logging.getLogger(__name__)
 
-class KeyPool:
+# Resultados de uma chamada, informados em KeyScheduler.release()
+OUTCOME_SUCCESS = 'success'
+OUTCOME_RATE_LIMITED = 'rate_limited'  # 429 / quota esgotada: cooldown exponencial
+OUTCOME_TRANSIENT = 'transient'        # timeout / 5xx: cooldown curto
+OUTCOME_ERROR = 'error'                # resposta inválida etc.: só reduz a saúde
+OUTCOME_INVALID = 'invalid'            # chave rejeitada pela API: cooldown longo
+
+# Peso do último resultado na média móvel de saúde (0..1)
+HEALTH_DECAY = 0.2
+
+
+def key_hash(api_key: str) -> str:
+    """Stable identifier for a key, so the key itself never needs to be stored."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def mask_key(api_key: str) -> str:
+    return f"...{api_key[-4:]}"
+
+
+class KeyState:
+    """Runtime and persisted state of one API key."""
+
+    def __init__(self, index: int, api_key: str):
+        self.index = index
+        self.api_key = api_key
+        self.key_hash = key_hash(api_key)
+        self.is_valid = True
+        self.cooldown_until = 0.0
+        self.success_count = 0
+        self.failure_count = 0
+        self.consecutive_failures = 0
+        self.health = 1.0
+        self.last_used_at = 0.0
+        self.in_flight = 0
+
+    def to_row(self, category: str) -> Dict[str, Any]:
+        """Row for the api_key_status table (timestamps as UTC datetimes)."""
+        def _dt(ts: float) -> Optional[datetime]:
+            return datetime.utcfromtimestamp(ts) if ts else None
+
+        return {
+            'key_hash': self.key_hash,
+            'api_key': mask_key(self.api_key),
+            'category': category,
+            'is_valid': self.is_valid,
+            'cooldown_until': _dt(self.cooldown_until),
+            'success_count': self.success_count,
+            'failure_count': self.failure_count,
+            'consecutive_failures': self.consecutive_failures,
+            'health': self.health,
+            'last_used_at': _dt(self.last_used_at),
+        }
+
+    def load_row(self, row: Dict[str, Any]) -> None:
+        def _ts(value: Any) -> float:
+            if not value:
+                return 0.0
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            return (value - datetime(1970, 1, 1)).total_seconds()
+
+        self.is_valid = bool(row.get('is_valid', True))
+        self.cooldown_until = _ts(row.get('cooldown_until'))
+        self.success_count = row.get('success_count') or 0
+        self.failure_count = row.get('failure_count') or 0
+        self.consecutive_failures = row.get('consecutive_failures') or 0
+        self.health = row.get('health') if row.get('health') is not None else 1.0
+        self.last_used_at = _ts(row.get('last_used_at'))
+
+
+class KeyScheduler:
     """
-    Manages a pool of API keys with rotation and exponential backoff cooldown.
+    Picks an API key for each request and tracks how every key is doing.
+
+    A key is eligible while it is valid and not cooling down. Among the eligible
+    keys the one with the fewest requests in flight wins, then the healthiest
+    (moving average of recent outcomes), then the least recently used. A 429 puts
+    the key in exponential cooldown, so callers move on to another key instead of
+    sleeping. A key rejected by the API (PermissionDenied / Unauthenticated) is
+    marked invalid and cools down for hours, since the cause (API disabled, model
+    access) may be fixed later; its next success makes it valid again. At most max_in_flight requests run on a key at once, so N keys serve
+    N concurrent rewrites. Cooldowns and counters are persisted in `api_key_status`
+    through the given Database, and survive restarts.
     """
 
-    def __init__(self, api_keys: List[str], max_cooldown_seconds: int = 300):
+    def __init__(
+        self,
+        api_keys: List[str],
+        db: Optional[Any] = None,
+        category: str = 'gemini',
+        base_cooldown_seconds: Optional[int] = None,
+        max_cooldown_seconds: Optional[int] = None,
+        transient_cooldown_seconds: Optional[int] = None,
+        invalid_cooldown_seconds: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ):
         """
-        Initializes the KeyPool.
-
         Args:
-            api_keys: A list of API keys to manage.
-            max_cooldown_seconds: The maximum duration for a key to be in cooldown (default: 5 minutes).
-        """
-        if not api_keys:
-            self._key_list: List[str] = []
-            self._key_cycle = None
-            self._key_status: Dict[str, Dict[str, Any]] = {}
-            logger.warning("KeyPool initialized with an empty list of keys.")
-        else:
-            self._key_list = api_keys
-            self._key_cycle = cycle(self._key_list)
-            self._key_status = {
-                key: {'cooldown_until': None, 'failures': 0}
-                for key in self._key_list
-            }
-            logger.info(f"KeyPool ready with {len(self._key_list)} keys.")
-
-        self.max_cooldown_seconds = max_cooldown_seconds
-
-    def get_key(self) -> Optional[str]:
+            api_keys: Keys in configuration order; the position is the key index
+                (used for the 'gemini:<index>' rate limit bucket).
+            db: Optional Database used to load and persist the key state.
+            category: Value of the `category` column for these keys.
+            base_cooldown_seconds: First cooldown after a 429; doubles on each consecutive one.
+            max_cooldown_seconds: Upper bound for the cooldown.
+            transient_cooldown_seconds: Cooldown after a timeout or 5xx error.
+            invalid_cooldown_seconds: Cooldown after the API rejects the key.
+            max_in_flight: Concurrent requests allowed per key (0 = unlimited).
+            clock: Time source, injectable for tests.
         """
-        Gets the next available key from the pool, skipping any keys in cooldown.
+        self.db = db
+        self.category = category
+        self.base_cooldown_seconds = base_cooldown_seconds or GEMINI_KEY_CONFIG['base_cooldown_seconds']
+        self.max_cooldown_seconds = max_cooldown_seconds or GEMINI_KEY_CONFIG['max_cooldown_seconds']
+        self.transient_cooldown_seconds = (
+            transient_cooldown_seconds if transient_cooldown_seconds is not None
+            else GEMINI_KEY_CONFIG['transient_cooldown_seconds']
+        )
+        self.invalid_cooldown_seconds = (
+            invalid_cooldown_seconds if invalid_cooldown_seconds is not None
+            else GEMINI_KEY_CONFIG['invalid_cooldown_seconds']
+        )
+        self.max_in_flight = (
+            max_in_flight if max_in_flight is not None
+            else GEMINI_KEY_CONFIG['max_in_flight_per_key']
+        )
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._keys = [KeyState(i, key) for i, key in enumerate(api_keys)]
+        if not self._keys:
+            logger.warning("KeyScheduler initialized with an empty list of keys.")
+        self._load()
 
-        Returns:
-            An available API key, or None if all keys are in cooldown.
-        """
-        if not self._key_cycle:
-            return None
+    def __len__(self) -> int:
+        return len(self._keys)
 
-        for _ in range(len(self._key_list)):
-            key = next(self._key_cycle)
-            status = self._key_status[key]
-            cooldown_until = status.get('cooldown_until')
+    def _load(self) -> None:
+        if not self.db or not self._keys:
+            return
+        rows = self.db.get_api_key_statuses(self.category)
+        restored = 0
+        for state in self._keys:
+            row = rows.get(state.key_hash)
+            if row:
+                state.load_row(row)
+                restored += 1
+                if not state.is_valid and not state.cooldown_until:
+                    # Disabled for good by earlier versions: give the key another try
+                    state.is_valid = True
+        now = self._clock()
+        cooling = sum(1 for s in self._keys if s.cooldown_until > now)
+        invalid = sum(1 for s in self._keys if not s.is_valid)
+        logger.info(
+            f"KeyScheduler ready with {len(self._keys)} keys "
+            f"({restored} restored, {cooling} cooling down, {invalid} invalid)."
+        )
 
-            if cooldown_until and datetime.now() < cooldown_until:
-                continue
-            
-            return key
+    def _persist(self, state: KeyState) -> None:
+        if self.db:
+            self.db.save_api_key_status(state.to_row(self.category))
 
-        logger.warning("All API keys are currently in cooldown.")
-        return None
+    def api_key(self, index: int) -> str:
+        return self._keys[index].api_key
 
-    def report_failure(self, key: str, base_cooldown_seconds: int = 60):
-        """Reports a failure for a key and puts it into exponential backoff cooldown."""
-        if key not in self._key_status:
-            return
+    def acquire(self, exclude: Iterable[int] = (), timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Reserves the best eligible key, waiting while every eligible key already has
+        max_in_flight requests running.
+
+        Args:
+            exclude: Key indexes already tried for the current request.
+            timeout: Maximum wait for a busy key, in seconds (None waits indefinitely).
 
-        status = self._key_status[key]
-        status['failures'] += 1
+        Returns:
+            The key index (release it with release()), or None if no key is eligible
+            or the wait timed out.
+        """
+        excluded = set(exclude)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = self._clock()
+                eligible = [
+                    s for s in self._keys
+                    if s.cooldown_until <= now and s.index not in excluded
+                ]
+                if not eligible:
+                    return None
+                free = [s for s in eligible if not self.max_in_flight or s.in_flight < self.max_in_flight]
+                if free:
+                    best = min(free, key=lambda s: (s.in_flight, -s.health, s.last_used_at))
+                    best.in_flight += 1
+                    best.last_used_at = now
+                    return best.index
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
 
-        backoff_factor = 2 ** (status['failures'] - 1)
-        cooldown_duration = min(base_cooldown_seconds * backoff_factor, self.max_cooldown_seconds)
-        cooldown_end = datetime.now() + timedelta(seconds=cooldown_duration)
-        status['cooldown_until'] = cooldown_end
+    def release(self, index: int, outcome: str) -> None:
+        """Returns a key reserved by acquire() and records the outcome of the call."""
+        with self._cond:
+            state = self._keys[index]
+            state.in_flight = max(0, state.in_flight - 1)
+            now = self._clock()
+            ok = outcome == OUTCOME_SUCCESS
+            state.health = (1 - HEALTH_DECAY) * state.health + HEALTH_DECAY * (1.0 if ok else 0.0)
+            if ok:
+                if state.consecutive_failures:
+                    logger.info(f"Key index {index} is healthy again.")
+                if not state.is_valid:
+                    logger.info(f"Key index {index} is accepted by the API again.")
+                state.is_valid = True
+                state.success_count += 1
+                state.consecutive_failures = 0
+                state.cooldown_until = 0.0
+            else:
+                state.failure_count += 1
+                state.consecutive_failures += 1
+                if outcome == OUTCOME_RATE_LIMITED:
+                    cooldown = min(
+                        self.base_cooldown_seconds * 2 ** (state.consecutive_failures - 1),
+                        self.max_cooldown_seconds
+                    )
+                    state.cooldown_until = now + cooldown
+                    logger.warning(f"Key index {index} rate limited; cooling down for {cooldown:.0f}s.")
+                elif outcome == OUTCOME_TRANSIENT:
+                    state.cooldown_until = now + self.transient_cooldown_seconds
+                elif outcome == OUTCOME_INVALID:
+                    state.is_valid = False
+                    state.cooldown_until = now + self.invalid_cooldown_seconds
+                    logger.error(
+                        f"Key index {index} ({mask_key(state.api_key)}) was rejected by the API; "
+                        f"retrying it in {self.invalid_cooldown_seconds / 3600:.1f}h."
+                    )
+                    if not any(s.is_valid for s in self._keys):
+                        logger.critical(
+                            f"All {len(self._keys)} API keys were rejected by the API. AI rewrites are paused "
+                            f"until {datetime.utcfromtimestamp(min(s.cooldown_until for s in self._keys)):%Y-%m-%d %H:%M} UTC; "
+                            f"check the keys and the project's API access."
+                        )
+            self._persist(state)
+            self._cond.notify_all()
 
-        logger.warning(f"Cooldown set for key ...{key[-4:]} for {cooldown_duration:.0f}s. Cooldown until: {cooldown_end.strftime('%Y-%m-%d %H:%M:%S')}")
+    def next_available_in(self) -> Optional[float]:
+        """Seconds until some key leaves its cooldown (0 if one is free), or None if there are no keys."""
+        with self._cond:
+            now = self._clock()
+            waits = [max(0.0, s.cooldown_until - now) for s in self._keys]
+        return min(waits) if waits else None
 
-    def report_success(self, key: str):
-        """Reports a successful use of a key, resetting its failure count."""
-        if key in self._key_status:
-            status = self._key_status[key]
-            if status['failures'] > 0:
-                logger.info(f"Key ...{key[-4:]} is now active again after successful use.")
-                status['failures'] = 0
-                status['cooldown_until'] = None
\ No newline at end of file
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current state of every key, for logs and the dashboard."""
+        with self._cond:
+            return [
+                {**s.to_row(self.category), 'index': s.index, 'in_flight': s.in_flight}
+                for s in self._keys
+            ]
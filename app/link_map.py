@@ -0,0 +1,419 @@
+"""
+Precompiled internal link map.
+
+build_link_map.py writes the raw map to data/internal_links.json and a compiled
+LinkMatcher (keyword automaton, category bitsets, PILAR flags) to
+data/internal_links.pkl. The pipeline loads the artifact once per process and
+reloads it only when the file changes, so neither the JSON parse nor the index
+build happens on the hot path. If the artifact is missing, stale or from another
+format version, it is rebuilt from the JSON.
+
+build_link_map() refreshes both files from WordPress. After a first full build
+it only asks for posts modified since the newest `modified` date in the map,
+resolves tag names through a local cache (data/tag_names.json) and merges the
+changes by post ID, so a refresh with nothing new costs one request.
+
+Posts the pipeline publishes itself are link targets as soon as WordPress returns
+them (LinkMapLoader.add_published_post, hooked to WordPressClient.on_post_created)
+and are written to the files once per cycle (LinkMapLoader.flush).
+"""
+
+import json
+import logging
+import os
+import pickle
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .config import LINK_MAP_CONFIG
+from .exceptions import WordPressPublisherError
+from .internal_linking import LayeredLinkMatcher, LinkMatcher
+
+logger = logging.getLogger(__name__)
+
+LINK_MAP_JSON = os.path.join('data', 'internal_links.json')
+LINK_MAP_ARTIFACT = os.path.join('data', 'internal_links.pkl')
+# Bump when LinkMatcher or AhoCorasick change their attributes
+LINK_MAP_FORMAT_VERSION = 1
+TAG_CACHE_PATH = os.path.join('data', 'tag_names.json')
+LINK_MAP_POST_FIELDS = ['id', 'title', 'link', 'categories', 'tags', 'date', 'modified']
+
+
+def compile_link_map(link_map_data: Dict[str, Any]) -> LinkMatcher:
+    """Builds the matcher for a raw link map ({'posts': [...]})."""
+    return LinkMatcher(link_map_data.get('posts', []))
+
+
+def save_link_map_artifact(matcher: LinkMatcher, path: str = LINK_MAP_ARTIFACT) -> None:
+    """Writes the compiled map atomically (readers never see a partial file)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': LINK_MAP_FORMAT_VERSION, 'matcher': matcher}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_link_map_artifact(path: str = LINK_MAP_ARTIFACT) -> Optional[LinkMatcher]:
+    """Loads a compiled map, or None if it is missing, unreadable or from another format version."""
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Link map artifact {path} is unreadable: {e}")
+        return None
+    if not isinstance(payload, dict) or payload.get('version') != LINK_MAP_FORMAT_VERSION:
+        logger.info(f"Link map artifact {path} has an old format version; it will be rebuilt.")
+        return None
+    return payload['matcher']
+
+
+def _write_json(path: str, data: Any, indent: Optional[int] = None) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return None
+
+
+def resolve_tag_names(client: Any, tag_ids: Iterable[int], cache_path: str = TAG_CACHE_PATH,
+                      refresh: bool = False) -> Dict[int, str]:
+    """
+    Maps tag IDs to names, asking WordPress only for the IDs not in the local cache.
+
+    Args:
+        client: WordPressClient used for the missing IDs.
+        tag_ids: The IDs to resolve.
+        cache_path: JSON file of known {id: name}.
+        refresh: Ignore the cache and fetch every ID (picks up renamed tags).
+
+    Returns:
+        {id: name} for every ID that could be resolved.
+    """
+    cached = {} if refresh else _read_json(cache_path) or {}
+    names = {int(tag_id): name for tag_id, name in cached.items()}
+    missing = sorted({tag_id for tag_id in tag_ids if tag_id not in names})
+    if missing:
+        logger.info(f"Resolving {len(missing)} tag IDs not in the local cache.")
+        fetched = client.get_tags_map_by_ids(missing)
+        if fetched:
+            names.update(fetched)
+            try:
+                _write_json(cache_path, {str(tag_id): name for tag_id, name in sorted(names.items())})
+            except OSError as e:
+                logger.warning(f"Could not write tag cache {cache_path}: {e}")
+    return names
+
+
+def _merge_entries(entries: Iterable[Dict[str, Any]], max_posts: int) -> List[Dict[str, Any]]:
+    """Newest first (by publication date), one entry per link, at most `max_posts`."""
+    merged: List[Dict[str, Any]] = []
+    seen_links = set()
+    for entry in sorted(entries, key=lambda p: p.get('date', ''), reverse=True):
+        if entry['link'] in seen_links:
+            continue
+        seen_links.add(entry['link'])
+        merged.append(entry)
+    return merged[:max_posts]
+
+
+def _link_map_entry(post: Dict[str, Any], tag_names: Dict[int, str]) -> Optional[Dict[str, Any]]:
+    """Link map entry for a post from the REST API: its title and tag names as keywords."""
+    title = post.get('title', {}).get('rendered', '').strip()
+    if not title or not post.get('link'):
+        return None
+    keywords = [title]
+    for tag_id in post.get('tags', []):
+        tag_name = tag_names.get(tag_id)
+        if tag_name and tag_name not in keywords:
+            keywords.append(tag_name)
+    return {
+        "id": post.get('id'),
+        "link": post['link'],
+        "keywords": keywords,
+        "categories": post.get('categories', []),
+        "date": post.get('date', ''),
+        "modified": post.get('modified', ''),
+    }
+
+
+def build_link_map(
+    client: Any,
+    full: bool = False,
+    max_posts: int = 1000,
+    workers: int = 1,
+    json_path: str = LINK_MAP_JSON,
+    artifact_path: str = LINK_MAP_ARTIFACT,
+    tag_cache_path: str = TAG_CACHE_PATH,
+) -> int:
+    """
+    Builds or refreshes the link map JSON and its compiled artifact.
+
+    Incremental unless `full` is set or the existing map predates incremental
+    builds (no post IDs): only posts modified after the map's `last_modified` are
+    fetched and merged by ID into the existing entries. Incremental builds cannot
+    see posts that were unpublished, so run a full build now and then.
+
+    Args:
+        client: WordPressClient to fetch posts and tags with.
+        full: Rebuild from the latest `max_posts` posts and refresh the tag cache.
+        max_posts: The map keeps the newest posts up to this count.
+        workers: Concurrent page requests (see WordPressClient.get_published_posts).
+        json_path: Link map JSON.
+        artifact_path: Compiled LinkMatcher (see save_link_map_artifact).
+        tag_cache_path: Tag name cache (see resolve_tag_names).
+
+    Returns:
+        The number of posts added or updated; 0 when the files were left untouched,
+        which is also the case when a page of posts could not be fetched (merging a
+        partial result would move `last_modified` past the missing posts for good).
+    """
+    existing = None if full else _read_json(json_path)
+    entries: Dict[int, Dict[str, Any]] = {}
+    modified_after = None
+    if existing and existing.get('last_modified') and all(p.get('id') for p in existing.get('posts', [])):
+        entries = {p['id']: p for p in existing['posts']}
+        modified_after = existing['last_modified']
+        logger.info(f"Refreshing link map with posts modified after {modified_after}.")
+    else:
+        full = True
+        logger.info(f"Building link map from the latest {max_posts} posts.")
+
+    try:
+        posts = client.get_published_posts(
+            fields=LINK_MAP_POST_FIELDS, max_posts=max_posts, modified_after=modified_after, workers=workers,
+        )
+    except WordPressPublisherError as e:
+        logger.error(f"Link map not updated: {e}")
+        return 0
+    if not posts:
+        if full:
+            logger.warning("No posts were found. The link map was not changed.")
+        return 0
+
+    tag_ids = {tag_id for post in posts for tag_id in post.get('tags', [])}
+    tag_names = resolve_tag_names(client, tag_ids, tag_cache_path, refresh=full)
+
+    if full:
+        entries = {}
+    changed = 0
+    for post in posts:
+        entry = _link_map_entry(post, tag_names)
+        if entry is None or entries.get(entry['id']) == entry:
+            continue
+        entries[entry['id']] = entry
+        changed += 1
+    if not changed and not full:
+        logger.info("Link map is up to date.")
+        return 0
+
+    merged = _merge_entries(entries.values(), max_posts)
+    # WordPress dates are ISO 8601 in site time, so the string maximum is the newest one
+    last_modified = max((p.get('modified', '') for p in merged), default='')
+    if existing and existing.get('last_modified', '') > last_modified:
+        last_modified = existing['last_modified']
+    link_data = {"last_modified": last_modified, "posts": merged}
+
+    _write_json(json_path, link_data, indent=4)
+    logger.info(f"Internal link map saved to {json_path} ({len(merged)} posts, {changed} added or updated).")
+    # Precompiled keyword index loaded by the pipeline
+    try:
+        save_link_map_artifact(compile_link_map(link_data), artifact_path)
+    except OSError as e:
+        logger.error(f"Failed to write compiled link map to {artifact_path}: {e}")
+    return changed
+
+
+class LinkMapLoader:
+    """
+    Keeps the compiled link map in memory and reloads it when its files change.
+
+    Posts published by this process are kept in a small recent layer on top of the
+    compiled map (see LayeredLinkMatcher) until flush() merges them into the files.
+    """
+
+    def __init__(self, json_path: str = LINK_MAP_JSON, artifact_path: str = LINK_MAP_ARTIFACT):
+        self.json_path = json_path
+        self.artifact_path = artifact_path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[float, float]] = None
+        self._base: Optional[LinkMatcher] = None
+        self._matcher: Optional[Union[LinkMatcher, LayeredLinkMatcher]] = None
+        # Entries published since the last flush, newest first
+        self._recent: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return 0.0
+
+    def get(self) -> Optional[Union[LinkMatcher, LayeredLinkMatcher]]:
+        """
+        Returns the current matcher, or None when there is no link map.
+
+        Only two stat() calls when nothing changed.
+        """
+        stamp = (self._mtime(self.json_path), self._mtime(self.artifact_path))
+        if stamp == self._stamp:
+            return self._matcher
+        with self._lock:
+            if stamp != self._stamp:
+                self._base = self._load(*stamp)
+                self._stamp = (self._mtime(self.json_path), self._mtime(self.artifact_path))
+                self._layer()
+        return self._matcher
+
+    @property
+    def dirty(self) -> bool:
+        """True while published posts are only in memory."""
+        return bool(self._recent)
+
+    def _layer(self) -> None:
+        """Rebuilds the matcher from the base map and the recent entries (lock held)."""
+        if not self._recent:
+            self._matcher = self._base
+        elif self._base is None:
+            self._matcher = LinkMatcher(self._recent)
+        else:
+            self._matcher = LayeredLinkMatcher(self._base, LinkMatcher(self._recent, self._base.pilar_posts))
+
+    def add_published_post(
+        self,
+        post: Dict[str, Any],
+        tag_names: List[str],
+        max_keywords: Optional[int] = None,
+    ) -> bool:
+        """
+        Makes a post just published by the pipeline a link target right away.
+        Signature matches WordPressClient.on_post_created.
+
+        Only the in-memory matcher changes (a recent layer of a few keywords, no
+        rebuild of the full index and no file I/O); flush() writes the map later.
+
+        Args:
+            post: The post as returned by the REST API (id, link, title, date,
+                modified, categories).
+            tag_names: Tag names sent with the post; the title and up to
+                `max_keywords - 1` tags become its keywords.
+            max_keywords: Keywords per post (LINK_MAP_CONFIG by default).
+
+        Returns:
+            True if the post was added.
+        """
+        max_keywords = max_keywords or LINK_MAP_CONFIG['max_keywords']
+        entry = _link_map_entry(post, {})
+        if entry is None or not entry['id']:
+            return False
+        folded = {entry['keywords'][0].casefold()}
+        for name in tag_names:
+            if len(entry['keywords']) >= max_keywords:
+                break
+            name = name.strip()
+            if len(name) >= 2 and name.casefold() not in folded:
+                folded.add(name.casefold())
+                entry['keywords'].append(name)
+
+        with self._lock:
+            self._ensure_loaded()
+            self._recent = [entry] + [
+                p for p in self._recent if p['id'] != entry['id'] and p['link'] != entry['link']
+            ][:LINK_MAP_CONFIG['max_posts'] - 1]
+            self._layer()
+        logger.info(f"Post {entry['id']} is now an internal link target ({len(self._recent)} pending in the link map).")
+        return True
+
+    def _ensure_loaded(self) -> None:
+        """Loads the base map if it was never loaded (lock held)."""
+        if self._stamp is None:
+            stamp = (self._mtime(self.json_path), self._mtime(self.artifact_path))
+            self._base = self._load(*stamp)
+            self._stamp = (self._mtime(self.json_path), self._mtime(self.artifact_path))
+
+    def flush(self, max_posts: Optional[int] = None) -> int:
+        """
+        Merges the posts added since the last flush into the JSON map and its
+        artifact. Meant to run once per cycle, after the article workers are done.
+
+        Each entry replaces any entry with the same ID or link, and the map keeps
+        the newest `max_posts` posts. `last_modified` is left alone, so the next
+        incremental build still sees posts edited by others in the meantime (and then
+        rewrites these entries with WordPress's tag names).
+
+        Returns:
+            The number of posts written.
+        """
+        max_posts = max_posts or LINK_MAP_CONFIG['max_posts']
+        with self._lock:
+            recent = self._recent
+            if not recent:
+                return 0
+            link_data = _read_json(self.json_path) or {}
+            ids = {p['id'] for p in recent}
+            links = {p['link'] for p in recent}
+            entries = [
+                p for p in link_data.get('posts', [])
+                if p.get('link') and p['link'] not in links and p.get('id') not in ids
+            ]
+            link_data['posts'] = _merge_entries(recent + entries, max_posts)
+            matcher = compile_link_map(link_data)
+            try:
+                _write_json(self.json_path, link_data, indent=4)
+                save_link_map_artifact(matcher, self.artifact_path)
+            except OSError as e:
+                logger.error(f"Could not save the internal link map: {e}")
+                return 0
+            self._base = matcher
+            self._recent = []
+            self._stamp = (self._mtime(self.json_path), self._mtime(self.artifact_path))
+            self._layer()
+        logger.info(f"Saved {len(recent)} published post(s) to the internal link map ({len(matcher)} posts).")
+        return len(recent)
+
+    def _load(self, json_mtime: float, artifact_mtime: float) -> Optional[LinkMatcher]:
+        if artifact_mtime and artifact_mtime >= json_mtime:
+            matcher = load_link_map_artifact(self.artifact_path)
+            if matcher is not None:
+                logger.info(f"Loaded compiled internal link map with {len(matcher)} posts.")
+                return matcher
+        if not json_mtime:
+            logger.warning(f"Internal link map '{self.json_path}' not found. Skipping internal linking.")
+            return None
+        try:
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                matcher = compile_link_map(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Error reading '{self.json_path}': {e}. Skipping internal linking.")
+            return None
+        logger.info(f"Compiled internal link map with {len(matcher)} posts from {self.json_path}.")
+        try:
+            save_link_map_artifact(matcher, self.artifact_path)
+        except OSError as e:
+            logger.warning(f"Could not write link map artifact {self.artifact_path}: {e}")
+        return matcher
+
+
+_default_loader = LinkMapLoader()
+
+
+def get_link_map_loader() -> LinkMapLoader:
+    """Returns the process-wide LinkMapLoader for data/internal_links.*."""
+    return _default_loader
+
+
+def get_link_map() -> Optional[Union[LinkMatcher, LayeredLinkMatcher]]:
+    """Returns the process-wide compiled link map (see LinkMapLoader)."""
+    return _default_loader.get()
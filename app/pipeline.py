@@ -1,11 +1,13 @@
 import logging
-import time
+import os
 import random
+import heapq
 import json
 import re
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse, urljoin
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from .config import (
     PIPELINE_ORDER,
@@ -15,26 +17,36 @@ from .config import (
     WORDPRESS_CATEGORIES,
     CATEGORY_ALIASES, # Import the new alias map
     PIPELINE_CONFIG,
+    CONCURRENCY_CONFIG,
+    DEDUP_CONFIG,
+    AI_BATCH_CONFIG,
+    LINK_MAP_CONFIG,
 )
 from .store import Database
-from .feeds import FeedReader
-from .extractor import ContentExtractor
+from .feeds import FeedReader, published_timestamp
+from .extractor import ContentExtractor, parse_html
 from .ai_processor import AIProcessor
+from .ai_batch import BatchRunner
 from .categorizer import Categorizer
 from .wordpress import WordPressClient
 from .store import Database # Ensure Database is imported
 from .html_utils import (
-    merge_images_into_content,
+    HtmlTransformChain,
+    merge_images_pass,
     add_credit_to_figures,
-    rewrite_img_srcs_with_wp,
-    strip_credits_and_normalize_youtube,
+    rewrite_img_srcs_pass,
+    strip_credits_and_normalize_youtube_pass,
     remove_broken_image_placeholders,
     strip_naked_internal_links,
 )
 from .ai_processor import AIProcessor
-from .internal_linking import add_internal_links
+from .internal_linking import internal_links_pass
+from .link_map import LinkMapLoader, build_link_map, get_link_map_loader
 from bs4 import BeautifulSoup
 from .cleaners import clean_html_for_globo_esporte
+from .concurrency import ConcurrencyLimiter
+from .exceptions import TransientError
+from .simhash import simhash
 
 logger = logging.getLogger(__name__)
 
@@ -97,316 +109,543 @@ def is_valid_upload_candidate(url: str) -> bool:
         return False
 
 
-def run_pipeline_cycle():
-    """Executes a full cycle of the content processing pipeline."""
-    logger.info("Starting new pipeline cycle.")
+def _rewrite_request(
+    extracted_data: Dict[str, Any],
+    article_url: str,
+    feed_config: Dict[str, Any],
+    wp_client: WordPressClient,
+    article_db_id: int,
+) -> Dict[str, Any]:
+    """Arguments of AIProcessor.rewrite_content for an extracted article."""
+    main_text = extracted_data.get('content', '')
+    body_images_html = extracted_data.get('images', [])
+    return {
+        'title': extracted_data.get('title'),
+        'content_html': main_text + "\n".join(body_images_html),
+        'source_url': article_url,
+        'category': feed_config['category'],
+        'videos': extracted_data.get('videos', []),
+        'images': body_images_html,  # This is now a list of html tags, not urls
+        'tags': [],  # Tags are generated by the AI in this flow
+        'source_name': feed_config.get('source_name', ''),
+        'domain': wp_client.get_domain(),
+        'schema_original': extracted_data.get('schema_original'),
+        'article_id': article_db_id,
+    }
+
+
+def _process_article(
+    article_data: Dict[str, Any],
+    source_id: str,
+    feed_config: Dict[str, Any],
+    db: Database,
+    extractor: ContentExtractor,
+    ai_processor: AIProcessor,
+    wp_client: WordPressClient,
+    link_map: Optional[LinkMapLoader],
+    limiter: ConcurrencyLimiter,
+) -> bool:
+    """
+    Runs a single article through fetch, extraction, AI rewrite, media upload and publishing.
+
+    Safe to call from worker threads: every external resource is guarded by its own
+    slot in `limiter` ('host:<netloc>', 'gemini', 'wordpress').
+
+    Stage outputs are persisted as they complete, and transient failures (TransientError)
+    defer the article with exponential backoff, so a retry resumes where it stopped.
+
+    Returns:
+        True if the article was published, False otherwise.
+    """
+    category = feed_config['category']
+    article_db_id = article_data['db_id']
+    article_url_to_process = None
+    try:
+        article_url_to_process = _get_article_url(article_data)
+        if not article_url_to_process:
+            logger.warning(f"Skipping article {article_data.get('id')} - missing/invalid URL.")
+            db.update_article_status(article_db_id, 'FAILED', reason="Missing/invalid URL")
+            return False
+
+        # Resume from the last persisted stage, so no fetch or LLM call is repeated
+        artifacts = db.load_stage_artifacts(article_db_id)
+        last_stage = db.last_completed_stage(artifacts)
+        if last_stage:
+            logger.info(f"Resuming article DB ID {article_db_id} from stage {last_stage}.")
+        else:
+            logger.info(f"Processing article: {article_data.get('title', 'N/A')} (DB ID: {article_db_id}) from {source_id}")
+            db.update_article_status(article_db_id, 'PROCESSING')
+
+        # Step 1: Fetch
+        html_content = None
+        if 'FETCHED' in artifacts:
+            html_content = artifacts['FETCHED'].get('html')
+        elif not artifacts:
+            with limiter.limit_host(article_url_to_process):
+                html_content = extractor._fetch_html(article_url_to_process)
+            if not html_content:
+                db.update_article_status(article_db_id, 'FAILED', reason="Failed to fetch HTML")
+                return False
+            db.save_stage_artifact(article_db_id, 'FETCHED', {'html': html_content})
+
+        # Step 1.1: Extract
+        extracted_data = artifacts.get('EXTRACTED')
+        if extracted_data is None:
+            # Parse once: the domain cleaner and every extraction step share this tree
+            soup = parse_html(html_content)
+            domain = urlparse(article_url_to_process).netloc.lower()
+
+            # Clean the soup based on the domain
+            for cleaner_domain, cleaner_func in CLEANER_FUNCTIONS.items():
+                if cleaner_domain in domain:
+                    soup = cleaner_func(soup)
+                    logger.info(f"Applied cleaner for {cleaner_domain}")
+                    break
+
+            extracted_data = extractor.extract(soup, url=article_url_to_process)
+            logger.info(f"Extracted data for {article_url_to_process}: {json.dumps(extracted_data, indent=2, ensure_ascii=False)}") # DEBUG LOG
+            if not extracted_data or not extracted_data.get('content'):
+                logger.warning(f"Failed to extract content from {article_url_to_process}")
+                db.update_article_status(article_db_id, 'FAILED', reason="Extraction failed")
+                return False
+            db.save_stage_artifact(article_db_id, 'EXTRACTED', extracted_data)
+
+        # Step 1.2: Skip stories already covered from another source (before spending Gemini quota)
+        rewritten_data = artifacts.get('REWRITTEN')
+        if rewritten_data is None and DEDUP_CONFIG['enabled']:
+            fingerprint = simhash(
+                f"{extracted_data.get('title', '')}\n{extracted_data.get('content', '')}",
+                min_tokens=DEDUP_CONFIG['min_words'],
+            )
+            if fingerprint is not None:
+                duplicate_of = db.claim_story_fingerprint(
+                    article_db_id, fingerprint,
+                    max_distance=DEDUP_CONFIG['max_distance'],
+                    window_hours=DEDUP_CONFIG['window_hours'],
+                )
+                if duplicate_of:
+                    # Already marked DUPLICATE by the claim; requeued if the original fails
+                    logger.info(f"Article DB ID {article_db_id} is a near-duplicate of {duplicate_of}; skipping.")
+                    return False
+
+        # Step 2: Rewrite content with AI
+        if rewritten_data is None:
+            with limiter.limit('gemini'):
+                rewritten_data, failure_reason = ai_processor.rewrite_content(
+                    **_rewrite_request(extracted_data, article_url_to_process, feed_config, wp_client, article_db_id)
+                )
+
+            if not rewritten_data:
+                # Exhausted keys raise AllKeysFailedError (a TransientError) and are deferred below
+                reason = failure_reason or "AI processing failed"
+                logger.warning(f"Article '{article_data.get('title', 'N/A')}' marked as FAILED (Reason: {reason}). Continuing to next article.")
+                db.update_article_status(article_db_id, 'FAILED', reason=reason)
+                return False
+
+            # Step 3: Validate AI output before persisting it
+            if not rewritten_data.get("titulo_final", "").strip() or not rewritten_data.get("conteudo_final", "").strip():
+                logger.error(f"AI output for {article_url_to_process} missing required fields (titulo_final/conteudo_final).")
+                db.update_article_status(article_db_id, 'FAILED', reason="AI output missing required fields")
+                return False
+            db.save_stage_artifact(article_db_id, 'REWRITTEN', rewritten_data)
+
+        title = rewritten_data.get("titulo_final", "").strip()
+        content_html = rewritten_data.get("conteudo_final", "").strip()
+
+        # Step 3.1: HTML Processing and Cleanup
+        # Defensive cleanup of common AI errors (e.g., leftover placeholders)
+        content_html = remove_broken_image_placeholders(content_html)
+        content_html = strip_naked_internal_links(content_html)
+
+        # The DOM passes (3.2, 3.4, 3.5 and step 4) are collected here and run on a
+        # single parse once the categories are known, right before the payload is built
+        html_chain = HtmlTransformChain()
+
+        # 3.2: Ensure images from original article exist in content, injecting if AI removed them
+        html_chain.add('merge_images', merge_images_pass, extracted_data.get('images', []))
+
+        # 3.3: Upload ONLY the featured image if it's valid
+        urls_to_upload = []
+        featured_image_to_upload = None
+        original_featured_url = extracted_data.get('featured_image_url')
+        DEFAULT_FALLBACK_IMAGE_URL = "https://aeconomia.news/wp-content/uploads/2025/10/Business-Success.jpg"
+        VALOR_LOGO_URL = "https://s3.glbimg.com/v1/AUTH_63b422c2caee4269b8b34177e8876b93/public/fb_marca.png"
+        G1_LOGO_URL = "https://s.glbimg.com/jo/g1/static/live/imagens/img_facebook.png?g1"
+
+        # Check for the specific Valor logo URL first
+        if original_featured_url == VALOR_LOGO_URL:
+            logger.info("Valor default logo detected. Using fallback image.")
+            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
+        elif original_featured_url == G1_LOGO_URL:
+            logger.info("G1 default logo detected. Using fallback image.")
+            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
+        elif original_featured_url and is_valid_upload_candidate(original_featured_url):
+            featured_image_to_upload = original_featured_url
+            logger.info(f"Valid featured image found, preparing for upload: {featured_image_to_upload}")
+        else:
+            logger.info("No valid featured image found or image is invalid. Using default fallback image.")
+            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
+
+        if featured_image_to_upload:
+            urls_to_upload.append(featured_image_to_upload)
+
+        uploaded_src_map = {}
+        uploaded_id_map = {}
+        logger.info(f"Attempting to upload {len(urls_to_upload)} image(s).")
+        for url in urls_to_upload:
+            with limiter.limit('wordpress'):
+                media = wp_client.upload_media_from_url(url, title)
+            if media and media.get("source_url") and media.get("id"):
+                k = url.rstrip('/')
+                uploaded_src_map[k] = media["source_url"]
+                uploaded_id_map[k] = media["id"]
+
+        # 3.4: Rewrite image `src` to point to WordPress
+        html_chain.add('rewrite_img_srcs', rewrite_img_srcs_pass, uploaded_src_map)
+
+        # 3.5: Add credits to figures (currently disabled)
+        # content_html = add_credit_to_figures(content_html, extracted_data['source_url'])
+
+        # Só player do YouTube (oEmbed) e sem “Crédito: …”
+        html_chain.add('strip_credits_youtube', strip_credits_and_normalize_youtube_pass)
+
+        # Step 5: Prepare payload for WordPress
+
+        # 5.1: Combine fixed and AI-suggested categories
+        FIXED_CATEGORY_IDS = {1} # Notícias
+
+        final_category_ids = set(FIXED_CATEGORY_IDS)
+
+        # Get category from feed config (the main one)
+        main_category_id = WORDPRESS_CATEGORIES.get(category)
+        if main_category_id:
+            final_category_ids.add(main_category_id)
+
+        # Get AI suggested categories
+        suggested_categories = rewritten_data.get('categorias', [])
+        if suggested_categories and isinstance(suggested_categories, list):
+            suggested_names = [cat['nome'] for cat in suggested_categories if isinstance(cat, dict) and 'nome' in cat]
+
+            # Normalize category names using aliases
+            normalized_names = []
+            for name in suggested_names:
+                canonical_name = CATEGORY_ALIASES.get(name.lower(), name)
+                normalized_names.append(canonical_name)
+
+            if suggested_names != normalized_names:
+                logger.info(f"Normalized category names: {suggested_names} -> {normalized_names}")
+
+            if normalized_names:
+                logger.info(f"Resolving AI-suggested category names: {normalized_names}")
+                with limiter.limit('wordpress'):
+                    dynamic_category_ids = wp_client.resolve_category_names_to_ids(normalized_names)
+                if dynamic_category_ids:
+                    final_category_ids.update(dynamic_category_ids)
+
+        # Step 4: Add internal links (now in the correct place)
+        # Read at this point so posts published earlier in the cycle are link targets
+        link_matcher = link_map.get() if link_map else None
+        if link_matcher:
+            logger.info("Attempting to add internal links with prioritization...")
+            html_chain.add('internal_links', internal_links_pass, link_matcher, list(final_category_ids))
+
+        content_html = html_chain.run(content_html)
+
+        # Add credit line at the end of the post
+        source_name = feed_config.get('source_name', urlparse(article_url_to_process).netloc)
+        credit_line = f'<p><strong>Fonte:</strong> <a href="{article_url_to_process}" target="_blank" rel="noopener noreferrer">{source_name}</a></p>'
+        content_html += f"\n{credit_line}"
+
+        # 5.2: Determine featured media ID
+        featured_media_id = None
+        if featured_image_to_upload:
+            k = featured_image_to_upload.rstrip('/')
+            featured_media_id = uploaded_id_map.get(k)
+
+        if not featured_media_id and uploaded_id_map:
+            logger.warning("Could not find the intended featured image in the uploaded map. Using the first available image as a fallback.")
+            featured_media_id = next(iter(uploaded_id_map.values()), None)
+
+        # 5.3: Set alt text for uploaded images
+        focus_kw = rewritten_data.get("focus_keyphrase", "")
+        # The AI is asked to provide a dict like: { "filename.jpg": "alt text" }
+        alt_map = rewritten_data.get("image_alt_texts", {})
+
+        if uploaded_id_map and (alt_map or focus_kw):
+            logger.info("Setting alt text for uploaded images.")
+            for original_url, media_id in uploaded_id_map.items():
+                # Extract filename from the original URL to match keys in alt_map
+                filename = urlparse(original_url).path.split('/')[-1]
+
+                # Try to get specific alt text from AI, fallback to a generic one
+                alt_text = alt_map.get(filename)
+                if not alt_text and focus_kw:
+                    alt_text = f"{focus_kw} — foto ilustrativa"
+
+                if alt_text:
+                    with limiter.limit('wordpress'):
+                        wp_client.set_media_alt_text(media_id, alt_text)
+
+        # 5.4: Prepare Yoast meta, including canonical URL to original source
+        yoast_meta = rewritten_data.get('yoast_meta', {})
+        yoast_meta['_yoast_wpseo_canonical'] = article_url_to_process
+
+        # Add related keyphrases if present
+        related_kws = rewritten_data.get('related_keyphrases')
+        if isinstance(related_kws, list) and related_kws:
+            # Yoast stores this as a JSON string of objects: [{"keyword": "phrase"}, ...]
+            yoast_meta['_yoast_wpseo_keyphrases'] = json.dumps([{"keyword": kw} for kw in related_kws])
+
+        post_payload = {
+            'title': title,
+            'slug': rewritten_data.get('slug'),
+            'content': content_html,
+            'excerpt': rewritten_data.get('meta_description', ''),
+            'categories': list(final_category_ids),
+            'tags': rewritten_data.get('tags_sugeridas', []),
+            'featured_media': featured_media_id,
+            'meta': yoast_meta,
+        }
+
+        with limiter.limit('wordpress'):
+            wp_post_id = wp_client.create_post(post_payload)
+
+        if wp_post_id:
+            db.save_processed_post(article_db_id, wp_post_id)
+            logger.info(f"Successfully published post {wp_post_id} for article DB ID {article_db_id}")
+            return True
+
+        logger.error(f"Failed to publish post for {article_url_to_process}")
+        db.update_article_status(article_db_id, 'FAILED', reason="WordPress publishing failed")
+        return False
 
-    # Load the internal link map once per cycle
-    link_map = {}
+    except TransientError as e:
+        # 429s, timeouts and 5xx: retry later from the last persisted stage
+        new_status = db.defer_article(article_db_id, str(e))
+        logger.warning(f"Transient failure for {article_url_to_process or article_db_id} → {new_status}: {e}")
+        return False
+
+    except Exception as e:
+        logger.error(f"Error processing article {article_url_to_process or article_data.get('title', 'N/A')}: {e}", exc_info=True)
+        db.update_article_status(article_db_id, 'FAILED', reason=str(e))
+        return False
+
+
+def _discover_source(source_id: str, feed_config: Dict[str, Any], feed_reader: FeedReader, db: Database) -> Dict[int, str]:
+    """
+    Reads one source's feeds and registers unseen items as NEW.
+
+    Honors the per-source circuit breaker. Safe to run for several sources at once.
+
+    Returns:
+        The titles of the newly registered articles, keyed by their DB id.
+    """
+    consecutive_failures = db.get_consecutive_failures(source_id)
+    if consecutive_failures >= 3:
+        logger.warning(f"Circuit open for feed {source_id} ({consecutive_failures} fails) → skipping discovery this round.")
+        # Reset for the next cycle as per prompt "zere o contador na próxima"
+        db.reset_consecutive_failures(source_id)
+        return {}
+
+    logger.info(f"Processing feed: {source_id} (Category: {feed_config['category']})")
     try:
-        with open('data/internal_links.json', 'r', encoding='utf-8') as f:
-            link_map = json.load(f)
-        if link_map:
-            logger.info(f"Successfully loaded internal link map with {len(link_map)} terms.")
-    except FileNotFoundError:
-        logger.warning("Internal link map 'data/internal_links.json' not found. Skipping internal linking.")
-    except json.JSONDecodeError:
-        logger.error("Error decoding 'data/internal_links.json'. Skipping internal linking.")
+        feed_items = feed_reader.read_feeds(feed_config, source_id)
+        new_articles = db.filter_new_articles(source_id, feed_items)
+        if new_articles is None:
+            # Nothing was registered: keep the old validators so the next poll reads the feed again
+            logger.warning(f"Could not register items of {source_id}; the feed will be read again next cycle.")
+            feed_reader.discard_feed_state(source_id)
+            return {}
+        feed_reader.commit_feed_state(source_id)
+        # If we reach here without a feed-level exception, the processing was successful
+        db.reset_consecutive_failures(source_id)
+    except Exception as e:
+        logger.error(f"Error processing feed {source_id}: {e}", exc_info=True)
+        db.increment_consecutive_failures(source_id)
+        return {}
+
+    if new_articles:
+        logger.info(f"Found {len(new_articles)} new articles for {source_id}")
+    else:
+        logger.info(f"No new articles found for {source_id}.")
+    return {a['db_id']: a.get('title') for a in new_articles}
+
+
+def _build_work_queue(db: Database, sources: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple]:
+    """
+    Collects the due work of every source into one heap.
+
+    Interrupted and DEFERRED articles come first (part of their work is already done),
+    then everything else by publish time, newest first, whichever feed it came from.
+    Each source still contributes at most `max_articles_per_feed` articles.
+    """
+    queue: List[Tuple] = []
+    limit = SCHEDULE_CONFIG.get('max_articles_per_feed', 3)
+    for source_id, feed_config in sources:
+        for row in db.get_articles_to_process(source_id, limit):
+            priority = (
+                1 if row['status'] == 'NEW' else 0,
+                -published_timestamp(row['published_at']),
+                row['id'],
+            )
+            heapq.heappush(queue, (priority, source_id, row))
+    return queue
+
+
+def _run_batch_backlog(db: Database, batch_runner: BatchRunner, wp_client: WordPressClient) -> None:
+    """
+    Applies finished batch jobs, then sends the rewrite backlog to new batch jobs
+    once it reaches AI_BATCH_CONFIG['backlog_threshold'] articles.
+    """
+    rewritten = batch_runner.poll()
+    if rewritten:
+        logger.info(f"{rewritten} articles rewritten by batch jobs are ready to publish.")
+
+    backlog = db.get_rewrite_backlog(AI_BATCH_CONFIG['max_batch_size'] * AI_BATCH_CONFIG['max_jobs_per_cycle'])
+    if len(backlog) < AI_BATCH_CONFIG['backlog_threshold']:
+        return
+    batch_items = []
+    for row in backlog:
+        feed_config = RSS_FEEDS.get(row['source_id'])
+        extracted_data = db.load_stage_artifacts(row['id']).get('EXTRACTED')
+        if feed_config and extracted_data:
+            batch_items.append((row['id'], _rewrite_request(extracted_data, row['url'], feed_config, wp_client, row['id'])))
+    logger.info(f"Rewrite backlog of {len(backlog)} articles: switching them to batch mode.")
+    batch_runner.submit(batch_items)
+
+
+def run_pipeline_cycle():
+    """
+    Executes a full cycle of the content processing pipeline.
+
+    All sources are first polled in parallel (CONCURRENCY_CONFIG['discovery_workers']);
+    the due articles of every source then go through one queue ordered by publish time,
+    so the newest story is rewritten first whichever feed it came from.
+
+    With CONCURRENCY_CONFIG['max_workers'] > 1 the articles of every feed are handed
+    to a bounded thread pool and go through the stages concurrently, throttled by the
+    per-host and per-API limits instead of global sleeps. Otherwise the articles are
+    processed one at a time, as before.
+
+    With AI_BATCH_CONFIG['enabled'], a large rewrite backlog is sent to Gemini batch
+    jobs (see ai_batch) instead, and finished jobs are applied before the work queue
+    is built.
+    """
+    logger.info("Starting new pipeline cycle.")
 
     db = Database()
-    feed_reader = FeedReader(user_agent=PIPELINE_CONFIG.get('publisher_name', 'Bot'))
+    limiter = ConcurrencyLimiter(
+        limits={
+            'gemini': CONCURRENCY_CONFIG.get('gemini', 1),
+            'wordpress': CONCURRENCY_CONFIG.get('wordpress', 2),
+        },
+        per_host_limit=CONCURRENCY_CONFIG.get('per_host', 2),
+    )
+    discovery_workers = max(1, CONCURRENCY_CONFIG.get('discovery_workers', 8))
+    feed_reader = FeedReader(
+        user_agent=PIPELINE_CONFIG.get('publisher_name', 'Bot'),
+        db=db,
+        limiter=limiter,
+        pool_size=discovery_workers,
+    )
     extractor = ContentExtractor()
-    wp_client = WordPressClient(config=WORDPRESS_CONFIG, categories_map=WORDPRESS_CATEGORIES)
-    ai_processor = AIProcessor()
+    # Compiled link map: loaded once per process, reloaded only when the files change,
+    # and extended in place with every post this pipeline publishes
+    link_map = get_link_map_loader()
+    wp_client = WordPressClient(
+        config=WORDPRESS_CONFIG,
+        categories_map=WORDPRESS_CATEGORIES,
+        on_post_created=link_map.add_published_post if LINK_MAP_CONFIG['live_updates'] else None,
+    )
+    if LINK_MAP_CONFIG['refresh_each_cycle'] and os.path.exists(link_map.json_path):
+        # Incremental: only posts modified since the last build are fetched
+        try:
+            build_link_map(wp_client, max_posts=LINK_MAP_CONFIG['max_posts'],
+                           workers=LINK_MAP_CONFIG['page_workers'],
+                           json_path=link_map.json_path, artifact_path=link_map.artifact_path)
+        except Exception as e:
+            logger.warning(f"Could not refresh the internal link map: {e}")
+    ai_processor = AIProcessor(db=db)
+    batch_runner = BatchRunner(db, ai_processor) if AI_BATCH_CONFIG['enabled'] else None
+
+    max_workers = CONCURRENCY_CONFIG.get('max_workers', 1)
+    executor = None
+    if max_workers > 1:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='article')
+        logger.info(f"Concurrent mode enabled with {max_workers} article workers.")
+    pending = []
 
     processed_articles_in_cycle = 0
 
-    try:
-        for i, source_id in enumerate(PIPELINE_ORDER):
-            # Check circuit breaker before processing
-            consecutive_failures = db.get_consecutive_failures(source_id)
-            if consecutive_failures >= 3:
-                logger.warning(f"Circuit open for feed {source_id} ({consecutive_failures} fails) → skipping this round.")
-                # Reset for the next cycle as per prompt "zere o contador na próxima"
-                db.reset_consecutive_failures(source_id)
-                continue
+    def _dispatch(article_data: Dict[str, Any], source_id: str, feed_config: Dict[str, Any]) -> None:
+        nonlocal processed_articles_in_cycle
+        args = (article_data, source_id, feed_config, db, extractor, ai_processor, wp_client, link_map, limiter)
+        if executor:
+            pending.append(executor.submit(_process_article, *args))
+        # No fixed per-article sleep: each stage waits on its own token
+        # bucket (per Gemini key, WordPress endpoint and source host).
+        elif _process_article(*args):
+            processed_articles_in_cycle += 1
 
+    try:
+        sources = []
+        for source_id in PIPELINE_ORDER:
             feed_config = RSS_FEEDS.get(source_id)
             if not feed_config:
                 logger.warning(f"No configuration found for feed source: {source_id}")
                 continue
+            sources.append((source_id, feed_config))
+
+        # Discovery: poll every source at once (per-host limits still apply)
+        titles: Dict[int, str] = {}
+        with ThreadPoolExecutor(max_workers=min(discovery_workers, max(1, len(sources))),
+                                thread_name_prefix='discovery') as discovery_pool:
+            futures = [
+                discovery_pool.submit(_discover_source, source_id, feed_config, feed_reader, db)
+                for source_id, feed_config in sources
+            ]
+            for future in futures:
+                titles.update(future.result())
+
+        if batch_runner:
+            _run_batch_backlog(db, batch_runner, wp_client)
+
+        # Work: due DEFERRED retries, interrupted stages and fresh NEW articles from all
+        # sources, newest first, pulled from the indexed queue rather than from the feeds
+        work_queue = _build_work_queue(db, sources)
+        logger.info(f"Discovery finished: {len(work_queue)} articles queued across {len(sources)} sources.")
+        while work_queue:
+            _, source_id, row = heapq.heappop(work_queue)
+            article_data = {
+                'db_id': row['id'],
+                'id': row['external_id'],
+                'url': row['url'],
+                'title': titles.get(row['id'], 'N/A'),
+            }
+            if row['status'] != 'NEW':
+                logger.info(f"Retrying article DB ID {row['id']} from {source_id} (status {row['status']}).")
+            _dispatch(article_data, source_id, RSS_FEEDS[source_id])
+
+        for future in as_completed(pending):
+            if future.result():
+                processed_articles_in_cycle += 1
 
-            category = feed_config['category']
-            logger.info(f"Processing feed: {source_id} (Category: {category})")
-
+    finally:
+        try:
+            if executor:
+                executor.shutdown(wait=True)
+            # Posts published this cycle were link targets in memory; write them out once
             try:
-                feed_items = feed_reader.read_feeds(feed_config, source_id)
-                new_articles = db.filter_new_articles(source_id, feed_items)
-
-                if not new_articles:
-                    logger.info(f"No new articles found for {source_id}.")
-                    continue
-
-                logger.info(f"Found {len(new_articles)} new articles for {source_id}")
-
-                for article_data in new_articles[:SCHEDULE_CONFIG.get('max_articles_per_feed', 3)]:
-                    article_db_id = article_data['db_id']
-                    try:
-                        article_url_to_process = _get_article_url(article_data)
-                        if not article_url_to_process:
-                            logger.warning(f"Skipping article {article_data.get('id')} - missing/invalid URL.")
-                            db.update_article_status(article_db_id, 'FAILED', reason="Missing/invalid URL")
-                            continue
-
-                        logger.info(f"Processing article: {article_data.get('title', 'N/A')} (DB ID: {article_db_id}) from {source_id}")
-                        db.update_article_status(article_db_id, 'PROCESSING')
-                        
-                        html_content = extractor._fetch_html(article_url_to_process)
-                        if not html_content:
-                            db.update_article_status(article_db_id, 'FAILED', reason="Failed to fetch HTML")
-                            continue
-
-                        soup = BeautifulSoup(html_content, 'lxml')
-                        domain = urlparse(article_url_to_process).netloc.lower()
-                        
-                        # Clean the soup based on the domain
-                        for cleaner_domain, cleaner_func in CLEANER_FUNCTIONS.items():
-                            if cleaner_domain in domain:
-                                soup = cleaner_func(soup)
-                                logger.info(f"Applied cleaner for {cleaner_domain}")
-                                break
-
-                        extracted_data = extractor.extract(str(soup), url=article_url_to_process)
-                        logger.info(f"Extracted data for {article_url_to_process}: {json.dumps(extracted_data, indent=2, ensure_ascii=False)}") # DEBUG LOG
-                        if not extracted_data or not extracted_data.get('content'):
-                            logger.warning(f"Failed to extract content from {article_data['url']}")
-                            db.update_article_status(article_db_id, 'FAILED', reason="Extraction failed")
-                            continue
-
-                        main_text = extracted_data.get('content', '')
-                        body_images_html = extracted_data.get('images', [])
-                        content_for_ai = main_text + "\n".join(body_images_html)
-
-                        # Step 2: Rewrite content with AI
-                        rewritten_data, failure_reason = ai_processor.rewrite_content(
-                            title=extracted_data.get('title'),
-                            content_html=content_for_ai,
-                            source_url=article_url_to_process,
-                            category=category,
-                            videos=extracted_data.get('videos', []),
-                            images=extracted_data.get('images', []), # This is now a list of html tags, not urls
-                            tags=[],  # Tags are generated by the AI in this flow
-                            source_name=feed_config.get('source_name', ''),
-                            domain=wp_client.get_domain(),
-                            schema_original=extracted_data.get('schema_original')
-                        )
-
-                        if not rewritten_data:
-                            reason = failure_reason or "AI processing failed"
-                            # Check for the specific case where the key pool for the category is exhausted
-                            if "pool is exhausted" in reason:
-                                logger.warning(
-                                    f"{feed_config['category']} pool exhausted → marking article FAILED → moving on."
-                                )
-                            else:
-                                logger.warning(f"Article '{article_data.get('title', 'N/A')}' marked as FAILED (Reason: {reason}). Continuing to next article.")
-                            db.update_article_status(article_db_id, 'FAILED', reason=reason)
-                            continue
-
-                        # Step 3: Validate AI output and prepare content
-                        title = rewritten_data.get("titulo_final", "").strip()
-                        content_html = rewritten_data.get("conteudo_final", "").strip()
-
-                        if not title or not content_html:
-                            logger.error(f"AI output for {article_url_to_process} missing required fields (titulo_final/conteudo_final).")
-                            db.update_article_status(article_db_id, 'FAILED', reason="AI output missing required fields")
-                            continue
-
-                        # Step 3.1: HTML Processing and Cleanup
-                        # Defensive cleanup of common AI errors (e.g., leftover placeholders)
-                        content_html = remove_broken_image_placeholders(content_html)
-                        content_html = strip_naked_internal_links(content_html)
-
-                        # 3.2: Ensure images from original article exist in content, injecting if AI removed them
-                        content_html = merge_images_into_content(
-                            content_html,
-                            extracted_data.get('images', [])
-                        )
-                        
-                        # 3.3: Upload ONLY the featured image if it's valid
-                        urls_to_upload = []
-                        featured_image_to_upload = None
-                        original_featured_url = extracted_data.get('featured_image_url')
-                        DEFAULT_FALLBACK_IMAGE_URL = "https://aeconomia.news/wp-content/uploads/2025/10/Business-Success.jpg"
-                        VALOR_LOGO_URL = "https://s3.glbimg.com/v1/AUTH_63b422c2caee4269b8b34177e8876b93/public/fb_marca.png"
-                        G1_LOGO_URL = "https://s.glbimg.com/jo/g1/static/live/imagens/img_facebook.png?g1"
-
-                        # Check for the specific Valor logo URL first
-                        if original_featured_url == VALOR_LOGO_URL:
-                            logger.info("Valor default logo detected. Using fallback image.")
-                            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
-                        elif original_featured_url == G1_LOGO_URL:
-                            logger.info("G1 default logo detected. Using fallback image.")
-                            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
-                        elif original_featured_url and is_valid_upload_candidate(original_featured_url):
-                            featured_image_to_upload = original_featured_url
-                            logger.info(f"Valid featured image found, preparing for upload: {featured_image_to_upload}")
-                        else:
-                            logger.info("No valid featured image found or image is invalid. Using default fallback image.")
-                            featured_image_to_upload = DEFAULT_FALLBACK_IMAGE_URL
-
-                        if featured_image_to_upload:
-                            urls_to_upload.append(featured_image_to_upload)
-
-                        uploaded_src_map = {}
-                        uploaded_id_map = {}
-                        logger.info(f"Attempting to upload {len(urls_to_upload)} image(s).")
-                        for url in urls_to_upload:
-                            media = wp_client.upload_media_from_url(url, title)
-                            if media and media.get("source_url") and media.get("id"):
-                                k = url.rstrip('/')
-                                uploaded_src_map[k] = media["source_url"]
-                                uploaded_id_map[k] = media["id"]
-                        
-                        # 3.4: Rewrite image `src` to point to WordPress
-                        content_html = rewrite_img_srcs_with_wp(content_html, uploaded_src_map)
-
-                        # 3.5: Add credits to figures (currently disabled)
-                        # content_html = add_credit_to_figures(content_html, extracted_data['source_url'])
-
-                        # Só player do YouTube (oEmbed) e sem “Crédito: …”
-                        content_html = strip_credits_and_normalize_youtube(content_html)
-                        
-                        # Add credit line at the end of the post
-                        source_name = RSS_FEEDS.get(source_id, {}).get('source_name', urlparse(article_url_to_process).netloc)
-                        credit_line = f'<p><strong>Fonte:</strong> <a href="{article_url_to_process}" target="_blank" rel="noopener noreferrer">{source_name}</a></p>'
-                        content_html += f"\n{credit_line}"
-
-                        # Step 5: Prepare payload for WordPress
-
-                        # 5.1: Combine fixed and AI-suggested categories
-                        FIXED_CATEGORY_IDS = {1} # Notícias
-                        
-                        final_category_ids = set(FIXED_CATEGORY_IDS)
-
-                        # Get category from feed config (the main one)
-                        main_category_id = WORDPRESS_CATEGORIES.get(category)
-                        if main_category_id:
-                            final_category_ids.add(main_category_id)
-
-                        # Get AI suggested categories
-                        suggested_categories = rewritten_data.get('categorias', [])
-                        if suggested_categories and isinstance(suggested_categories, list):
-                            suggested_names = [cat['nome'] for cat in suggested_categories if isinstance(cat, dict) and 'nome' in cat]
-                            
-                            # Normalize category names using aliases
-                            normalized_names = []
-                            for name in suggested_names:
-                                canonical_name = CATEGORY_ALIASES.get(name.lower(), name)
-                                normalized_names.append(canonical_name)
-                            
-                            if suggested_names != normalized_names:
-                                logger.info(f"Normalized category names: {suggested_names} -> {normalized_names}")
-
-                            if normalized_names:
-                                logger.info(f"Resolving AI-suggested category names: {normalized_names}")
-                                dynamic_category_ids = wp_client.resolve_category_names_to_ids(normalized_names)
-                                if dynamic_category_ids:
-                                    final_category_ids.update(dynamic_category_ids)
-
-                        # Step 4: Add internal links (now in the correct place)
-                        if link_map:
-                            logger.info("Attempting to add internal links with prioritization...")
-                            content_html = add_internal_links(
-                                html_content=content_html,
-                                link_map_data=link_map,
-                                current_post_categories=list(final_category_ids)
-                            )
-
-                        # 5.2: Determine featured media ID
-                        featured_media_id = None
-                        if featured_image_to_upload:
-                            k = featured_image_to_upload.rstrip('/')
-                            featured_media_id = uploaded_id_map.get(k)
-
-                        if not featured_media_id and uploaded_id_map:
-                            logger.warning("Could not find the intended featured image in the uploaded map. Using the first available image as a fallback.")
-                            featured_media_id = next(iter(uploaded_id_map.values()), None)
-
-                        # 5.3: Set alt text for uploaded images
-                        focus_kw = rewritten_data.get("focus_keyphrase", "")
-                        # The AI is asked to provide a dict like: { "filename.jpg": "alt text" }
-                        alt_map = rewritten_data.get("image_alt_texts", {})
-
-                        if uploaded_id_map and (alt_map or focus_kw):
-                            logger.info("Setting alt text for uploaded images.")
-                            for original_url, media_id in uploaded_id_map.items():
-                                # Extract filename from the original URL to match keys in alt_map
-                                filename = urlparse(original_url).path.split('/')[-1]
-
-                                # Try to get specific alt text from AI, fallback to a generic one
-                                alt_text = alt_map.get(filename)
-                                if not alt_text and focus_kw:
-                                    alt_text = f"{focus_kw} — foto ilustrativa"
-
-                                if alt_text:
-                                    wp_client.set_media_alt_text(media_id, alt_text)
-
-                        # 5.4: Prepare Yoast meta, including canonical URL to original source
-                        yoast_meta = rewritten_data.get('yoast_meta', {})
-                        yoast_meta['_yoast_wpseo_canonical'] = article_url_to_process
-
-                        # Add related keyphrases if present
-                        related_kws = rewritten_data.get('related_keyphrases')
-                        if isinstance(related_kws, list) and related_kws:
-                            # Yoast stores this as a JSON string of objects: [{"keyword": "phrase"}, ...]
-                            yoast_meta['_yoast_wpseo_keyphrases'] = json.dumps([{"keyword": kw} for kw in related_kws])
-
-                        post_payload = {
-                            'title': title,
-                            'slug': rewritten_data.get('slug'),
-                            'content': content_html,
-                            'excerpt': rewritten_data.get('meta_description', ''),
-                            'categories': list(final_category_ids),
-                            'tags': rewritten_data.get('tags_sugeridas', []),
-                            'featured_media': featured_media_id,
-                            'meta': yoast_meta,
-                        }
-
-                        wp_post_id = wp_client.create_post(post_payload)
-
-                        if wp_post_id:
-                            db.save_processed_post(article_db_id, wp_post_id)
-                            logger.info(f"Successfully published post {wp_post_id} for article DB ID {article_db_id}")
-                            processed_articles_in_cycle += 1
-                        else:
-                            logger.error(f"Failed to publish post for {article_url_to_process}")
-                            db.update_article_status(article_db_id, 'FAILED', reason="WordPress publishing failed")
-
-                        # Per-article delay to respect API rate limits.
-                        delay = 120
-                        logger.info(f"Sleeping for {delay}s (per-article delay).")
-                        time.sleep(delay)
-
-                    except Exception as e:
-                        logger.error(f"Error processing article {article_url_to_process or article_data.get('title', 'N/A')}: {e}", exc_info=True)
-                        db.update_article_status(article_db_id, 'FAILED', reason=str(e))
-
-                # If we reach here without a feed-level exception, the processing was successful
-                db.reset_consecutive_failures(source_id)
-
+                link_map.flush()
             except Exception as e:
-                logger.error(f"Error processing feed {source_id}: {e}", exc_info=True)
-                db.increment_consecutive_failures(source_id)
-
-            # Per-feed delay before processing the next source
-            if i < len(PIPELINE_ORDER) - 1:
-                next_feed = PIPELINE_ORDER[i + 1]
-                delay = SCHEDULE_CONFIG.get('per_feed_delay_seconds', 15)
-                logger.info(f"Finished feed '{source_id}'. Sleeping for {delay}s before next feed: {next_feed}")
-                time.sleep(delay)
-
-    finally:
-        logger.info(f"Pipeline cycle completed. Processed {processed_articles_in_cycle} articles.")
-        db.close()
-        wp_client.close()
\ No newline at end of file
+                logger.error(f"Failed to save the internal link map: {e}", exc_info=True)
+            logger.info(f"Pipeline cycle completed. Processed {processed_articles_in_cycle} articles.")
+            if ai_processor.response_archive:
+                try:
+                    ai_processor.response_archive.flush()
+                except Exception as e:
+                    logger.error(f"Failed to flush the AI response archive: {e}", exc_info=True)
+        finally:
+            # Flushes the write-behind journal; must run even if the steps above fail
+            db.close()
+            wp_client.close()
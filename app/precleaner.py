@@ -0,0 +1,246 @@
+"""
+Single-pass removal of widgets, ads and related-content blocks before extraction.
+
+All removal rules are compiled once into a PreCleaner: simple selectors (tag, .class,
+#id, [attr], [class*=...], [id*=...]) become set lookups and one regex per attribute;
+anything more complex falls back to a precompiled soupsieve matcher. The document is
+then walked once, every rule is checked per element, and the marked nodes are removed
+at the end, so the result does not depend on the order the rules are declared in.
+"""
+
+import logging
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import soupsieve as sv
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+LEIA_HEADING_RE = re.compile(r"(leia também|veja também|relacionad[oa]s|recomendad[oa]s|tópicos relacionados)", re.I)
+HEADING_TAG_RE = re.compile(r"^h[1-6]$")
+
+# Site-specific rules for related content
+SITE_SPECIFIC_RELATED_SELECTORS: Dict[str, List[str]] = {
+    "infomoney.com.br": [
+        ".single__related", ".article__related", ".post-related", ".related-posts",
+        ".rm-related", ".block-related", ".single__sidebar", ".article__sidebar",
+        "section.single__see-also", ".wp-block-infomoney-blocks-infomoney-read-more",
+    ],
+    "estadao.com.br": [
+        ".links-relacionados", ".mat-relacionadas", ".es-relacionadas",
+        ".stories-related", ".see-also", ".link-relacionado", ".box-relacionadas",
+    ],
+}
+
+# Merged list from original and user suggestions for more robust cleaning
+GENERIC_REMOVAL_SELECTORS: Tuple[str, ...] = (
+    # User-suggested selectors for CTAs, ads, and social sharing
+    ".cta-middle", ".infomoney-read-more", ".read-more", ".post__related",
+    ".sharing", ".share", ".social", ".banner", ".ads", ".advertisement",
+    "[data-ad]", "[data-ad-slot]",
+    ".sponsored", ".paid-content", ".partner", ".outbrain", ".taboola",
+
+    # Original selectors
+    '[class*="srdb"]', '[class*="rating"]', '.review', '.score', '.meter',
+    'header', 'footer', 'nav', 'aside',
+    '[class*="related"]', '[id*="related"]',
+    # From user's patch (GENERIC_REL_SELECTORS)
+    "[class*='relacionad']", "[class*='relaciona']", "[class*='recommend']",
+    "[class*='veja-tambem']", "[class*='leia-tambem']", "[id*='relacionad']",
+    "[id*='leia']", "section[aria-label*='Leia']", "section[aria-label*='Relacionad']",
+    '[class*="trending"]', '[id*="trending"]', 'div.widget',
+    '[class*="sidebar"]', '[id*="sidebar"]',
+    '[class*="recommended"]',
+    '[class*="screen-hub"]', '[class*="screenhub"]',
+    '[class*="most-popular"]', '[id*="most-popular"]',
+    '[class*="popular"]', '[id*="popular"]',
+    '[class*="newsletter"]', '[id*="newsletter"]',
+    '[class*="ad-"]', '[id*="ad-"]', '[class*="advert"]', '[id*="advert"]',
+    '.comments', '#comments',
+    '.author', '.author-box', '.post-author', '.byline', '.entry-author',
+    '.avatar', '.author__image', '.author-profile',
+    '.subscribe',
+)
+
+RELATED_LINK_CLASS_HINTS = ("relacion", "related", "leia", "veja")
+RELATED_LINK_GTM_VALUES = ("related", "see_more")
+SRDB_TEXT = "powered by srdb"
+
+# Named rules that are not CSS selectors
+RULE_RELATED_HEADING = "heading:leia-tambem"
+RULE_RELATED_LINK = "a:related-class"
+RULE_SRDB_TEXT = "text:powered-by-srdb"
+
+_TAG_RE = re.compile(r"^([a-z][a-z0-9]*)$")
+_CLASS_RE = re.compile(r"^\.([\w-]+)$")
+_ID_RE = re.compile(r"^#([\w-]+)$")
+_ATTR_PRESENT_RE = re.compile(r"^\[([\w-]+)\]$")
+_ATTR_CONTAINS_RE = re.compile(r"""^\[(class|id)\*=(['"])(.+?)\2\]$""")
+
+
+def _substring_matcher(rules: Dict[str, str]) -> Optional[Tuple["re.Pattern[str]", Dict[str, str]]]:
+    """Builds one alternation regex for many `*=` substrings, mapping each back to its rule."""
+    if not rules:
+        return None
+    # Longest first so the most specific rule gets the credit
+    parts = sorted(rules, key=len, reverse=True)
+    return re.compile("|".join(re.escape(p) for p in parts)), rules
+
+
+class PreCleaner:
+    """A compiled set of removal rules applied in a single walk over the document."""
+
+    def __init__(self, selectors: Iterable[str]):
+        """
+        Compiles `selectors` into lookup tables.
+
+        Args:
+            selectors: CSS selectors whose matches are removed. Each selector is its own
+                rule in the removal report.
+        """
+        self.tag_rules: Dict[str, str] = {}
+        self.class_rules: Dict[str, str] = {}
+        self.id_rules: Dict[str, str] = {}
+        self.attr_rules: Dict[str, str] = {}
+        class_contains: Dict[str, str] = {}
+        id_contains: Dict[str, str] = {}
+        self.complex_rules: List[Tuple[str, "sv.SoupSieve"]] = []
+
+        for sel in selectors:
+            sel = sel.strip()
+            if m := _TAG_RE.match(sel):
+                self.tag_rules.setdefault(m.group(1), sel)
+            elif m := _CLASS_RE.match(sel):
+                self.class_rules.setdefault(m.group(1), sel)
+            elif m := _ID_RE.match(sel):
+                self.id_rules.setdefault(m.group(1), sel)
+            elif m := _ATTR_PRESENT_RE.match(sel):
+                self.attr_rules.setdefault(m.group(1), sel)
+            elif m := _ATTR_CONTAINS_RE.match(sel):
+                target = class_contains if m.group(1) == "class" else id_contains
+                target.setdefault(m.group(3), sel)
+            else:
+                self.complex_rules.append((sel, sv.compile(sel)))
+
+        self.class_contains = _substring_matcher(class_contains)
+        self.id_contains = _substring_matcher(id_contains)
+
+    def _match_rule(self, el: Tag) -> Optional[str]:
+        """Returns the name of the first rule that removes `el`, or None."""
+        rule = self.tag_rules.get(el.name)
+        if rule:
+            return rule
+
+        classes = el.get("class") or []
+        if isinstance(classes, str):
+            classes = classes.split()
+        for cls in classes:
+            rule = self.class_rules.get(cls)
+            if rule:
+                return rule
+        if classes and self.class_contains:
+            m = self.class_contains[0].search(" ".join(classes))
+            if m:
+                return self.class_contains[1][m.group(0)]
+
+        el_id = el.get("id")
+        if el_id:
+            rule = self.id_rules.get(el_id)
+            if rule:
+                return rule
+            if self.id_contains:
+                m = self.id_contains[0].search(el_id)
+                if m:
+                    return self.id_contains[1][m.group(0)]
+
+        for attr, rule in self.attr_rules.items():
+            if el.has_attr(attr):
+                return rule
+
+        if el.name == "a":
+            cls = " ".join(classes).lower()
+            if any(k in cls for k in RELATED_LINK_CLASS_HINTS) or el.get("data-gtm-cta") in RELATED_LINK_GTM_VALUES:
+                return RULE_RELATED_LINK
+
+        for rule, matcher in self.complex_rules:
+            if matcher.match(el):
+                return rule
+        return None
+
+    @staticmethod
+    def _related_heading_targets(heading: Tag) -> List[Tag]:
+        """Nodes to drop for a 'Leia também'-style heading: its small container, or itself plus the list after it."""
+        parent_container = heading.find_parent(("section", "aside", "div"))
+        if parent_container and len(parent_container.find_all(HEADING_TAG_RE)) <= 2:
+            return [parent_container]
+        targets = [heading]
+        next_sibling = heading.find_next_sibling()
+        if next_sibling and next_sibling.name in ("div", "ul", "section", "ol"):
+            targets.append(next_sibling)
+        return targets
+
+    def clean(self, soup: BeautifulSoup) -> Counter:
+        """
+        Removes every matching node from `soup` in place.
+
+        Returns:
+            A Counter of removed nodes per rule. Nodes inside an already removed block are
+            not counted.
+        """
+        marked: Dict[int, Tuple[Tag, str]] = {}
+
+        def mark(node: Tag, rule: str) -> None:
+            marked.setdefault(id(node), (node, rule))
+
+        # (element, inside_removed). Inside a removed block only headings are still checked,
+        # because a "Leia também" heading removes its container even when that container
+        # is outside the block.
+        stack: List[Tuple[Tag, bool]] = [(c, False) for c in reversed(soup.contents) if isinstance(c, Tag)]
+        while stack:
+            el, inside_removed = stack.pop()
+
+            if HEADING_TAG_RE.match(el.name):
+                heading_text = el.get_text(" ", strip=True)
+                if heading_text and LEIA_HEADING_RE.search(heading_text):
+                    logger.debug(f"Removing related block for heading: {heading_text}")
+                    for target in self._related_heading_targets(el):
+                        mark(target, RULE_RELATED_HEADING)
+
+            if not inside_removed and id(el) not in marked:
+                rule = self._match_rule(el)
+                if rule:
+                    mark(el, rule)
+                elif any(isinstance(c, NavigableString) and SRDB_TEXT in c.lower() for c in el.contents):
+                    mark(el, RULE_SRDB_TEXT)
+
+            child_inside = inside_removed or id(el) in marked
+            stack.extend((c, child_inside) for c in reversed(el.contents) if isinstance(c, Tag))
+
+        removed: Counter = Counter()
+        outermost = [
+            (node, rule) for node, rule in marked.values()
+            # Nodes inside another removed block (e.g. a heading container) go with it
+            if not any(id(parent) in marked for parent in node.parents)
+        ]
+        for node, rule in outermost:
+            removed[rule] += 1
+            try:
+                node.decompose()
+            except Exception:
+                pass
+        return removed
+
+
+def _normalize_host(host: str) -> str:
+    return (host or "").lower().replace("www.", "")
+
+
+@lru_cache(maxsize=64)
+def get_precleaner(host: str = "") -> PreCleaner:
+    """Returns the compiled cleaner for `host`: the generic rules merged with its site-specific ones."""
+    selectors = list(SITE_SPECIFIC_RELATED_SELECTORS.get(_normalize_host(host), []))
+    selectors.extend(GENERIC_REMOVAL_SELECTORS)
+    return PreCleaner(selectors)
@@ -0,0 +1,193 @@
+"""
+Builds the rewrite prompt within a token budget.
+
+The extracted article is reduced to the markup the model actually uses (text blocks,
+images, embeds), boilerplate and repeated blocks are dropped, and if the body is still
+over budget the lead is kept together with the paragraphs richest in figures (numbers,
+percentages, amounts). The template is compiled once into literal and placeholder
+segments, so each prompt is assembled in a single join.
+"""
+
+import html
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, Comment
+
+logger = logging.getLogger(__name__)
+
+# Estimativa local: ~4 caracteres por token nos modelos Gemini (texto em português/inglês)
+CHARS_PER_TOKEN = 4
+
+# Blocos de texto preservados; o resto é desembrulhado (span, div, font...) ou removido
+BLOCK_TAGS = ('p', 'h2', 'h3', 'h4', 'ul', 'ol', 'blockquote', 'table')
+MEDIA_TAGS = ('img', 'iframe')
+# Atributos mantidos por tag; os demais (class, style, data-*...) são descartados
+KEEP_ATTRS = {
+    'a': ('href',),
+    'img': ('src', 'alt'),
+    'iframe': ('src',),
+}
+DROP_TAGS = ('script', 'style', 'noscript', 'svg', 'form', 'button', 'input', 'select', 'nav', 'aside', 'footer')
+
+# Linhas de interface/publicidade que não são conteúdo jornalístico
+BOILERPLATE_RE = re.compile(
+    r'^\s*(leia (também|mais)|veja (também|mais)|publicidade|continua (depois|após) d?a publicidade'
+    r'|assine|compartilhe|siga (o|a|nosso)|receba (as )?not[ií]cias|newsletter|read more|advertisement)\b',
+    re.IGNORECASE
+)
+# Números, percentuais e valores: parágrafos com dados têm prioridade no corte
+FIGURE_RE = re.compile(
+    r'R\$\s?\d|US\$\s?\d|\d+(?:[.,]\d+)*\s?(?:%|p\.p\.|bilh|milh|mil\b|trilh)|\b\d+(?:[.,]\d+)+\b|\b(?:19|20)\d{2}\b',
+    re.IGNORECASE
+)
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Approximate token count, computed locally (no API round trip)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class PromptTemplate:
+    """A template compiled once into literal segments and `{field}` placeholders."""
+
+    _PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+    def __init__(self, template: str, fields: Tuple[str, ...]):
+        """
+        Args:
+            template: Template text; only `{name}` with `name` in `fields` is a placeholder,
+                every other brace is literal (the prompt contains JSON examples).
+            fields: Names that can be substituted.
+        """
+        self._segments: List[Tuple[bool, str]] = []
+        pos = 0
+        for match in self._PLACEHOLDER_RE.finditer(template):
+            if match.group(1) not in fields:
+                continue
+            if match.start() > pos:
+                self._segments.append((False, template[pos:match.start()]))
+            self._segments.append((True, match.group(1)))
+            pos = match.end()
+        if pos < len(template):
+            self._segments.append((False, template[pos:]))
+        self.fields = tuple(fields)
+        self.static_tokens = count_tokens(''.join(text for is_field, text in self._segments if not is_field))
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Fills the placeholders in one pass; missing values render as empty strings."""
+        return ''.join(
+            str(values.get(text, '') or '') if is_field else text
+            for is_field, text in self._segments
+        )
+
+
+def _clean_tree(soup: BeautifulSoup) -> None:
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in soup.find_all(DROP_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        keep = KEEP_ATTRS.get(tag.name, ())
+        tag.attrs = {k: v for k, v in tag.attrs.items() if k in keep}
+
+
+def _blocks(soup: BeautifulSoup) -> List[str]:
+    """Flattens the tree into top-level block and media snippets, in document order."""
+    blocks: List[str] = []
+    stack = list(reversed(soup.contents))
+    while stack:
+        node = stack.pop()
+        name = getattr(node, 'name', None)
+        if name is None:
+            text = str(node).strip()
+            if text:
+                # A NavigableString is unescaped text; "P&G" or "a < b" must go back as entities
+                blocks.append(f"<p>{html.escape(text, quote=False)}</p>")
+        elif name in BLOCK_TAGS or name in MEDIA_TAGS or name == 'figure':
+            if name == 'figure':
+                # Only the media and its caption matter
+                media = node.find(MEDIA_TAGS)
+                if media:
+                    caption = node.find('figcaption')
+                    caption_html = f"<figcaption>{html.escape(caption.get_text(' ', strip=True), quote=False)}</figcaption>" if caption else ''
+                    blocks.append(f"<figure>{media}{caption_html}</figure>")
+            elif name in MEDIA_TAGS:
+                blocks.append(str(node))
+            elif node.get_text(strip=True) or node.find(MEDIA_TAGS):
+                blocks.append(str(node))
+        elif node.find(BLOCK_TAGS + MEDIA_TAGS + ('figure',)) is None:
+            # A container with inline content only (div, span...) reads as one paragraph
+            inner = node.decode_contents().strip()
+            if node.get_text(strip=True):
+                blocks.append(f"<p>{inner}</p>")
+        else:
+            stack.extend(reversed(node.contents))
+    return blocks
+
+
+def _block_key(block: str) -> str:
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', '', block)).strip().lower()
+
+
+def prepare_content(content_html: str, max_tokens: int, lead_blocks: int = 3) -> str:
+    """
+    Reduces the article HTML to what the model needs and fits it in `max_tokens`.
+
+    Args:
+        content_html: Extracted article body (plus its figure tags).
+        max_tokens: Budget for the body; 0 disables the cut.
+        lead_blocks: Leading text blocks always kept when cutting.
+
+    Returns:
+        The compact HTML body.
+    """
+    if not content_html:
+        return ''
+    soup = BeautifulSoup(content_html, 'lxml')
+    root = soup.body or soup
+    _clean_tree(root)
+
+    blocks, seen, media_seen = [], set(), set()
+    for block in _blocks(root):
+        key = _block_key(block)
+        is_media = block.startswith(('<figure', '<img', '<iframe'))
+        if is_media:
+            src = re.search(r'src="([^"]*)"', block)
+            src_key = src.group(1) if src else block
+            if src_key in media_seen:
+                continue
+            media_seen.add(src_key)
+        else:
+            if not key or key in seen or BOILERPLATE_RE.match(key):
+                continue
+            seen.add(key)
+        blocks.append((block, is_media))
+
+    total = sum(count_tokens(b) for b, _ in blocks)
+    if max_tokens and total > max_tokens:
+        # Media must be preserved (see the prompt rules); text competes for what is left
+        budget = max_tokens - sum(count_tokens(b) for b, is_media in blocks if is_media)
+        text_indexes = [i for i, (_, is_media) in enumerate(blocks) if not is_media]
+        keep = set()
+        for i in text_indexes[:lead_blocks]:
+            keep.add(i)
+            budget -= count_tokens(blocks[i][0])
+        ranked = sorted(
+            text_indexes[lead_blocks:],
+            key=lambda i: (-len(FIGURE_RE.findall(blocks[i][0])) / max(1, count_tokens(blocks[i][0])), i)
+        )
+        for i in ranked:
+            cost = count_tokens(blocks[i][0])
+            if cost <= budget:
+                keep.add(i)
+                budget -= cost
+        kept = [(b, m) for i, (b, m) in enumerate(blocks) if m or i in keep]
+        logger.info(
+            f"Prompt body trimmed from ~{total} to ~{sum(count_tokens(b) for b, _ in kept)} tokens "
+            f"({len(blocks) - len(kept)} of {len(blocks)} blocks dropped)."
+        )
+        blocks = kept
+    return "\n".join(b for b, _ in blocks)
@@ -0,0 +1,129 @@
+"""
+Token-bucket rate limiting for the external services used by the pipeline.
+
+Buckets are named '<group>:<resource>' (e.g. 'gemini:0', 'wordpress:posts',
+'host:www.infomoney.com.br') and created on demand with the limits configured
+for their group in RATE_LIMITS. Each stage blocks only on its own bucket.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .config import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A thread-safe token bucket that refills continuously at `rate` tokens per second."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Initializes the bucket full.
+
+        Args:
+            rate: Tokens added per second. Must be positive.
+            capacity: Maximum number of tokens (the allowed burst).
+            clock: Monotonic time source, injectable for tests.
+            sleep: Sleep function, injectable for tests.
+        """
+        if rate <= 0:
+            raise ValueError("TokenBucket rate must be positive.")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes `tokens` if they are available right now, without blocking."""
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Reserves `tokens`, sleeping until they are available.
+
+        The reservation is made under the lock and the wait happens outside it, so
+        concurrent callers queue up in order instead of spinning.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Registry of named token buckets configured per bucket group."""
+
+    def __init__(self, limits: Dict[str, Dict[str, float]]):
+        """
+        Args:
+            limits: Maps a group name to {'per_minute': float, 'burst': int}. A bucket
+                named 'gemini:0' uses the 'gemini' entry. Groups without an entry are
+                not throttled.
+        """
+        self._limits = limits
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name: str) -> Optional[TokenBucket]:
+        """Returns the bucket for `name`, creating it on first use, or None if unlimited."""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                group = name.split(':', 1)[0]
+                conf = self._limits.get(group)
+                if not conf or conf.get('per_minute', 0) <= 0:
+                    return None
+                bucket = TokenBucket(rate=conf['per_minute'] / 60.0, capacity=conf.get('burst', 1))
+                self._buckets[name] = bucket
+            return bucket
+
+    def acquire(self, name: str, tokens: float = 1.0) -> float:
+        """Blocks on the bucket `name` and returns the time waited (0 if unlimited)."""
+        bucket = self.bucket(name)
+        if bucket is None:
+            return 0.0
+        waited = bucket.acquire(tokens)
+        if waited >= 1:
+            logger.info(f"Rate limit '{name}': waited {waited:.1f}s for a slot.")
+        return waited
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide limiter, so quotas are shared across cycles and workers."""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(RATE_LIMITS)
+        return _default_limiter
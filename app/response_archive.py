@@ -0,0 +1,252 @@
+"""
+Bounded, compressed archive of raw AI responses.
+
+Responses are handed to a background writer thread and appended to gzip segment
+files, one gzip member per response, so any single record can be read back from
+its offset without decompressing the whole segment. A small SQLite index maps
+article IDs to (segment, offset, length). Successful responses can be sampled;
+invalid or rejected ones are always kept since those are the ones worth reading.
+Segments rotate at a fixed size and the oldest are deleted once the archive
+exceeds its size or age limit.
+"""
+
+import gzip
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import RESPONSE_ARCHIVE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'responses-'
+SEGMENT_SUFFIX = '.jsonl.gz'
+INDEX_FILE = 'index.db'
+# The writer commits the index after this many records (or when the queue drains)
+INDEX_COMMIT_EVERY = 50
+
+_STOP = object()
+
+
+class ResponseArchive:
+    """Append-only store of AI responses written off the calling thread."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 8 * 1024 * 1024,
+        max_total_bytes: int = 256 * 1024 * 1024,
+        retention_seconds: int = 14 * 24 * 3600,
+        sample_rate: float = 1.0,
+        queue_size: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Opens (or creates) the archive in `directory` and starts the writer thread.
+
+        Args:
+            directory: Folder holding the segments and the index.
+            segment_max_bytes: A segment is closed once it reaches this size.
+            max_total_bytes: Oldest segments are deleted while the archive is larger.
+            retention_seconds: Segments last written before this age are deleted.
+            sample_rate: Fraction of successful responses kept (0..1); failures are
+                always archived.
+            queue_size: Pending records; when full, new records are dropped rather
+                than blocking the caller.
+            clock: Time source, injectable for tests.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.retention_seconds = retention_seconds
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._clock = clock
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._segment: Optional[Path] = None
+        self._segment_seq = 0
+
+        self.conn = sqlite3.connect(str(self.directory / INDEX_FILE), timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript('''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                article_id INTEGER,
+                key_index INTEGER,
+                outcome TEXT,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_article ON responses (article_id);
+            CREATE INDEX IF NOT EXISTS idx_responses_segment ON responses (segment);
+        ''')
+        self.conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name='response-archive', daemon=True)
+        self._writer.start()
+
+    def record(
+        self,
+        text: str,
+        article_id: Optional[int] = None,
+        key_index: Optional[int] = None,
+        outcome: str = 'success',
+    ) -> bool:
+        """
+        Queues a response for archiving; never blocks.
+
+        Returns:
+            True if the response was queued, False if it was sampled out or dropped.
+        """
+        if outcome == 'success' and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        item = {
+            'article_id': article_id,
+            'key_index': key_index,
+            'outcome': outcome,
+            'created_at': self._clock(),
+            'text': text,
+        }
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Response archive queue is full; dropped a response ({self.dropped} so far).")
+            return False
+        return True
+
+    def flush(self) -> None:
+        """Blocks until every queued response is on disk and indexed."""
+        self._queue.join()
+
+    def find(self, article_id: int) -> List[Dict[str, Any]]:
+        """Returns the archived responses for `article_id`, oldest first."""
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT segment, offset, length FROM responses WHERE article_id = ? ORDER BY id', (article_id,)
+            ).fetchall()
+        records = []
+        for row in rows:
+            try:
+                with open(self.directory / row['segment'], 'rb') as f:
+                    f.seek(row['offset'])
+                    records.append(json.loads(gzip.decompress(f.read(row['length']))))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Archived response in {row['segment']}@{row['offset']} is unreadable: {e}")
+        return records
+
+    def total_bytes(self) -> int:
+        """Size of all segment files."""
+        return sum(path.stat().st_size for path in self._segments())
+
+    def enforce_retention(self) -> int:
+        """
+        Deletes segments past the retention age, then the oldest ones until the
+        archive fits in max_total_bytes. The segment being written is kept.
+
+        Returns:
+            The number of segments removed.
+        """
+        cutoff = self._clock() - self.retention_seconds
+        segments = [path for path in self._segments() if path != self._segment]
+        total = self.total_bytes()
+        removed = 0
+        for path in segments:
+            size = path.stat().st_size
+            if total <= self.max_total_bytes and path.stat().st_mtime >= cutoff:
+                continue
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.conn.execute('DELETE FROM responses WHERE segment = ?', (path.name,))
+                self.conn.commit()
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Response archive retention removed {removed} segment(s).")
+        return removed
+
+    def close(self) -> None:
+        """Writes what is queued, stops the writer and closes the index."""
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._lock:
+            self.conn.close()
+
+    def _segments(self) -> List[Path]:
+        # Names embed a timestamp and a sequence number, so sorting by name is oldest first
+        return sorted(self.directory.glob(f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}'))
+
+    def _open_segment(self) -> Path:
+        self._segment_seq += 1
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(self._clock()))
+        self._segment = self.directory / f'{SEGMENT_PREFIX}{stamp}-{self._segment_seq:04d}{SEGMENT_SUFFIX}'
+        return self._segment
+
+    def _write_loop(self) -> None:
+        uncommitted = 0
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._append(item)
+                uncommitted += 1
+                if uncommitted >= INDEX_COMMIT_EVERY or self._queue.empty():
+                    with self._lock:
+                        self.conn.commit()
+                    uncommitted = 0
+            except Exception as e:
+                logger.error(f"Failed to archive an AI response: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _append(self, item: Dict[str, Any]) -> None:
+        segment = self._segment
+        if segment is None or not segment.exists() or segment.stat().st_size >= self.segment_max_bytes:
+            segment = self._open_segment()
+            self.enforce_retention()
+        member = gzip.compress((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8'))
+        with open(segment, 'ab') as f:
+            offset = f.tell()
+            f.write(member)
+        with self._lock:
+            self.conn.execute(
+                'INSERT INTO responses (article_id, key_index, outcome, segment, offset, length, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (item['article_id'], item['key_index'], item['outcome'], segment.name,
+                 offset, len(member), item['created_at'])
+            )
+
+
+_default_archive: Optional[ResponseArchive] = None
+_default_lock = threading.Lock()
+
+
+def get_response_archive() -> Optional[ResponseArchive]:
+    """Returns the process-wide archive built from RESPONSE_ARCHIVE_CONFIG, or None when it is disabled."""
+    global _default_archive
+    if not RESPONSE_ARCHIVE_CONFIG['enabled']:
+        return None
+    with _default_lock:
+        if _default_archive is None:
+            _default_archive = ResponseArchive(
+                RESPONSE_ARCHIVE_CONFIG['path'],
+                segment_max_bytes=RESPONSE_ARCHIVE_CONFIG['segment_max_bytes'],
+                max_total_bytes=RESPONSE_ARCHIVE_CONFIG['max_total_bytes'],
+                retention_seconds=RESPONSE_ARCHIVE_CONFIG['retention_seconds'],
+                sample_rate=RESPONSE_ARCHIVE_CONFIG['sample_rate'],
+                queue_size=RESPONSE_ARCHIVE_CONFIG['queue_size'],
+            )
+        return _default_archive
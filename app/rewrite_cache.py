@@ -0,0 +1,203 @@
+"""
+Persistent cache of validated AI rewrites.
+
+The key is a hash of the article's normalized title and body text, the prompt
+version and every other prompt field (source URL and name, category, tags, video and
+image lists), so an article retried after a later stage failed, or delivered again
+with the same context, reuses the earlier rewrite instead of spending another Gemini
+generation. Markup, images, case, accents and punctuation in the text are ignored by
+the normalization; a copy from another source or category gets its own rewrite, as
+its attribution and metadata differ.
+"""
+
+import hashlib
+import html
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .config import REWRITE_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style|figure|figcaption)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+# Evictions also run every N writes, not only when the size limit is exceeded
+EVICT_EVERY_WRITES = 50
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Reduces HTML or plain text to lowercase words without accents, markup or punctuation."""
+    if not text:
+        return ''
+    text = _SCRIPT_STYLE_RE.sub(' ', text)
+    text = html.unescape(_TAG_RE.sub(' ', text))
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+def content_key(
+    title: Optional[str],
+    content_html: Optional[str],
+    prompt_version: str,
+    context: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Cache key for an article: sha256 of the normalized title and body, the prompt
+    version and `context`, the prompt's other fields (compared exactly).
+    """
+    normalized = f"{prompt_version}\n{normalize_text(title)}\n{normalize_text(content_html)}"
+    if context:
+        normalized += "\n" + json.dumps(context, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class RewriteCache:
+    """SQLite store of rewrite outputs with TTL and size based eviction."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: int = 7 * 24 * 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Opens (or creates) the cache database at `path`.
+
+        Args:
+            path: SQLite file for the cache.
+            ttl_seconds: Entries older than this are never served and get evicted.
+            max_bytes: Upper bound for the compressed payloads; least recently used
+                entries are evicted first.
+            clock: Time source, injectable for tests.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript('''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS rewrites (
+                content_key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_rewrites_last_used ON rewrites (last_used_at);
+        ''')
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached rewrite for `key`, or None if missing or expired."""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT payload, created_at FROM rewrites WHERE content_key = ?', (key,)
+            ).fetchone()
+            if not row:
+                return None
+            now = self._clock()
+            if now - row['created_at'] > self.ttl_seconds:
+                return None
+            try:
+                data = json.loads(zlib.decompress(row['payload']).decode('utf-8'))
+            except (zlib.error, ValueError) as e:
+                logger.warning(f"Rewrite cache entry {key[:12]} is unreadable, dropping it: {e}")
+                self.conn.execute('DELETE FROM rewrites WHERE content_key = ?', (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                'UPDATE rewrites SET last_used_at = ?, hits = hits + 1 WHERE content_key = ?', (now, key)
+            )
+            self.conn.commit()
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """Stores a validated rewrite under `key`."""
+        payload = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'), 6)
+        with self._lock:
+            now = self._clock()
+            self.conn.execute('''
+                INSERT INTO rewrites (content_key, payload, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(content_key) DO UPDATE SET
+                    payload = excluded.payload, size = excluded.size,
+                    created_at = excluded.created_at, last_used_at = excluded.last_used_at
+            ''', (key, payload, len(payload), now, now))
+            self.conn.commit()
+            self._writes += 1
+            should_evict = self._writes % EVICT_EVERY_WRITES == 0
+        if should_evict or self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def total_bytes(self) -> int:
+        """Size of all stored (compressed) payloads."""
+        with self._lock:
+            return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM rewrites').fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drops expired entries, then least recently used ones until the payloads fit
+        in max_bytes.
+
+        Returns:
+            The number of entries removed.
+        """
+        with self._lock:
+            cutoff = self._clock() - self.ttl_seconds
+            removed = self.conn.execute('DELETE FROM rewrites WHERE created_at < ?', (cutoff,)).rowcount
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM rewrites').fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.conn.execute(
+                    'SELECT content_key, size FROM rewrites ORDER BY last_used_at ASC'
+                ).fetchall()
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute('DELETE FROM rewrites WHERE content_key = ?', (row['content_key'],))
+                    total -= row['size']
+                    removed += 1
+            self.conn.commit()
+        if removed:
+            logger.info(f"Rewrite cache eviction removed {removed} entries.")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_default_cache: Optional[RewriteCache] = None
+_default_lock = threading.Lock()
+
+
+def get_rewrite_cache() -> Optional[RewriteCache]:
+    """Returns the process-wide cache built from REWRITE_CACHE_CONFIG, or None when it is disabled."""
+    global _default_cache
+    if not REWRITE_CACHE_CONFIG['enabled']:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RewriteCache(
+                REWRITE_CACHE_CONFIG['path'],
+                ttl_seconds=REWRITE_CACHE_CONFIG['ttl_seconds'],
+                max_bytes=REWRITE_CACHE_CONFIG['max_bytes'],
+            )
+        return _default_cache
@@ -0,0 +1,54 @@
+"""
+SimHash fingerprints for near-duplicate story detection.
+
+Copies of the same wire story at Valor, G1, Folha, Estadão and InfoMoney differ in
+markup, a sentence here and there and the byline. Their 64-bit SimHash over word
+shingles differs in only a few bits, so "near duplicate" becomes a Hamming distance
+check, and the banded index in the store (see Database.claim_story_fingerprint)
+finds the candidates without scanning the history.
+"""
+
+import hashlib
+from typing import Optional
+
+from .rewrite_cache import normalize_text
+
+SIMHASH_BITS = 64
+# Palavras por shingle
+SHINGLE_SIZE = 3
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text: Optional[str], min_tokens: int = 0) -> Optional[int]:
+    """
+    Computes the 64-bit SimHash of `text` (HTML or plain text) over word shingles.
+
+    Returns:
+        The fingerprint as an unsigned int, or None if the text has fewer than
+        `min_tokens` words (too short to tell stories apart reliably).
+    """
+    words = normalize_text(text).split()
+    if not words or len(words) < min_tokens:
+        return None
+    if len(words) < SHINGLE_SIZE:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << SIMHASH_BITS) - 1)).bit_count()
@@ -5,18 +5,175 @@ Database management for the application using SQLite.
 
 import sqlite3
 import hashlib
+import json
 import logging
+import os
+import zlib
+import threading
+from collections import OrderedDict
+from functools import wraps
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any
+from contextlib import contextmanager
+from queue import Empty, Queue
+from typing import Iterator, List, Dict, Any, Optional
 
-from .config import PIPELINE_ORDER
+from .config import PIPELINE_ORDER, RETRY_CONFIG, SCHEDULE_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Etapas persistidas do pipeline, na ordem em que são concluídas.
+PIPELINE_STAGES = ('FETCHED', 'EXTRACTED', 'REWRITTEN')
+
+# Linhas por INSERT multi-valores (4 parâmetros cada, bem abaixo do limite do SQLite)
+INSERT_BATCH_SIZE = 200
+# Chaves (source_id, external_id) lembradas em memória para pular o SQLite
+RECENT_KEYS_MAX = 20000
+
+
+# Leituras concorrentes (dashboard, workers) usam um pool de conexões somente leitura;
+# com WAL elas não bloqueiam nem são bloqueadas pela conexão de escrita.
+READ_POOL_SIZE = 4
+# Statements preparados mantidos em cache por conexão
+CACHED_STATEMENTS = 256
+BUSY_TIMEOUT_SECONDS = 10
+# Write-behind: transições de status e posts publicados são agrupados numa transação
+# a cada WRITE_BEHIND_INTERVAL_SECONDS (ou ao acumular WRITE_BEHIND_MAX_BATCH), e
+# registrados antes num journal append-only que é reaplicado em initialize().
+# Cada operação do journal é idempotente (valores absolutos, INSERT OR IGNORE), então
+# reaplicar um journal já commitado não muda nada. O journal vai para o SO a cada
+# operação (sobrevive à queda do processo) e recebe fsync uma vez por lote, no flush:
+# numa queda de energia ou do SO perdem-se no máximo as operações do último intervalo,
+# além dos commits que o synchronous=NORMAL do SQLite não garante.
+WRITE_BEHIND_INTERVAL_SECONDS = 0.5
+WRITE_BEHIND_MAX_BATCH = 100
+
+# SimHash de 64 bits dividido em 4 faixas de 16 bits, cada uma indexada: duas impressões
+# a distância de Hamming <= 3 coincidem em pelo menos uma faixa (princípio da casa dos pombos).
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 16
+
+# Colunas de api_key_status gravadas pelo KeyScheduler (key_hash primeiro)
+API_KEY_STATUS_COLUMNS = (
+    'key_hash', 'api_key', 'category', 'is_valid', 'cooldown_until', 'success_count',
+    'failure_count', 'consecutive_failures', 'health', 'last_used_at',
+)
+
+
+def _connect(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """Opens a connection with the performance profile shared by the writer and the read pool."""
+    conn = sqlite3.connect(
+        db_path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=BUSY_TIMEOUT_SECONDS,
+        check_same_thread=False,  # each connection is used by one thread at a time
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+class ConnectionPool:
+    """A small thread-safe pool of read-only connections to one database file."""
+
+    def __init__(self, db_path: str, size: int = READ_POOL_SIZE):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle: "Queue[sqlite3.Connection]" = Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrows a connection, opening a new one while the pool is below its size.
+
+        Raises sqlite3.OperationalError if none is returned within BUSY_TIMEOUT_SECONDS.
+        """
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = _connect(self.db_path, read_only=True)
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=BUSY_TIMEOUT_SECONDS)
+                except Empty:
+                    raise sqlite3.OperationalError(
+                        f"Read pool exhausted: all {self.size} connections stayed busy "
+                        f"for {BUSY_TIMEOUT_SECONDS}s"
+                    ) from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        """Closes the idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_read_pools: Dict[str, ConnectionPool] = {}
+_read_pools_lock = threading.Lock()
+
+
+def get_read_pool(db_path: str = 'data/app.db') -> ConnectionPool:
+    """Returns the process-wide read pool for `db_path`."""
+    key = str(Path(db_path).resolve())
+    with _read_pools_lock:
+        pool = _read_pools.get(key)
+        if pool is None:
+            pool = _read_pools[key] = ConnectionPool(key)
+        return pool
+
+
+def read_connection(db_path: str = 'data/app.db'):
+    """Context manager lending a pooled read-only connection (e.g. for the dashboard)."""
+    return get_read_pool(db_path).connection()
+
+
+def _synchronized(method):
+    """Serializes access to the shared connection when the pipeline runs worker threads."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Database:
     """Handles all database operations for the application."""
 
+    # (db_path, source_id, external_id) vistos recentemente, compartilhados entre instâncias
+    _recent_keys: "OrderedDict[tuple, None]" = OrderedDict()
+    _recent_lock = threading.Lock()
+    # Journal files in use; a second instance on the same file writes through instead
+    _journal_owners: set = set()
+
     def __init__(self, db_path: str = 'data/app.db'):
         """
         Initializes the database connection.
@@ -29,9 +186,15 @@ class Database:
         
         self.db_path = db_path
         self.conn = None
+        self._lock = threading.RLock()
+        self._pending_writes: List[Dict[str, Any]] = []
+        self._journal_path = None if db_path == ':memory:' else f"{db_path}-status.journal"
+        self._journal = None
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_stop = threading.Event()
         try:
-            self.conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES, timeout=10)
-            self.conn.row_factory = sqlite3.Row
+            # Single writer; access is serialized by self._lock
+            self.conn = _connect(self.db_path)
         except sqlite3.Error as e:
             logger.critical(f"Database connection error: {e}")
             raise
@@ -42,6 +205,193 @@ class Database:
             raise sqlite3.Error("Database connection is not available.")
         return self.conn.cursor()
 
+    def _read(self):
+        """Borrows a pooled read-only connection, so reads don't queue behind writes."""
+        if not self.conn:
+            raise sqlite3.Error("Database connection is not available.")
+        return get_read_pool(self.db_path).connection()
+
+    # --- Write-behind queue ---
+
+    @staticmethod
+    def _apply_write(cursor: sqlite3.Cursor, op: Dict[str, Any]) -> None:
+        """Executes one queued operation (see update_article_status / save_processed_post)."""
+        if op['op'] == 'status':
+            status, reason, article_id = op['status'], op.get('reason'), op['article_id']
+            if status == 'DEFERRED' and op.get('fail_count') is not None:
+                cursor.execute(
+                    "UPDATE seen_articles SET status = ?, retry_at = ?, fail_reason = ?, fail_count = ? WHERE id = ?",
+                    (status, op.get('retry_at'), reason, op['fail_count'], article_id)
+                )
+            elif status == 'DEFERRED':
+                # Journals written before fail_count was recorded in the operation
+                cursor.execute(
+                    "UPDATE seen_articles SET status = ?, retry_at = ?, fail_reason = ?, fail_count = fail_count + 1 WHERE id = ?",
+                    (status, op.get('retry_at'), reason, article_id)
+                )
+            elif reason:
+                cursor.execute(
+                    "UPDATE seen_articles SET status = ?, fail_reason = ? WHERE id = ?",
+                    (status, reason, article_id))
+            else:
+                cursor.execute("UPDATE seen_articles SET status = ? WHERE id = ?", (status, article_id))
+            if status == 'FAILED':
+                Database._release_duplicates(cursor, article_id)
+        elif op['op'] == 'post':
+            article_id = op['article_id']
+            # First, update the article's status to 'PUBLISHED' and clear any previous failure reason
+            cursor.execute(
+                "UPDATE seen_articles SET status = 'PUBLISHED', fail_reason = NULL WHERE id = ?",
+                (article_id,)
+            )
+            # Then, insert the record into the 'posts' table (once, even when replayed)
+            cursor.execute(
+                "INSERT OR IGNORE INTO posts (seen_article_id, wp_post_id) VALUES (?, ?)",
+                (article_id, op['wp_post_id'])
+            )
+            # Intermediate artifacts are only needed to resume unpublished articles
+            cursor.execute("DELETE FROM article_artifacts WHERE seen_article_id = ?", (article_id,))
+        elif op['op'] == 'key_status':
+            row = op['row']
+            cursor.execute(f'''
+                INSERT INTO api_key_status ({", ".join(API_KEY_STATUS_COLUMNS)})
+                VALUES ({", ".join("?" * len(API_KEY_STATUS_COLUMNS))})
+                ON CONFLICT(key_hash) DO UPDATE SET
+                    {", ".join(f"{c} = excluded.{c}" for c in API_KEY_STATUS_COLUMNS[1:])}
+            ''', [row.get(c) for c in API_KEY_STATUS_COLUMNS])
+        else:
+            logger.warning(f"Ignoring unknown queued write: {op}")
+
+    @staticmethod
+    def _release_duplicates(cursor: sqlite3.Cursor, article_id: int) -> None:
+        """
+        Puts the copies that were skipped as duplicates of a now FAILED article back
+        in the queue. They resume from their extracted text and claim the story again
+        (see claim_story_fingerprint).
+        """
+        cursor.execute(
+            "UPDATE seen_articles SET status = 'EXTRACTED', duplicate_of = NULL, fail_reason = NULL "
+            "WHERE duplicate_of = ? AND status = 'DUPLICATE'",
+            (article_id,)
+        )
+        if cursor.rowcount:
+            logger.info(f"Article id {article_id} failed; requeued {cursor.rowcount} duplicate(s) of it.")
+
+    def _apply_pending_writes(self, cursor: sqlite3.Cursor) -> int:
+        """
+        Runs the queued writes inside the caller's transaction, so a synchronous write
+        never overtakes an earlier status change. Call _pending_writes_committed() after
+        the commit succeeds.
+        """
+        for op in self._pending_writes:
+            try:
+                self._apply_write(cursor, op)
+            except sqlite3.IntegrityError as e:
+                logger.warning(f"Dropping queued write {op}: {e}")
+        return len(self._pending_writes)
+
+    def _next_fail_count(self, article_id: int) -> int:
+        """fail_count an article gets from one more DEFERRED, counting queued operations."""
+        for op in reversed(self._pending_writes):
+            if op['op'] == 'status' and op['article_id'] == article_id and op.get('fail_count') is not None:
+                return op['fail_count'] + 1
+        row = self._get_cursor().execute(
+            "SELECT fail_count FROM seen_articles WHERE id = ?", (article_id,)
+        ).fetchone()
+        return (row['fail_count'] if row else 0) + 1
+
+    def _pending_writes_committed(self) -> None:
+        self._pending_writes.clear()
+        if self._journal:
+            self._journal.seek(0)
+            self._journal.truncate()
+
+    def _owns_journal(self) -> bool:
+        """Claims the journal file for this instance on first use."""
+        if self._journal:
+            return True
+        if not self._journal_path:
+            return False
+        key = str(Path(self._journal_path).resolve())
+        with self._recent_lock:
+            if key in Database._journal_owners:
+                return False
+            Database._journal_owners.add(key)
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        self._flusher = threading.Thread(target=self._flush_loop, name='db-write-behind', daemon=True)
+        self._flusher.start()
+        return True
+
+    def _enqueue_write(self, op: Dict[str, Any]) -> None:
+        """Journals `op` and queues it for the next group commit (or writes it through)."""
+        if not self.conn:
+            raise sqlite3.Error("Database connection is not available.")
+        if not self._owns_journal():
+            cursor = self._get_cursor()
+            self._apply_write(cursor, op)
+            self.conn.commit()
+            return
+        # Flushed to the OS right away (survives a process crash); fsynced per batch in flush()
+        self._journal.write(json.dumps(op, default=str) + "\n")
+        self._journal.flush()
+        self._pending_writes.append(op)
+        if len(self._pending_writes) >= WRITE_BEHIND_MAX_BATCH:
+            self.flush()
+
+    def _flush_loop(self) -> None:
+        while not self._flusher_stop.wait(WRITE_BEHIND_INTERVAL_SECONDS):
+            self.flush()
+
+    @_synchronized
+    def flush(self) -> int:
+        """
+        Commits the queued status changes and post records in one transaction.
+
+        The journal is fsynced first, once for the whole batch, so the operations
+        survive an OS crash or power loss if the commit does not happen.
+
+        Returns:
+            The number of operations written.
+        """
+        if not self._pending_writes or not self.conn:
+            return 0
+        if self._journal:
+            try:
+                os.fsync(self._journal.fileno())
+            except OSError as e:
+                logger.warning(f"Could not fsync the write-behind journal: {e}")
+        try:
+            count = self._apply_pending_writes(self._get_cursor())
+            self.conn.commit()
+            self._pending_writes_committed()
+            logger.debug(f"Write-behind flushed {count} operations.")
+            return count
+        except sqlite3.Error as e:
+            # Still in the journal; retried on the next flush or replayed on startup
+            logger.error(f"Write-behind flush failed: {e}")
+            self.conn.rollback()
+            return 0
+
+    def _replay_journal(self, cursor: sqlite3.Cursor) -> int:
+        """Re-applies operations left in the journal by a process that died before flushing."""
+        if not self._journal_path or not os.path.exists(self._journal_path):
+            return 0
+        replayed = 0
+        with open(self._journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping truncated write-behind journal entry.")
+                    continue
+                try:
+                    self._apply_write(cursor, op)
+                    replayed += 1
+                except sqlite3.IntegrityError as e:
+                    logger.warning(f"Dropping journaled write {op}: {e}")
+        return replayed
+
+    @_synchronized
     def initialize(self):
         """Creates the necessary tables if they don't exist."""
         logger.info("Initializing database tables if they don't exist...")
@@ -56,12 +406,30 @@ class Database:
                     url TEXT,
                     published_at DATETIME,
                     inserted_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
-                    status TEXT DEFAULT 'NEW', -- NEW, PROCESSING, REWRITTEN, PUBLISHED, FAILED, DEFERRED
+                    status TEXT DEFAULT 'NEW', -- NEW, PROCESSING, FETCHED, EXTRACTED, BATCHED, REWRITTEN, PUBLISHED, FAILED, DEFERRED, DUPLICATE
                     retry_at DATETIME,
                     fail_reason TEXT,
+                    fail_count INTEGER NOT NULL DEFAULT 0,
+                    duplicate_of INTEGER, -- matéria original de um DUPLICATE
                     UNIQUE(source_id, external_id)
                 )
             ''')
+            # Bancos criados antes da coluna fail_count existir
+            cursor.execute("PRAGMA table_info(seen_articles)")
+            columns = {row['name'] for row in cursor.fetchall()}
+            if 'fail_count' not in columns:
+                logger.info("Adding missing 'fail_count' column to seen_articles.")
+                cursor.execute("ALTER TABLE seen_articles ADD COLUMN fail_count INTEGER NOT NULL DEFAULT 0")
+            if 'duplicate_of' not in columns:
+                logger.info("Adding missing 'duplicate_of' column to seen_articles.")
+                cursor.execute("ALTER TABLE seen_articles ADD COLUMN duplicate_of INTEGER")
+            # Cópias a liberar quando a original falha (ver _release_duplicates)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_seen_articles_duplicate_of ON seen_articles(duplicate_of) "
+                           "WHERE duplicate_of IS NOT NULL")
+            # Fila de trabalho: NEW e DEFERRED vencidos são buscados por este índice
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_seen_articles_status_retry ON seen_articles(status, retry_at)")
+            # Artigos recentes por fonte (fila de trabalho e dashboard)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_seen_articles_source_inserted ON seen_articles(source_id, inserted_at)")
             # Tabela para rastrear posts publicados no WordPress
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS posts (
@@ -69,6 +437,30 @@ class Database:
                     seen_article_id INTEGER,
                     wp_post_id INTEGER,
                     created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    UNIQUE(seen_article_id),
+                    FOREIGN KEY(seen_article_id) REFERENCES seen_articles(id)
+                )
+            ''')
+            # Bancos criados antes do UNIQUE: remove posts repetidos (journal reaplicado) e
+            # troca o índice simples por um único
+            cursor.execute("PRAGMA index_list(posts)")
+            if not any(row['unique'] for row in cursor.fetchall()):
+                logger.info("Adding a unique index on posts(seen_article_id).")
+                cursor.execute("""
+                    DELETE FROM posts WHERE seen_article_id IS NOT NULL AND id NOT IN (
+                        SELECT MIN(id) FROM posts WHERE seen_article_id IS NOT NULL GROUP BY seen_article_id
+                    )
+                """)
+                cursor.execute("DROP INDEX IF EXISTS idx_posts_seen_article")
+                cursor.execute("CREATE UNIQUE INDEX idx_posts_seen_article ON posts(seen_article_id)")
+            # Tabela para guardar a saída de cada etapa (HTML, extração, reescrita da IA)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS article_artifacts (
+                    seen_article_id INTEGER NOT NULL,
+                    stage TEXT NOT NULL, -- FETCHED, EXTRACTED, REWRITTEN
+                    payload BLOB NOT NULL, -- JSON comprimido com zlib
+                    created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    PRIMARY KEY (seen_article_id, stage),
                     FOREIGN KEY(seen_article_id) REFERENCES seen_articles(id)
                 )
             ''')
@@ -91,6 +483,43 @@ class Database:
             for feed_id in PIPELINE_ORDER:
                 cursor.execute("INSERT OR IGNORE INTO feed_status (source_id) VALUES (?)", (feed_id,))
 
+            # Validadores HTTP e hash do corpo de cada URL de feed/sitemap (GET condicional)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS feed_http_state (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    checked_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+                )
+            ''')
+
+            # Impressões SimHash do texto extraído, para achar a mesma matéria em outras fontes
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS story_fingerprints (
+                    seen_article_id INTEGER PRIMARY KEY,
+                    simhash INTEGER NOT NULL, -- 64 bits com sinal
+                    {", ".join(f"band{i} INTEGER NOT NULL" for i in range(SIMHASH_BANDS))},
+                    created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    FOREIGN KEY(seen_article_id) REFERENCES seen_articles(id)
+                )
+            ''')
+            for i in range(SIMHASH_BANDS):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_story_fingerprints_band{i} ON story_fingerprints(band{i})")
+
+            # Jobs do modo batch da IA: artigos EXTRACTED enviados juntos e acompanhados por polling
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ai_batch_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    key_hash TEXT NOT NULL, -- chave que criou o job (só ela consulta o resultado)
+                    state TEXT NOT NULL, -- PENDING, RUNNING, SUCCEEDED, FAILED, CANCELLED, EXPIRED
+                    article_ids TEXT NOT NULL, -- lista JSON de seen_articles.id
+                    error TEXT,
+                    submitted_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    finished_at DATETIME
+                )
+            ''')
+
             # Tabela para gerenciar o status e cooldown das chaves de API
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS api_key_status (
@@ -98,9 +527,27 @@ class Database:
                     api_key TEXT NOT NULL,
                     category TEXT NOT NULL,
                     is_valid BOOLEAN DEFAULT 1,
-                    cooldown_until DATETIME
+                    cooldown_until DATETIME,
+                    success_count INTEGER NOT NULL DEFAULT 0,
+                    failure_count INTEGER NOT NULL DEFAULT 0,
+                    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+                    health REAL NOT NULL DEFAULT 1.0,
+                    last_used_at DATETIME
                 )
             ''')
+            # Bancos criados antes das estatísticas do KeyScheduler
+            cursor.execute("PRAGMA table_info(api_key_status)")
+            existing = {row['name'] for row in cursor.fetchall()}
+            for column, ddl in (
+                ('success_count', 'INTEGER NOT NULL DEFAULT 0'),
+                ('failure_count', 'INTEGER NOT NULL DEFAULT 0'),
+                ('consecutive_failures', 'INTEGER NOT NULL DEFAULT 0'),
+                ('health', 'REAL NOT NULL DEFAULT 1.0'),
+                ('last_used_at', 'DATETIME'),
+            ):
+                if column not in existing:
+                    logger.info(f"Adding missing '{column}' column to api_key_status.")
+                    cursor.execute(f"ALTER TABLE api_key_status ADD COLUMN {column} {ddl}")
 
             # Tabela para rastrear o uso da API para o dashboard
             cursor.execute('''
@@ -121,95 +568,376 @@ class Database:
                     failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+
+            # Reaplica transições que ficaram só no journal (processo encerrado antes do flush)
+            replayed = 0
+            journal_key = str(Path(self._journal_path).resolve()) if self._journal_path else None
+            if journal_key and journal_key not in Database._journal_owners:
+                replayed = self._replay_journal(cursor)
             self.conn.commit()
+            if replayed:
+                logger.info(f"Replayed {replayed} write-behind journal entries.")
+                open(self._journal_path, 'w').close()
             logger.info("Database initialized successfully.")
         except sqlite3.Error as e:
             logger.error(f"Database initialization failed: {e}", exc_info=True)
             raise
 
-    def filter_new_articles(self, source_id: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    @classmethod
+    def _filter_recent(cls, db_path: str, source_id: str, ext_ids: List[str]) -> List[str]:
+        """Drops the ids already known from the recent-keys LRU, refreshing their position."""
+        unseen = []
+        with cls._recent_lock:
+            for ext_id in ext_ids:
+                key = (db_path, source_id, ext_id)
+                if key in cls._recent_keys:
+                    cls._recent_keys.move_to_end(key)
+                else:
+                    unseen.append(ext_id)
+        return unseen
+
+    @classmethod
+    def _remember_recent(cls, db_path: str, source_id: str, ext_ids: List[str]) -> None:
+        with cls._recent_lock:
+            for ext_id in ext_ids:
+                cls._recent_keys[(db_path, source_id, ext_id)] = None
+                cls._recent_keys.move_to_end((db_path, source_id, ext_id))
+            while len(cls._recent_keys) > RECENT_KEYS_MAX:
+                cls._recent_keys.popitem(last=False)
+
+    @_synchronized
+    def filter_new_articles(self, source_id: str, items: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
         """
         Filters a list of feed items, returning only those not already in the database.
         New articles are inserted into the 'seen_articles' table with 'NEW' status.
 
+        Items seen recently are dropped in memory; the rest are inserted with multi-row
+        INSERT ... ON CONFLICT DO NOTHING RETURNING statements in a single transaction,
+        so the rows that come back are exactly the new ones.
+
         Args:
             source_id: The ID of the feed source.
             items: A list of normalized feed items.
 
         Returns:
-            A list of new articles that were added to the database.
+            A list of new articles that were added to the database, or None if they
+            could not be registered (the caller must not mark the feed as read).
         """
+        if not items:
+            return []
+
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for item in items:
+            ext_id = item.get("id")
+            # Defensive check: if 'id' is missing, generate it from the URL.
+            if not ext_id:
+                url = item.get("url") or ""
+                if url:
+                    ext_id = hashlib.sha256(url.encode("utf-8")).hexdigest()
+                    item["id"] = ext_id  # Add it back to the item for later use
+                    logger.warning(f"Item for source '{source_id}' missing 'id'. Generated from URL: {item.get('title')}")
+                else:
+                    logger.warning(f"Item for source '{source_id}' missing both 'id' and 'url', skipping: {item.get('title', 'No Title')}")
+                    continue
+            by_id.setdefault(ext_id, item)  # first occurrence wins, as before
+
+        candidates = self._filter_recent(self.db_path, source_id, list(by_id))
+        if not candidates:
+            return []
+
         new_articles = []
         try:
             cursor = self._get_cursor()
-            for item in items:
-                ext_id = item.get("id")
-                # Defensive check: if 'id' is missing, generate it from the URL.
-                if not ext_id:
-                    url = item.get("url") or ""
-                    if url:
-                        ext_id = hashlib.sha256(url.encode("utf-8")).hexdigest()
-                        item["id"] = ext_id  # Add it back to the item for later use
-                        logger.warning(f"Item for source '{source_id}' missing 'id'. Generated from URL: {item.get('title')}")
-                    else:
-                        logger.warning(f"Item for source '{source_id}' missing both 'id' and 'url', skipping: {item.get('title', 'No Title')}")
-                        continue
-
-                cursor.execute("SELECT id FROM seen_articles WHERE source_id = ? AND external_id = ?", (source_id, ext_id))
-                if cursor.fetchone() is None:
-                    # Item is new, insert it.
-                    cursor.execute(
-                        "INSERT INTO seen_articles (source_id, external_id, url, published_at) VALUES (?, ?, ?, ?)",
-                        (source_id, ext_id, item.get('url'), item.get('published'))
-                    )
-                    item['db_id'] = cursor.lastrowid
-                    new_articles.append(item)
+            for start in range(0, len(candidates), INSERT_BATCH_SIZE):
+                chunk = candidates[start:start + INSERT_BATCH_SIZE]
+                params: List[Any] = []
+                for ext_id in chunk:
+                    item = by_id[ext_id]
+                    params.extend((source_id, ext_id, item.get('url'), item.get('published')))
+                cursor.execute(f"""
+                    INSERT INTO seen_articles (source_id, external_id, url, published_at)
+                    VALUES {",".join(["(?, ?, ?, ?)"] * len(chunk))}
+                    ON CONFLICT(source_id, external_id) DO NOTHING
+                    RETURNING id, external_id
+                """, params)
+                inserted = {row['external_id']: row['id'] for row in cursor.fetchall()}
+                # Keep the feed order for the caller
+                for ext_id in chunk:
+                    if ext_id in inserted:
+                        item = by_id[ext_id]
+                        item['db_id'] = inserted[ext_id]
+                        new_articles.append(item)
             self.conn.commit()
         except sqlite3.Error as e:
             logger.error(f"Database error filtering new articles for {source_id}: {e}", exc_info=True)
             self.conn.rollback()
-            return []
+            return None
         except Exception as e:
             logger.error(f"Unexpected error filtering new articles for {source_id}: {e}", exc_info=True)
             self.conn.rollback()
-            return []
+            return None
+
+        self._remember_recent(self.db_path, source_id, candidates)
         return new_articles
 
 
+    @_synchronized
     def save_processed_post(self, article_db_id: int, wp_post_id: int) -> None:
-        """Saves a record of a successfully published post."""
+        """
+        Saves a record of a successfully published post.
+
+        Marks the article PUBLISHED, records the post and drops its stage artifacts in the
+        next write-behind batch.
+        """
+        try:
+            self._enqueue_write({'op': 'post', 'article_id': article_db_id, 'wp_post_id': wp_post_id})
+            logger.info(f"Successfully recorded published post for article DB ID {article_db_id} (WP Post ID: {wp_post_id}).")
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to save processed post for article DB ID {article_db_id}: {e}")
+
+    @_synchronized
+    def save_stage_artifact(self, article_id: int, stage: str, payload: Dict[str, Any]) -> bool:
+        """
+        Persists the output of a pipeline stage and advances the article status to that stage,
+        in a single transaction.
+
+        Args:
+            article_id: The seen_articles ID.
+            stage: One of PIPELINE_STAGES.
+            payload: JSON-serializable stage output.
+
+        Returns:
+            True if the artifact was stored.
+        """
+        if stage not in PIPELINE_STAGES:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
         try:
+            blob = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
             cursor = self._get_cursor()
-            # First, update the article's status to 'PUBLISHED' and clear any previous failure reason
+            self._apply_pending_writes(cursor)
             cursor.execute(
-                "UPDATE seen_articles SET status = 'PUBLISHED', fail_reason = NULL WHERE id = ?",
-                (article_db_id,)
+                "INSERT OR REPLACE INTO article_artifacts (seen_article_id, stage, payload) VALUES (?, ?, ?)",
+                (article_id, stage, blob)
             )
-            # Then, insert the record into the 'posts' table
             cursor.execute(
-                "INSERT INTO posts (seen_article_id, wp_post_id) VALUES (?, ?)",
-                (article_db_id, wp_post_id)
+                "UPDATE seen_articles SET status = ?, fail_reason = NULL WHERE id = ?",
+                (stage, article_id)
             )
             self.conn.commit()
-            logger.info(f"Successfully recorded published post for article DB ID {article_db_id} (WP Post ID: {wp_post_id}).")
-        except sqlite3.IntegrityError:
-            logger.warning(f"Post record for article DB ID {article_db_id} already exists.")
+            self._pending_writes_committed()
+            return True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Failed to save {stage} artifact for article id {article_id}: {e}")
             self.conn.rollback()
+            return False
+
+    @_synchronized
+    def claim_story_fingerprint(
+        self,
+        article_id: int,
+        fingerprint: int,
+        max_distance: int = 3,
+        window_hours: int = 48,
+    ) -> Optional[int]:
+        """
+        Looks for a recent story within `max_distance` bits of `fingerprint` and, if
+        there is none, records the fingerprint for `article_id`.
+
+        Check and insert run in one transaction under the writer lock, so two copies
+        processed at the same time cannot both pass. A match marks `article_id`
+        DUPLICATE of it in the same transaction; if the original later ends FAILED,
+        its duplicates are requeued (see _release_duplicates). Stories that failed or
+        were themselves duplicates are ignored.
+
+        Args:
+            article_id: The seen_articles ID being processed.
+            fingerprint: Unsigned 64-bit SimHash of its extracted text.
+            max_distance: Maximum Hamming distance for a match (at most SIMHASH_BANDS - 1).
+            window_hours: Only stories fingerprinted within this window are compared.
+
+        Returns:
+            The seen_articles ID of the matching story, or None if this one is new.
+        """
+        max_distance = min(max_distance, SIMHASH_BANDS - 1)
+        mask = (1 << SIMHASH_BAND_BITS) - 1
+        bands = [(fingerprint >> (i * SIMHASH_BAND_BITS)) & mask for i in range(SIMHASH_BANDS)]
+        cutoff = datetime.utcnow() - timedelta(hours=window_hours)
+        try:
+            cursor = self._get_cursor()
+            self._apply_pending_writes(cursor)
+            cursor.execute(f'''
+                SELECT f.seen_article_id, f.simhash FROM story_fingerprints f
+                JOIN seen_articles s ON s.id = f.seen_article_id
+                WHERE ({" OR ".join(f"f.band{i} = ?" for i in range(SIMHASH_BANDS))})
+                  AND f.created_at >= ? AND f.seen_article_id != ?
+                  AND s.status NOT IN ('FAILED', 'DUPLICATE')
+                ORDER BY f.seen_article_id
+            ''', (*bands, cutoff, article_id))
+            match = None
+            for row in cursor.fetchall():
+                if ((row['simhash'] ^ fingerprint) & 0xFFFFFFFFFFFFFFFF).bit_count() <= max_distance:
+                    match = row['seen_article_id']
+                    break
+            if match is not None:
+                cursor.execute(
+                    "UPDATE seen_articles SET status = 'DUPLICATE', duplicate_of = ?, fail_reason = ? WHERE id = ?",
+                    (match, f"Near-duplicate of article {match}", article_id)
+                )
+            else:
+                signed = fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+                cursor.execute(
+                    f"INSERT OR REPLACE INTO story_fingerprints (seen_article_id, simhash, "
+                    f"{', '.join(f'band{i}' for i in range(SIMHASH_BANDS))}) "
+                    f"VALUES ({', '.join('?' * (SIMHASH_BANDS + 2))})",
+                    (article_id, signed, *bands)
+                )
+            self.conn.commit()
+            self._pending_writes_committed()
+            return match
         except sqlite3.Error as e:
-            logger.error(f"Failed to save processed post for article DB ID {article_db_id}: {e}")
+            logger.error(f"Failed to check story fingerprint for article id {article_id}: {e}")
+            self.conn.rollback()
+            return None
+
+    def get_rewrite_backlog(self, limit: int) -> list:
+        """
+        Returns articles waiting for the AI rewrite: extracted (EXTRACTED, or DEFERRED
+        after extraction) and not yet rewritten or handed to a batch job, newest first.
+        """
+        self.flush()
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT s.id, s.source_id, s.url FROM seen_articles s
+                    WHERE s.status IN ('EXTRACTED', 'DEFERRED')
+                      AND EXISTS (SELECT 1 FROM article_artifacts a
+                                  WHERE a.seen_article_id = s.id AND a.stage = 'EXTRACTED')
+                      AND NOT EXISTS (SELECT 1 FROM article_artifacts a
+                                      WHERE a.seen_article_id = s.id AND a.stage = 'REWRITTEN')
+                    ORDER BY s.published_at DESC
+                    LIMIT ?
+                """, (limit,))
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to get the rewrite backlog: {e}")
+            return []
+
+    @_synchronized
+    def save_batch_job(self, job_id: str, key_hash: str, article_ids: List[int]) -> bool:
+        """
+        Records a submitted batch job and marks its articles BATCHED, so the regular
+        work queue leaves them alone until the job finishes.
+
+        Returns:
+            True if the job was stored.
+        """
+        try:
+            cursor = self._get_cursor()
+            self._apply_pending_writes(cursor)
+            cursor.execute(
+                "INSERT INTO ai_batch_jobs (job_id, key_hash, state, article_ids) VALUES (?, ?, 'PENDING', ?)",
+                (job_id, key_hash, json.dumps(article_ids))
+            )
+            placeholders = ','.join('?' for _ in article_ids)
+            cursor.execute(
+                f"UPDATE seen_articles SET status = 'BATCHED', retry_at = NULL WHERE id IN ({placeholders})",
+                article_ids
+            )
+            self.conn.commit()
+            self._pending_writes_committed()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save batch job {job_id}: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_open_batch_jobs(self) -> List[Dict[str, Any]]:
+        """Returns the batch jobs that have not finished yet, oldest first."""
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT job_id, key_hash, state, article_ids, submitted_at FROM ai_batch_jobs "
+                    "WHERE finished_at IS NULL ORDER BY submitted_at, rowid"
+                )
+                return [{**dict(row), 'article_ids': json.loads(row['article_ids'])} for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load open batch jobs: {e}")
+            return []
+
+    @_synchronized
+    def update_batch_job(self, job_id: str, state: str, error: Optional[str] = None, finished: bool = False) -> None:
+        """
+        Stores the latest state of a batch job. When it is `finished`, articles of
+        the job still BATCHED (no usable result) go back to EXTRACTED, so the regular
+        pipeline rewrites them one by one.
+        """
+        try:
+            cursor = self._get_cursor()
+            self._apply_pending_writes(cursor)
+            cursor.execute(
+                "UPDATE ai_batch_jobs SET state = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (state, error, datetime.utcnow() if finished else None, job_id)
+            )
+            if finished:
+                cursor.execute("SELECT article_ids FROM ai_batch_jobs WHERE job_id = ?", (job_id,))
+                row = cursor.fetchone()
+                article_ids = json.loads(row['article_ids']) if row else []
+                if article_ids:
+                    placeholders = ','.join('?' for _ in article_ids)
+                    cursor.execute(
+                        f"UPDATE seen_articles SET status = 'EXTRACTED' WHERE status = 'BATCHED' AND id IN ({placeholders})",
+                        article_ids
+                    )
+                    if cursor.rowcount:
+                        logger.info(f"Batch job {job_id}: {cursor.rowcount} article(s) returned to the regular queue.")
+            self.conn.commit()
+            self._pending_writes_committed()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update batch job {job_id}: {e}")
             self.conn.rollback()
 
+    def load_stage_artifacts(self, article_id: int) -> Dict[str, Dict[str, Any]]:
+        """Returns the stored stage outputs of an article, keyed by stage name."""
+        artifacts: Dict[str, Dict[str, Any]] = {}
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT stage, payload FROM article_artifacts WHERE seen_article_id = ?",
+                    (article_id,)
+                )
+                for row in cursor.fetchall():
+                    try:
+                        artifacts[row['stage']] = json.loads(zlib.decompress(row['payload']).decode('utf-8'))
+                    except (zlib.error, ValueError) as e:
+                        logger.warning(f"Discarding corrupt {row['stage']} artifact for article id {article_id}: {e}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load artifacts for article id {article_id}: {e}")
+        return artifacts
+
+    @staticmethod
+    def last_completed_stage(artifacts: Dict[str, Any]) -> Optional[str]:
+        """Returns the most advanced stage present in `artifacts`, or None."""
+        for stage in reversed(PIPELINE_STAGES):
+            if stage in artifacts:
+                return stage
+        return None
+
     def get_pipeline_state(self, key: str) -> str | None:
         """Gets a value from the pipeline state table."""
         try:
-            cursor = self._get_cursor()
-            cursor.execute("SELECT value FROM pipeline_state WHERE key = ?", (key,))
-            row = cursor.fetchone()
-            return row['value'] if row else None
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT value FROM pipeline_state WHERE key = ?", (key,))
+                row = cursor.fetchone()
+                return row['value'] if row else None
         except sqlite3.Error as e:
             logger.error(f"Failed to get pipeline state for key '{key}': {e}")
             return None
 
+    @_synchronized
     def set_pipeline_state(self, key: str, value: str):
         """Sets a value in the pipeline state table."""
         try:
@@ -222,14 +950,16 @@ class Database:
     def get_consecutive_failures(self, source_id: str) -> int:
         """Gets the consecutive failure count for a feed source."""
         try:
-            cursor = self._get_cursor()
-            cursor.execute("SELECT consecutive_failures FROM feed_status WHERE source_id = ?", (source_id,))
-            row = cursor.fetchone()
-            return row['consecutive_failures'] if row else 0
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT consecutive_failures FROM feed_status WHERE source_id = ?", (source_id,))
+                row = cursor.fetchone()
+                return row['consecutive_failures'] if row else 0
         except sqlite3.Error as e:
             logger.error(f"Failed to get consecutive failures for '{source_id}': {e}")
             return 0 # Assume 0 on error to avoid breaking the pipeline
 
+    @_synchronized
     def increment_consecutive_failures(self, source_id: str):
         """Increments the consecutive failure count for a feed source."""
         try:
@@ -242,6 +972,7 @@ class Database:
         except sqlite3.Error as e:
             logger.error(f"Failed to increment consecutive failures for '{source_id}': {e}")
 
+    @_synchronized
     def reset_consecutive_failures(self, source_id: str):
         """Resets the consecutive failure count for a feed source."""
         try:
@@ -251,47 +982,176 @@ class Database:
         except sqlite3.Error as e:
             logger.error(f"Failed to reset consecutive failures for '{source_id}': {e}")
 
-    def update_article_status(self, article_id: int, status: str, retry_at: datetime | None = None, reason: str | None = None):
-        """Updates the status of an article in the seen_articles table."""
+    def get_feed_http_states(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns the stored ETag, Last-Modified and body hash for each known feed URL."""
+        if not urls:
+            return {}
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                placeholders = ",".join("?" * len(urls))
+                cursor.execute(
+                    f"SELECT url, etag, last_modified, content_hash FROM feed_http_state WHERE url IN ({placeholders})",
+                    list(urls)
+                )
+                return {row['url']: dict(row) for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load feed HTTP state: {e}")
+            return {}
+
+    @_synchronized
+    def save_feed_http_states(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """Upserts the validators and body hash of feed URLs (see FeedReader.commit_feed_state)."""
+        if not states:
+            return
         try:
             cursor = self._get_cursor()
+            cursor.executemany('''
+                INSERT INTO feed_http_state (url, etag, last_modified, content_hash, checked_at)
+                VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag, last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash, checked_at = excluded.checked_at
+            ''', [
+                (url, st.get('etag'), st.get('last_modified'), st.get('content_hash'))
+                for url, st in states.items()
+            ])
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save feed HTTP state: {e}")
+            self.conn.rollback()
+
+    def get_api_key_statuses(self, category: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the persisted state of the API keys of `category`, keyed by key_hash."""
+        self.flush()
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT {', '.join(API_KEY_STATUS_COLUMNS)} FROM api_key_status WHERE category = ?",
+                    (category,)
+                )
+                return {row['key_hash']: dict(row) for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load API key status: {e}")
+            return {}
+
+    @_synchronized
+    def save_api_key_status(self, row: Dict[str, Any]) -> None:
+        """
+        Upserts the cooldown and counters of one API key (see KeyScheduler).
+
+        Written behind, together with the article status changes.
+        """
+        try:
+            self._enqueue_write({'op': 'key_status', 'row': row})
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to save API key status: {e}")
+
+    @_synchronized
+    def update_article_status(self, article_id: int, status: str, retry_at: datetime | None = None, reason: str | None = None):
+        """
+        Updates the status of an article in the seen_articles table.
+
+        The change is journaled and committed with the next write-behind batch (see flush).
+        """
+        try:
+            op = {
+                'op': 'status', 'article_id': article_id, 'status': status,
+                'retry_at': retry_at, 'reason': reason,
+            }
             if status == 'DEFERRED':
+                # Absolute value, so replaying the journal cannot count the failure twice
+                op['fail_count'] = self._next_fail_count(article_id)
+            self._enqueue_write(op)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to update article status for id {article_id}: {e}")
+
+    @_synchronized
+    def defer_article(self, article_id: int, reason: str) -> str:
+        """
+        Schedules a retry for an article that failed with a transient error, using
+        exponential backoff from RETRY_CONFIG. Stage artifacts are kept, so the retry
+        resumes where the article stopped.
+
+        Returns:
+            The new status: 'DEFERRED', or 'FAILED' once max_attempts is reached.
+        """
+        try:
+            cursor = self._get_cursor()
+            self._apply_pending_writes(cursor)
+            cursor.execute("SELECT fail_count FROM seen_articles WHERE id = ?", (article_id,))
+            row = cursor.fetchone()
+            attempts = (row['fail_count'] if row else 0) + 1
+
+            if attempts >= RETRY_CONFIG['max_attempts']:
                 cursor.execute(
-                    "UPDATE seen_articles SET status = ?, retry_at = ?, fail_reason = ?, fail_count = fail_count + 1 WHERE id = ?",
-                    (status, retry_at, reason, article_id)
+                    "UPDATE seen_articles SET status = 'FAILED', fail_reason = ?, fail_count = ?, retry_at = NULL WHERE id = ?",
+                    (f"Gave up after {attempts} attempts: {reason}", attempts, article_id)
                 )
-            else:
-                if reason:
-                    cursor.execute(
-                        "UPDATE seen_articles SET status = ?, fail_reason = ? WHERE id = ?",
-                        (status, reason, article_id))
-                else:
-                    cursor.execute("UPDATE seen_articles SET status = ? WHERE id = ?", (status, article_id))
+                self._release_duplicates(cursor, article_id)
+                self.conn.commit()
+                self._pending_writes_committed()
+                logger.warning(f"Article id {article_id} failed {attempts} times. Marking as FAILED.")
+                return 'FAILED'
+
+            delay = min(
+                RETRY_CONFIG['base_delay_seconds'] * (2 ** (attempts - 1)),
+                RETRY_CONFIG['max_delay_seconds']
+            )
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            cursor.execute(
+                "UPDATE seen_articles SET status = 'DEFERRED', fail_reason = ?, fail_count = ?, retry_at = ? WHERE id = ?",
+                (reason, attempts, retry_at, article_id)
+            )
             self.conn.commit()
+            self._pending_writes_committed()
+            logger.info(f"Article id {article_id} deferred (attempt {attempts}) until {retry_at:%Y-%m-%d %H:%M:%S} UTC: {reason}")
+            return 'DEFERRED'
         except sqlite3.Error as e:
-            logger.error(f"Failed to update article status for id {article_id}: {e}")
+            logger.error(f"Failed to defer article id {article_id}: {e}")
+            self.conn.rollback()
+            return 'FAILED'
 
     def get_articles_to_process(self, source_id: str, limit: int) -> list:
-        """Gets new or deferred articles for a given feed source."""
+        """
+        Gets the due work for a feed source, straight from the database:
+          - DEFERRED articles whose retry_at has passed,
+          - articles interrupted after a persisted stage (see PIPELINE_STAGES),
+          - then NEW articles discovered within the last `new_article_max_age_hours`,
+            newest first.
+
+        Queued status changes are flushed first, so the queue never sees stale states.
+        """
+        self.flush()
         try:
-            cursor = self._get_cursor()
-            now = datetime.utcnow()
-            # Prioritizes deferred articles that are ready for retry, then new ones.
-            cursor.execute("""
-                SELECT id, external_id, url, status FROM seen_articles
-                WHERE source_id = ? AND (status = 'NEW' OR (status = 'DEFERRED' AND retry_at < ?))
-                ORDER BY status DESC, published_at DESC
-                LIMIT ?
-            """, (source_id, now, limit))
-            return cursor.fetchall()
+            with self._read() as conn:
+                cursor = conn.cursor()
+                now = datetime.utcnow()
+                max_age = timedelta(hours=SCHEDULE_CONFIG.get('new_article_max_age_hours', 24))
+                stage_placeholders = ','.join('?' for _ in PIPELINE_STAGES)
+                cursor.execute(f"""
+                    SELECT id, source_id, external_id, url, status, published_at FROM seen_articles
+                    WHERE source_id = ? AND (
+                           (status = 'DEFERRED' AND retry_at <= ?)
+                        OR status IN ({stage_placeholders})
+                        OR (status = 'PROCESSING' AND EXISTS (
+                            SELECT 1 FROM article_artifacts a WHERE a.seen_article_id = seen_articles.id))
+                        OR (status = 'NEW' AND inserted_at >= ?)
+                    )
+                    ORDER BY CASE WHEN status = 'NEW' THEN 1 ELSE 0 END, published_at DESC
+                    LIMIT ?
+                """, (source_id, now, *PIPELINE_STAGES, now - max_age, limit))
+                return cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Failed to get articles to process for source_id '{source_id}': {e}")
             return []
 
+    @_synchronized
     def cleanup_old_entries(self, cutoff_time: datetime) -> int:
         """
         Deletes records from seen_articles and posts older than the cutoff time.
-        Only deletes articles with status 'PUBLISHED' or 'FAILED'.
+        Only deletes articles with status 'PUBLISHED', 'FAILED' or 'DUPLICATE'.
 
         Args:
             cutoff_time: The datetime threshold. Records older than this will be deleted.
@@ -299,12 +1159,13 @@ class Database:
         Returns:
             The number of records deleted from seen_articles.
         """
+        self.flush()
         try:
             cursor = self._get_cursor()
 
             # Find IDs of old articles to delete
             cursor.execute(
-                "SELECT id FROM seen_articles WHERE inserted_at < ? AND status IN ('PUBLISHED', 'FAILED')",
+                "SELECT id FROM seen_articles WHERE inserted_at < ? AND status IN ('PUBLISHED', 'FAILED', 'DUPLICATE')",
                 (cutoff_time,)
             )
             article_ids_to_delete = [row['id'] for row in cursor.fetchall()]
@@ -315,9 +1176,12 @@ class Database:
             placeholders = ','.join('?' for _ in article_ids_to_delete)
 
             cursor.execute(f"DELETE FROM posts WHERE seen_article_id IN ({placeholders})", article_ids_to_delete)
+            cursor.execute(f"DELETE FROM article_artifacts WHERE seen_article_id IN ({placeholders})", article_ids_to_delete)
+            cursor.execute(f"DELETE FROM story_fingerprints WHERE seen_article_id IN ({placeholders})", article_ids_to_delete)
             cursor.execute(f"DELETE FROM seen_articles WHERE id IN ({placeholders})", article_ids_to_delete)
 
             deleted_count = cursor.rowcount
+            cursor.execute("DELETE FROM ai_batch_jobs WHERE finished_at < ?", (cutoff_time,))
             self.conn.commit()
             return deleted_count
         except sqlite3.Error as e:
@@ -326,7 +1190,22 @@ class Database:
             return 0
 
     def close(self):
-        """Closes the database connection."""
+        """Flushes the write-behind queue and closes the database connection."""
+        if self._flusher:
+            self._flusher_stop.set()
+            self._flusher.join()
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+            with self._recent_lock:
+                Database._journal_owners.discard(str(Path(self._journal_path).resolve()))
+            if not self._pending_writes and os.path.getsize(self._journal_path) == 0:
+                os.remove(self._journal_path)
         if self.conn:
             self.conn.close()
             self.conn = None
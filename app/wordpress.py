@@ -3,9 +3,14 @@ import requests
 import time
 import json
 import re 
-from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, List, Tuple
 from urllib.parse import urlparse
 
+from .exceptions import TransientError, WordPressPublisherError
+from .rate_limit import RateLimiter, get_rate_limiter
+
 logger = logging.getLogger(__name__)
 
 def _slugify(name: str) -> str:
@@ -21,7 +26,21 @@ def _slugify(name: str) -> str:
 class WordPressClient:
     """A client for interacting with the WordPress REST API."""
 
-    def __init__(self, config: Dict[str, str], categories_map: Dict[str, int]):
+    def __init__(
+        self,
+        config: Dict[str, str],
+        categories_map: Dict[str, int],
+        rate_limiter: Optional[RateLimiter] = None,
+        on_post_created: Optional[Callable[[Dict[str, Any], List[str]], None]] = None,
+    ):
+        """
+        Args:
+            config: WORDPRESS_CONFIG (url, user, password).
+            categories_map: Category names to IDs.
+            rate_limiter: Token buckets per endpoint (process-wide by default).
+            on_post_created: Called after create_post succeeds with the post returned
+                by WordPress and the tag names it was given (see app.link_map).
+        """
         self.api_url = (config.get('url') or "").rstrip('/')
         if not self.api_url:
             raise ValueError("WORDPRESS_URL is not configured.")
@@ -32,6 +51,12 @@ class WordPressClient:
         if self.user and self.password:
             self.session.auth = (self.user, self.password)
         self.session.headers.update({'User-Agent': 'VocMoney-Pipeline/1.0'})
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.on_post_created = on_post_created
+
+    def _throttle(self, endpoint: str) -> None:
+        """Waits for the token bucket of a REST endpoint ('posts', 'media', 'tags', ...)."""
+        self.rate_limiter.acquire(f"wordpress:{endpoint}")
 
     def get_domain(self) -> str:
         """Extracts the domain from the WordPress URL."""
@@ -47,6 +72,7 @@ class WordPressClient:
         params = {"search": name, "per_page": 100}
 
         try:
+            self._throttle('tags')
             r = self.session.get(tags_endpoint, params=params, timeout=20)
             r.raise_for_status()
             items = r.json()
@@ -71,6 +97,7 @@ class WordPressClient:
         payload = {"name": name, "slug": _slugify(name)}
         
         try:
+            self._throttle('tags')
             r = self.session.post(tags_endpoint, json=payload, timeout=20)
             
             if r.status_code in (200, 201):
@@ -127,6 +154,7 @@ class WordPressClient:
         params = {"search": name, "per_page": 100}
 
         try:
+            self._throttle('categories')
             r = self.session.get(endpoint, params=params, timeout=20)
             r.raise_for_status()
             items = r.json()
@@ -152,6 +180,7 @@ class WordPressClient:
         payload = {"name": name, "slug": _slugify(name)}
         
         try:
+            self._throttle('categories')
             r = self.session.post(endpoint, json=payload, timeout=20)
             
             if r.status_code in (200, 201):
@@ -220,6 +249,7 @@ class WordPressClient:
                     'Content-Disposition': f'attachment; filename="{filename}"',
                     'Content-Type': content_type,
                 }
+                self._throttle('media')
                 wp_response = self.session.post(media_endpoint, headers=headers, data=img_response.content, timeout=40)
                 wp_response.raise_for_status()
                 logger.info(f"Successfully uploaded image: {image_url}")
@@ -246,6 +276,7 @@ class WordPressClient:
         try:
             endpoint = f"{self.api_url}/media/{media_id}"
             payload = {"alt_text": alt_text}
+            self._throttle('media')
             r = self.session.post(endpoint, json=payload, timeout=20)
             r.raise_for_status()
             logger.info(f"Successfully set alt text for media ID {media_id}.")
@@ -263,6 +294,7 @@ class WordPressClient:
         try:
             endpoint = f"{self.api_url}/search"
             params = {"search": term, "per_page": limit, "_embed": "self"}
+            self._throttle('search')
             resp = self.session.get(endpoint, params=params, timeout=15)
             resp.raise_for_status()
             # The 'url' in the search result is the API URL, we need the 'link' from the embedded post object
@@ -285,16 +317,27 @@ class WordPressClient:
         logger.error(f"[WP] status={resp.status_code} ct={ct} body[:400]={body_preview}")
 
     def create_post(self, payload: Dict[str, Any]) -> Optional[int]:
-        """Creates a new post in WordPress, including Yoast SEO metadata."""
+        """
+        Creates a new post in WordPress, including Yoast SEO metadata.
+
+        Returns the post ID, or None on a permanent failure. Raises TransientError on
+        429 responses, and on timeouts, connection errors and 5xx responses once a
+        lookup by slug shows the post was not created. Once the post exists, failures
+        of the follow-up meta check are only logged.
+        """
         # The pipeline now constructs the full payload, including the 'meta' block.
         # This method is responsible for sending it and verifying the result.
         
         # First, ensure tags are resolved to IDs, as this is a client function.
+        tag_names: List[str] = []
         if 'tags' in payload and payload['tags']:
+            tag_names = [t.strip() for t in payload['tags'] if isinstance(t, str) and t.strip() and not t.strip().isdigit()]
             payload['tags'] = self._ensure_tag_ids(payload['tags'])
 
         posts_endpoint = f"{self.api_url}/posts"
         payload.setdefault('status', 'publish')
+        # Lower bound for finding this post again if the create request's outcome is unknown
+        sent_after = datetime.now(timezone.utc) - timedelta(minutes=5)
 
         try:
             logger.info(
@@ -304,6 +347,7 @@ class WordPressClient:
                 payload.get('categories'),
                 payload.get('tags')
             )
+            self._throttle('posts')
             resp = self.session.post(posts_endpoint, json=payload, timeout=60)
 
             # Handle errors + log non-JSON body
@@ -312,91 +356,184 @@ class WordPressClient:
                 resp.raise_for_status()  # Raise HTTPError for the calling function to handle
 
             data = resp.json()
-            post_id = data.get("id")
-            if not post_id:
-                self._log_wp_response(resp)
-                logger.error("Post created, but no ID was returned in the response.")
-                return None
-
-            logger.info(f"Post {post_id} created successfully. Verifying meta fields.")
-
-            # Re-validation step to ensure meta fields were saved
-            yoast_meta = payload.get("meta", {})
-            if yoast_meta:
-                check_url = f"{self.api_url}/posts/{post_id}"
-                check = self.session.get(check_url, timeout=30)
-                if check.ok:
-                    meta = check.json().get("meta", {})
-                    missing = [k for k, v in yoast_meta.items() if v and meta.get(k) != v]
-                    if missing:
-                        logger.warning(f"Post {post_id}: Yoast meta fields were not saved correctly on initial POST: {missing}. Attempting update.")
-                        fix_resp = self.session.post(f"{self.api_url}/posts/{post_id}", json={"meta": yoast_meta}, timeout=60)
-                        if not fix_resp.ok:
-                            self._log_wp_response(fix_resp)
-                            logger.error(f"Failed to update missing meta for post {post_id}.")
-
-            return post_id
 
         except requests.RequestException as e:
             logger.error(f"Failed to create WordPress post: {e}")
+            status = None
             if e.response is not None:
                 self._log_wp_response(e.response)
-            return None
+                status = e.response.status_code
+            if status == 429:
+                raise TransientError(f"WordPress unavailable: {e}") from e
+            if not (isinstance(e, (requests.Timeout, requests.ConnectionError)) or (status and status >= 500)):
+                return None
+            # WordPress may have created the post before the request failed; retrying
+            # blindly would publish the story twice.
+            try:
+                data = self._find_created_post(payload, sent_after)
+            except WordPressPublisherError as lookup_error:
+                logger.error(f"Not retrying the post, it may already exist: {lookup_error}")
+                return None
+            if data is None:
+                raise TransientError(f"WordPress unavailable: {e}") from e
+            logger.info(f"Post {data.get('id')} was created despite the failed request.")
         except Exception as e:
             logger.error(f"An unexpected error occurred during post creation: {e}", exc_info=True)
             return None
 
-    def get_published_posts(self, fields: List[str], max_posts: Optional[int] = None) -> List[Dict[str, Any]]:
+        post_id = data.get("id") if isinstance(data, dict) else None
+        if not post_id:
+            logger.error("Post created, but no ID was returned in the response.")
+            return None
+
+        logger.info(f"Post {post_id} created successfully. Verifying meta fields.")
+
+        # The post exists from here on: failures below are logged, never retried
+        try:
+            self._verify_post_meta(post_id, payload.get("meta", {}))
+        except Exception as e:
+            logger.error(f"Post {post_id}: could not verify Yoast meta fields: {e}")
+
+        if self.on_post_created:
+            try:
+                self.on_post_created(data, tag_names)
+            except Exception as e:
+                # The post is published; a listener failure must not turn it into a retry
+                logger.warning(f"Post {post_id}: on_post_created listener failed: {e}")
+
+        return post_id
+
+    def _verify_post_meta(self, post_id: int, yoast_meta: Dict[str, Any]) -> None:
+        """Re-reads a created post and re-sends its Yoast meta fields if they were not saved."""
+        if not yoast_meta:
+            return
+        check_url = f"{self.api_url}/posts/{post_id}"
+        self._throttle('posts')
+        check = self.session.get(check_url, timeout=30)
+        if not check.ok:
+            self._log_wp_response(check)
+            return
+        meta = check.json().get("meta", {})
+        missing = [k for k, v in yoast_meta.items() if v and meta.get(k) != v]
+        if missing:
+            logger.warning(f"Post {post_id}: Yoast meta fields were not saved correctly on initial POST: {missing}. Attempting update.")
+            self._throttle('posts')
+            fix_resp = self.session.post(check_url, json={"meta": yoast_meta}, timeout=60)
+            if not fix_resp.ok:
+                self._log_wp_response(fix_resp)
+                logger.error(f"Failed to update missing meta for post {post_id}.")
+
+    def _find_created_post(self, payload: Dict[str, Any], sent_after: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Looks up a post that a failed create request may still have created.
+
+        Matches on the payload's slug among posts dated after `sent_after`.
+        Returns the post, or None if WordPress has no such post. Raises
+        WordPressPublisherError if that cannot be determined.
+        """
+        slug = payload.get('slug')
+        if not slug:
+            raise WordPressPublisherError("the payload has no slug to look it up by")
+        params = {
+            'slug': slug,
+            'status': payload.get('status', 'publish'),
+            'after': sent_after.isoformat(),
+            'context': 'edit',
+        }
+        try:
+            self._throttle('posts')
+            r = self.session.get(f"{self.api_url}/posts", params=params, timeout=30)
+            r.raise_for_status()
+            posts = r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise WordPressPublisherError(f"lookup of slug '{slug}' failed: {e}") from e
+        return posts[0] if posts else None
+
+    def _fetch_posts_page(self, params: Dict[str, Any], page: int) -> Tuple[Optional[List[Dict[str, Any]]], Optional[int]]:
+        """
+        Fetches one page of posts.
+
+        Returns:
+            (posts, total_pages); posts is None on error, total_pages None when the
+            X-WP-TotalPages header is missing.
+        """
+        try:
+            logger.info(f"Fetching page {page} of published posts...")
+            self._throttle('posts')
+            r = self.session.get(f"{self.api_url}/posts", params={**params, "page": page}, timeout=30)
+            if r.status_code == 400 and page > 1:
+                # Past the last page (rest_post_invalid_page_number)
+                return [], None
+            r.raise_for_status()
+            total_pages = r.headers.get('X-WP-TotalPages')
+            return r.json(), int(total_pages) if total_pages and total_pages.isdigit() else None
+        except requests.RequestException as e:
+            logger.error(f"Error fetching published posts (page {page}): {e}")
+            if e.response is not None:
+                logger.error(f"Response body: {e.response.text}")
+            return None, None
+
+    def get_published_posts(
+        self,
+        fields: List[str],
+        max_posts: Optional[int] = None,
+        modified_after: Optional[str] = None,
+        workers: int = 1,
+    ) -> List[Dict[str, Any]]:
         """
         Fetches published posts, handling pagination, with an optional limit.
 
         Args:
             fields: A list of fields to retrieve for each post.
             max_posts: Optional limit on the total number of posts to fetch.
+            modified_after: Only posts modified after this ISO 8601 date (site time).
+            workers: Once the first page reports X-WP-TotalPages, the remaining pages
+                are fetched with up to this many concurrent requests.
+
+        Raises:
+            WordPressPublisherError: if any page could not be fetched, so callers never
+                mistake a partial list for the complete one.
         """
-        all_posts = []
-        page = 1
         per_page = 100
-        
-        fields_str = ','.join(fields)
-
-        while True:
-            # Exit if we have reached the desired number of posts
-            if max_posts and len(all_posts) >= max_posts:
-                logger.info(f"Reached max_posts limit of {max_posts}. Stopping fetch.")
-                break
-
-            endpoint = f"{self.api_url}/posts"
-            params = {
-                "status": "publish",
-                "per_page": per_page,
-                "page": page,
-                "_fields": fields_str,
-            }
-            try:
-                logger.info(f"Fetching page {page} of published posts...")
-                r = self.session.get(endpoint, params=params, timeout=30)
-                r.raise_for_status()
-                
-                posts = r.json()
-                if not posts:
-                    logger.info("No more posts found. Finished fetching.")
+        params = {
+            "status": "publish",
+            "per_page": per_page,
+            "_fields": ','.join(fields),
+        }
+        if modified_after:
+            params["modified_after"] = modified_after
+            params["orderby"] = "modified"
+
+        posts, total_pages = self._fetch_posts_page(params, 1)
+        if posts is None:
+            raise WordPressPublisherError("Could not fetch page 1 of published posts.")
+        all_posts = list(posts)
+        max_pages = -(-max_posts // per_page) if max_posts else None
+
+        if posts and len(posts) == per_page and total_pages and workers > 1:
+            last_page = min(total_pages, max_pages) if max_pages else total_pages
+            with ThreadPoolExecutor(max_workers=min(workers, max(1, last_page - 1)),
+                                    thread_name_prefix='wp-posts') as pool:
+                # map() keeps page order, so the result is still newest first
+                pages = range(2, last_page + 1)
+                for page, (page_posts, _) in zip(pages, pool.map(lambda page: self._fetch_posts_page(params, page), pages)):
+                    if page_posts is None:
+                        raise WordPressPublisherError(f"Could not fetch page {page} of published posts.")
+                    all_posts.extend(page_posts)
+        elif posts and len(posts) == per_page:
+            page = 2
+            while not max_pages or page <= max_pages:
+                page_posts, _ = self._fetch_posts_page(params, page)
+                if page_posts is None:
+                    raise WordPressPublisherError(f"Could not fetch page {page} of published posts.")
+                if not page_posts:
                     break
-                
-                all_posts.extend(posts)
-                
-                if len(posts) < per_page:
-                    logger.info(f"Last page reached ({len(posts)} posts). Finished fetching.")
+                all_posts.extend(page_posts)
+                if len(page_posts) < per_page:
+                    logger.info(f"Last page reached ({len(page_posts)} posts). Finished fetching.")
                     break
-                    
                 page += 1
 
-            except requests.RequestException as e:
-                logger.error(f"Error fetching published posts (page {page}): {e}")
-                if e.response is not None:
-                    logger.error(f"Response body: {e.response.text}")
-                break
-        
         # Trim the list to the exact number if max_posts is set
         if max_posts:
             all_posts = all_posts[:max_posts]
@@ -427,6 +564,7 @@ class WordPressClient:
             }
             try:
                 logger.info(f"Fetching names for {len(chunk)} tag IDs...")
+                self._throttle('tags')
                 r = self.session.get(endpoint, params=params, timeout=30)
                 r.raise_for_status()
                 tags_data = r.json()
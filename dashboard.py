@@ -5,8 +5,9 @@ Dashboard web para o sistema de automação RSS-para-WordPress
 
 import os
 import sys
-import sqlite3
 import json
+import sqlite3
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
@@ -51,6 +52,19 @@ except ImportError:
     print("="*80)
     RSS_FEEDS, PIPELINE_ORDER, SCHEDULE_CONFIG = {}, [], {}
 
+try:
+    from app.store import read_connection
+except ImportError:
+    # Without app.store there is no read pool: open a plain read-only connection instead
+    @contextmanager
+    def read_connection(db_path):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
@@ -63,63 +77,62 @@ def get_db_stats():
     try:
         if not DB_PATH.exists():
             raise FileNotFoundError(f"Database not found at {DB_PATH}")
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Get article counts
-        cursor.execute('SELECT COUNT(*) FROM seen_articles')
-        seen_count = cursor.fetchone()[0]
-
-        cursor.execute('SELECT COUNT(*) FROM posts')
-        published_count = cursor.fetchone()[0]
-
-        cursor.execute('SELECT COUNT(*) FROM failures')
-        failure_count = cursor.fetchone()[0]
-
-        # Get recent posts
-        cursor.execute('''
-            SELECT source_id, external_id, wp_post_id, created_at 
-            FROM posts 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        ''')
-        recent_posts = cursor.fetchall()
-
-        # Get API usage stats
-        cursor.execute('''
-            SELECT api_type, SUM(usage_count) as usage_count
-            FROM api_usage 
-            WHERE last_used > datetime('now', '-24 hours')
-            GROUP BY api_type
-        ''')
-        api_usage = cursor.fetchall()
-
-        # Calculate next cycle time based on last activity or 15 minutes from now
-        cursor.execute('''
-            SELECT MAX(inserted_at) FROM seen_articles 
-            WHERE inserted_at > datetime('now', '-2 hours')
-        ''')
-        row = cursor.fetchone()
-        last_activity = row[0] if row and row[0] else None
-
-        check_interval = SCHEDULE_CONFIG.get('check_interval', 15)
-
-        if last_activity:
-            try:
-                # SQLite datetime format is 'YYYY-MM-DD HH:MM:SS'
-                last_time = datetime.strptime(last_activity, '%Y-%m-%d %H:%M:%S')
-                next_cycle = last_time + timedelta(minutes=check_interval)
-                # If next cycle is in the past, schedule for 15 minutes from now
-                if next_cycle < datetime.now():
+        # Conexão do pool somente leitura: com WAL não bloqueia o pipeline
+        with read_connection(DB_PATH) as conn:
+            cursor = conn.cursor()
+
+            # Get article counts
+            cursor.execute('SELECT COUNT(*) FROM seen_articles')
+            seen_count = cursor.fetchone()[0]
+
+            cursor.execute('SELECT COUNT(*) FROM posts')
+            published_count = cursor.fetchone()[0]
+
+            cursor.execute('SELECT COUNT(*) FROM failures')
+            failure_count = cursor.fetchone()[0]
+
+            # Get recent posts
+            cursor.execute('''
+                SELECT source_id, external_id, wp_post_id, created_at 
+                FROM posts 
+                ORDER BY created_at DESC 
+                LIMIT 10
+            ''')
+            recent_posts = cursor.fetchall()
+
+            # Get API usage stats
+            cursor.execute('''
+                SELECT api_type, SUM(usage_count) as usage_count
+                FROM api_usage 
+                WHERE last_used > datetime('now', '-24 hours')
+                GROUP BY api_type
+            ''')
+            api_usage = cursor.fetchall()
+
+            # Calculate next cycle time based on last activity or 15 minutes from now
+            cursor.execute('''
+                SELECT MAX(inserted_at) FROM seen_articles 
+                WHERE inserted_at > datetime('now', '-2 hours')
+            ''')
+            row = cursor.fetchone()
+            last_activity = row[0] if row and row[0] else None
+
+            check_interval = SCHEDULE_CONFIG.get('check_interval', 15)
+
+            if last_activity:
+                try:
+                    # SQLite datetime format is 'YYYY-MM-DD HH:MM:SS'
+                    last_time = datetime.strptime(last_activity, '%Y-%m-%d %H:%M:%S')
+                    next_cycle = last_time + timedelta(minutes=check_interval)
+                    # If next cycle is in the past, schedule for 15 minutes from now
+                    if next_cycle < datetime.now():
+                        next_cycle = datetime.now() + timedelta(minutes=check_interval)
+                except (ValueError, TypeError):
                     next_cycle = datetime.now() + timedelta(minutes=check_interval)
-            except (ValueError, TypeError):
+            else:
                 next_cycle = datetime.now() + timedelta(minutes=check_interval)
-        else:
-            next_cycle = datetime.now() + timedelta(minutes=check_interval)
             
-        next_cycle_str = next_cycle.strftime('%H:%M:%S')
-
-        conn.close()
+            next_cycle_str = next_cycle.strftime('%H:%M:%S')
 
         return {
             'seen_articles': seen_count,
@@ -332,36 +345,35 @@ def feeds_page():
     """Feeds management page"""
     feed_stats = []
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        for source_id in PIPELINE_ORDER:
-            config = RSS_FEEDS.get(source_id)
-            if not config:
-                continue
+        # Conexão do pool somente leitura: com WAL não bloqueia o pipeline
+        with read_connection(DB_PATH) as conn:
+            cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT COUNT(*) FROM seen_articles 
-                WHERE source_id = ? AND inserted_at > datetime('now', '-24 hours')
-            ''', (source_id,))
-            recent_count = cursor.fetchone()[0]
-
-            cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE source_id = ?
-            ''', (source_id,))
-            published_count = cursor.fetchone()[0]
-
-            feed_stats.append({
-                'id': source_id,
-                'name': source_id.replace('_', ' ').title(),
-                'url': config.get('urls', ['N/A'])[0],
-                'category': config['category'],
-                'recent_articles': recent_count,
-                'published_posts': published_count
-            })
+            for source_id in PIPELINE_ORDER:
+                config = RSS_FEEDS.get(source_id)
+                if not config:
+                    continue
 
-        conn.close()
+                cursor.execute('''
+                    SELECT COUNT(*) FROM seen_articles 
+                    WHERE source_id = ? AND inserted_at > datetime('now', '-24 hours')
+                ''', (source_id,))
+                recent_count = cursor.fetchone()[0]
+
+                cursor.execute('''
+                    SELECT COUNT(*) FROM posts 
+                    WHERE source_id = ?
+                ''', (source_id,))
+                published_count = cursor.fetchone()[0]
+
+                feed_stats.append({
+                    'id': source_id,
+                    'name': source_id.replace('_', ' ').title(),
+                    'url': config.get('urls', ['N/A'])[0],
+                    'category': config['category'],
+                    'recent_articles': recent_count,
+                    'published_posts': published_count
+                })
     except Exception as e:
         logging.error(f"Error getting feed stats: {e}")
         # Fallback with no stats on DB error
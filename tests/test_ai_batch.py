@@ -0,0 +1,79 @@
+"""
+Unit tests for the ai_batch module
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from app.ai_batch import BatchRunner, LocalBatchBackend
+from app.ai_processor import AIProcessor
+from app.keys import KeyScheduler
+from app.store import Database
+from tests.test_keys import VALID_RESPONSE
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Test cases for the BatchRunner class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmpdir.name, 'test.db'))
+        self.db.initialize()
+        items = [{'id': f'a{i}', 'url': f'https://example.com/a{i}'} for i in range(4)]
+        self.ids = [a['db_id'] for a in self.db.filter_new_articles('valor_financas', items)]
+        for article_id in self.ids[:3]:
+            self.db.save_stage_artifact(article_id, 'EXTRACTED', {'title': f'T{article_id}', 'content': '<p>c</p>'})
+
+        with patch('app.ai_processor.AI_API_KEYS', ['key-a']):
+            self.processor = AIProcessor(rate_limiter=MagicMock(), key_scheduler=KeyScheduler(['key-a']),
+                                         rewrite_cache=MagicMock(), response_archive=MagicMock())
+        responses = {
+            f'T{self.ids[0]}': VALID_RESPONSE,
+            f'T{self.ids[1]}': '{"erro": "Conteúdo pago"}',
+            f'T{self.ids[2]}': 'not json',
+        }
+        self.backend = LocalBatchBackend(
+            lambda prompt: next(text for title, text in responses.items() if title in prompt), polls_until_done=2
+        )
+        self.runner = BatchRunner(self.db, self.processor, backend_factory=lambda api_key: self.backend)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _status(self, article_id):
+        self.db.flush()
+        return self.db.conn.execute("SELECT status FROM seen_articles WHERE id = ?", (article_id,)).fetchone()[0]
+
+    def test_backlog_roundtrip(self):
+        """Batched articles leave the work queue; results become REWRITTEN, FAILED or back to EXTRACTED."""
+        backlog = self.db.get_rewrite_backlog(10)
+        self.assertEqual(sorted(row['id'] for row in backlog), self.ids[:3])
+
+        job_ids = self.runner.submit([(row['id'], {'title': f"T{row['id']}"}) for row in backlog])
+        self.assertEqual(len(job_ids), 1)
+        self.assertEqual(self.db.get_rewrite_backlog(10), [])
+        self.assertEqual(self.db.get_articles_to_process('valor_financas', 10)[0]['status'], 'NEW')
+
+        self.assertEqual(self.runner.poll(), 0)  # still running
+        self.assertEqual(self.db.get_open_batch_jobs()[0]['state'], 'RUNNING')
+        self.assertEqual(self.runner.poll(), 1)
+        self.assertEqual(self.db.get_open_batch_jobs(), [])
+
+        self.assertEqual(self.db.load_stage_artifacts(self.ids[0])['REWRITTEN']['titulo_final'], 'T')
+        self.assertEqual(
+            [self._status(i) for i in self.ids[:3]], ['REWRITTEN', 'FAILED', 'EXTRACTED']
+        )
+        self.assertEqual([row['id'] for row in self.db.get_rewrite_backlog(10)], [self.ids[2]])
+
+    def test_jobs_are_split_by_size(self):
+        """A backlog larger than max_batch_size goes out as several jobs."""
+        self.runner.max_batch_size = 2
+        job_ids = self.runner.submit([(article_id, {'title': f'T{article_id}'}) for article_id in self.ids[:3]])
+        self.assertEqual(len(job_ids), 2)
+        self.assertEqual([len(job['article_ids']) for job in self.db.get_open_batch_jobs()], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Unit tests for the feeds module
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from app.feeds import FeedReader
+from app.store import Database
+
+RSS = b"""<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>
+<item><title>Primeira</title><link>https://example.com/1</link><guid>g1</guid></item>
+</channel></rss>"""
+
+
+def _response(status_code=200, content=b"", headers=None):
+    resp = MagicMock(status_code=status_code, content=content, headers=headers or {})
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+class TestFeedReader(unittest.TestCase):
+    """Test cases for conditional fetching in FeedReader"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmpdir.name, 'test.db'))
+        self.db.initialize()
+        self.config = {'urls': ['https://example.com/feed'], 'type': 'rss'}
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _reader(self, *responses):
+        reader = FeedReader('test-agent', rate_limiter=MagicMock(), db=self.db)
+        reader.session = MagicMock()
+        reader.session.get.side_effect = list(responses)
+        return reader
+
+    def test_validators_are_sent_and_unchanged_feeds_skipped(self):
+        """Validators persist across readers; a 304 or an identical body yields no items."""
+        reader = self._reader(_response(content=RSS, headers={'ETag': '"abc"'}))
+        self.assertEqual(len(reader.read_feeds(self.config, 'src')), 1)
+        reader.commit_feed_state('src')
+
+        reader = self._reader(_response(status_code=304), _response(content=RSS))
+        self.assertEqual(reader.read_feeds(self.config, 'src'), [])
+        self.assertEqual(reader.session.get.call_args.kwargs['headers'], {'If-None-Match': '"abc"'})
+        self.assertEqual(reader.read_feeds(self.config, 'src'), [])
+
+    def test_state_is_not_saved_before_commit(self):
+        """Without commit_feed_state the next reader fetches and parses the feed again."""
+        reader = self._reader(_response(content=RSS, headers={'ETag': '"abc"'}))
+        reader.read_feeds(self.config, 'src')
+
+        reader = self._reader(_response(content=RSS))
+        self.assertEqual(len(reader.read_feeds(self.config, 'src')), 1)
+        self.assertEqual(reader.session.get.call_args.kwargs['headers'], {})
+
+    def test_sitemap_index_children_are_walked_when_index_is_unchanged(self):
+        """The index is always fetched unconditionally; only its children are skipped when unchanged."""
+        index = (b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                 b'<sitemap><loc>https://example.com/child.xml</loc></sitemap></sitemapindex>')
+        child = (b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                 b'<url><loc>https://example.com/1</loc></url></urlset>')
+        config = {'urls': ['https://example.com/index.xml'], 'type': 'sitemap'}
+        reader = self._reader(_response(content=index, headers={'ETag': '"i"'}),
+                              _response(content=child, headers={'ETag': '"c"'}))
+        self.assertEqual(len(reader.read_feeds(config, 'src')), 1)
+        reader.commit_feed_state('src')
+
+        new_child = child.replace(b'</urlset>', b'<url><loc>https://example.com/2</loc></url></urlset>')
+        reader = self._reader(_response(content=index), _response(content=new_child))
+        self.assertEqual(len(reader.read_feeds(config, 'src')), 2)
+        index_call, child_call = reader.session.get.call_args_list
+        self.assertEqual(index_call.kwargs['headers'], {})
+        self.assertEqual(child_call.kwargs['headers'], {'If-None-Match': '"c"'})
+
+
+if __name__ == '__main__':
+    unittest.main()
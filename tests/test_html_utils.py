@@ -0,0 +1,69 @@
+"""
+Unit tests for the html_utils module
+"""
+
+import unittest
+from unittest.mock import patch
+from app import html_utils
+from app.html_utils import (
+    HtmlTransformChain,
+    merge_images_into_content,
+    merge_images_pass,
+    rewrite_img_srcs_pass,
+    rewrite_img_srcs_with_wp,
+    strip_credits_and_normalize_youtube,
+    strip_credits_and_normalize_youtube_pass,
+)
+from app.internal_linking import LinkMatcher, add_internal_links, internal_links_pass
+
+CONTENT = (
+    '<p>O Copom manteve a Selic.</p>'
+    '<figure><iframe src="https://www.youtube.com/embed/abc123"></iframe></figure>'
+    '<p>Crédito: Agência</p>'
+    '<p><img src="https://src.com/a.jpg"/></p>'
+    '<p>A inflação segue alta.</p>'
+)
+IMAGES = ['https://src.com/a.jpg', 'https://src.com/b.jpg']
+UPLOADED = {'https://src.com/b.jpg': 'https://wp.com/b.jpg'}
+
+
+class TestHtmlTransformChain(unittest.TestCase):
+    """Test cases for the HtmlTransformChain class"""
+
+    def setUp(self):
+        self.matcher = LinkMatcher([
+            {'link': 'https://x.com/selic', 'keywords': ['Selic'], 'categories': [1]},
+            {'link': 'https://x.com/inflacao', 'keywords': ['inflação'], 'categories': [2]},
+        ], pilar_posts=[])
+
+    def test_same_output_as_separate_transforms(self):
+        """One parse through every pass gives what the string functions give one after another."""
+        expected = merge_images_into_content(CONTENT, IMAGES)
+        expected = rewrite_img_srcs_with_wp(expected, UPLOADED)
+        expected = strip_credits_and_normalize_youtube(expected)
+        expected = add_internal_links(expected, self.matcher, [1])
+
+        chain = (HtmlTransformChain()
+                 .add('merge_images', merge_images_pass, IMAGES)
+                 .add('rewrite_img_srcs', rewrite_img_srcs_pass, UPLOADED)
+                 .add('strip_credits_youtube', strip_credits_and_normalize_youtube_pass)
+                 .add('internal_links', internal_links_pass, self.matcher, [1]))
+        with patch('app.html_utils.BeautifulSoup', wraps=html_utils.BeautifulSoup) as parse:
+            result = chain.run(CONTENT)
+            self.assertEqual(parse.call_count, 1)
+
+        self.assertEqual(result, expected)
+        self.assertIn('<a href="https://x.com/selic">Selic</a>', result)
+        self.assertIn('https://wp.com/b.jpg', result)
+        self.assertNotIn('Crédito', result)
+        self.assertEqual(list(chain.timings), ['parse', 'merge_images', 'rewrite_img_srcs',
+                                               'strip_credits_youtube', 'internal_links', 'serialize'])
+
+    def test_empty_chain_and_content(self):
+        self.assertEqual(HtmlTransformChain().run(''), '')
+        chain = HtmlTransformChain().add('merge_images', merge_images_pass, ['https://src.com/a.jpg'])
+        self.assertEqual(chain.run(''), merge_images_into_content('', ['https://src.com/a.jpg']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Unit tests for the http_cache module
+"""
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from app.extractor import ContentExtractor
+from app.http_cache import HttpCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHttpCache(unittest.TestCase):
+    """Test cases for the HttpCache class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = HttpCache(self.tmpdir.name, fresh_seconds=60, ttl_seconds=3600, clock=self.clock)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_same_content_is_stored_once(self):
+        """Two URLs with the same body share one blob; validators come back as headers."""
+        h1 = self.cache.store('https://a.com/x', '<p>olá</p>', etag='"v1"')
+        h2 = self.cache.store('https://b.com/x', '<p>olá</p>', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(h1, h2)
+        self.assertEqual(self.cache.conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0], 1)
+
+        entry = self.cache.lookup('https://a.com/x')
+        self.assertEqual(entry['body'], '<p>olá</p>')
+        self.assertTrue(entry['fresh'])
+        self.assertEqual(HttpCache.conditional_headers(entry), {'If-None-Match': '"v1"'})
+
+        self.clock.now += 120
+        self.assertFalse(self.cache.lookup('https://a.com/x')['fresh'])
+        self.cache.mark_validated('https://a.com/x')
+        self.assertTrue(self.cache.lookup('https://a.com/x')['fresh'])
+
+    def test_eviction_by_ttl_and_size(self):
+        """Expired entries go first, then least recently used ones until under max_bytes."""
+        self.cache.store('https://a.com/old', 'old page')
+        self.clock.now += 7200
+        self.cache.store('https://a.com/1', 'x' * 1000 + '1')
+        self.clock.now += 1
+        self.cache.store('https://a.com/2', 'y' * 1000 + '2')
+        self.clock.now += 1
+        self.cache.lookup('https://a.com/1')  # /2 is now the least recently used
+
+        # Room for a single one of the two recent pages
+        self.cache.max_bytes = self.cache.conn.execute('SELECT MAX(size) FROM blobs').fetchone()[0]
+        self.assertEqual(self.cache.evict(), 2)
+        self.assertIsNone(self.cache.lookup('https://a.com/old'))
+        self.assertIsNone(self.cache.lookup('https://a.com/2'))
+        self.assertIsNotNone(self.cache.lookup('https://a.com/1'))
+        self.assertEqual(self.cache.conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0], 1)
+
+    def test_extractor_revalidates_and_runs_offline(self):
+        """A stale entry is revalidated with a conditional GET; offline mode never hits the network."""
+        self.cache.store('https://a.com/x', '<p>cached</p>', etag='"v1"')
+        self.clock.now += 120
+
+        extractor = ContentExtractor(rate_limiter=MagicMock(), http_cache=self.cache)
+        extractor.session = MagicMock()
+        extractor.session.get.return_value = MagicMock(status_code=304)
+
+        self.assertEqual(extractor._fetch_html('https://a.com/x'), '<p>cached</p>')
+        headers = extractor.session.get.call_args.kwargs['headers']
+        self.assertEqual(headers, {'If-None-Match': '"v1"'})
+        self.assertTrue(self.cache.lookup('https://a.com/x')['fresh'])
+
+        self.cache.offline = True
+        extractor.session.get.reset_mock()
+        self.clock.now += 10000
+        self.assertEqual(extractor._fetch_html('https://a.com/x'), '<p>cached</p>')
+        self.assertIsNone(extractor._fetch_html('https://a.com/missing'))
+        extractor.session.get.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
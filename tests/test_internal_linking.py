@@ -0,0 +1,62 @@
+"""
+Unit tests for the internal_linking module
+"""
+
+import unittest
+from unittest.mock import patch
+from app.aho_corasick import AhoCorasick
+from app.internal_linking import LayeredLinkMatcher, LinkMatcher, add_internal_links, get_link_matcher
+
+LINK_MAP = {'posts': [
+    {'link': 'https://x.com/outro', 'keywords': ['Selic'], 'categories': [9]},
+    {'link': 'https://x.com/categoria', 'keywords': ['Selic', 'Copom'], 'categories': [1]},
+    {'link': 'https://x.com/pilar', 'keywords': ['taxa Selic', 'juros'], 'categories': []},
+    {'link': 'https://x.com/ipca', 'keywords': ['IPCA'], 'categories': []},
+]}
+
+
+class TestInternalLinking(unittest.TestCase):
+    """Test cases for add_internal_links"""
+
+    def test_automaton_finds_overlapping_patterns(self):
+        matches = sorted(AhoCorasick(['he', 'she', 'hers', '']).iter_matches('ushers'))
+        self.assertEqual(matches, [(1, 4, 1), (2, 4, 0), (2, 6, 2)])
+
+    def test_priority_and_longest_keyword(self):
+        """PILAR wins over category, which wins over the rest; the longest keyword is linked."""
+        html = '<p>A taxa selic subiu.</p><p>O Copom e a Selic.</p><h2>IPCA</h2><p>O IPCAX e o IPCA.</p>'
+        with patch('app.internal_linking.PILAR_POSTS', ['https://x.com/pilar']):
+            result = add_internal_links(html, LINK_MAP, current_post_categories=[1])
+        self.assertEqual(result, (
+            '<p>A <a href="https://x.com/pilar">taxa selic</a> subiu.</p>'
+            '<p>O Copom e a <a href="https://x.com/categoria">Selic</a>.</p>'
+            '<h2>IPCA</h2><p>O IPCAX e o <a href="https://x.com/ipca">IPCA</a>.</p>'
+        ))
+
+    def test_matcher_is_built_once_per_map(self):
+        self.assertIs(get_link_matcher(LINK_MAP), get_link_matcher(LINK_MAP))
+        html = '<p>Selic &amp; <b>juros</b></p>'
+        result = add_internal_links(html, LINK_MAP, max_links=1)
+        self.assertEqual(result, '<p><a href="https://x.com/outro">Selic</a> &amp; <b>juros</b></p>')
+
+    def test_layered_matcher_matches_a_full_rebuild(self):
+        """A recent layer over the base links exactly like a matcher built from the merged map."""
+        base_posts = [
+            {'link': 'https://x.com/selic', 'keywords': ['Selic', 'juros'], 'categories': [1]},
+            {'link': 'https://x.com/ipca', 'keywords': ['IPCA', 'inflação'], 'categories': [2]},
+            {'link': 'https://x.com/dolar', 'keywords': ['dólar'], 'categories': [3]},
+        ]
+        recent_posts = [
+            {'link': 'https://x.com/copom', 'keywords': ['Copom', 'juros'], 'categories': [2]},
+            {'link': 'https://x.com/dolar', 'keywords': ['câmbio'], 'categories': [2]},
+        ]
+        layered = LayeredLinkMatcher(LinkMatcher(base_posts, []), LinkMatcher(recent_posts, []))
+        full = LinkMatcher(recent_posts + base_posts[:2], [])
+        html = '<p>Os juros subiram.</p><p>O dólar e o câmbio.</p><p>A Selic e o IPCA.</p><p>O Copom.</p>'
+        for categories in ([1], [2], [3], []):
+            self.assertEqual(add_internal_links(html, layered, categories), add_internal_links(html, full, categories))
+        self.assertEqual(len(layered), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Unit tests for the json_stream module
+"""
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from app.ai_processor import AIProcessor
+from app.exceptions import StreamValidationError
+from app.json_stream import JSONStreamValidator
+from app.response_archive import ResponseArchive
+from tests.test_keys import VALID_RESPONSE
+
+
+def feed_all(validator, chunks):
+    """Feeds chunks until the validator asks to stop; returns how many were read."""
+    for count, chunk in enumerate(chunks, 1):
+        if not validator.feed(chunk):
+            return count
+    return len(chunks)
+
+
+class TestJSONStreamValidator(unittest.TestCase):
+    """Test cases for the JSONStreamValidator class"""
+
+    def test_complete_object_across_chunks(self):
+        """Keys and braces split across chunks are tracked; trailing text is not read."""
+        chunks = ['```json\n{"titulo_final": "A {b}', ' \\"c\\"", "yoast_meta": {"x": [1, ', '2]}}', '\n```', 'extra']
+        validator = JSONStreamValidator()
+        self.assertEqual(feed_all(validator, chunks), 3)
+        self.assertTrue(validator.complete)
+        self.assertEqual(validator.top_level_keys, ['titulo_final', 'yoast_meta'])
+        self.assertEqual(validator.text, '{"titulo_final": "A {b} \\"c\\"", "yoast_meta": {"x": [1, 2]}}')
+
+    def test_rejection_stops_early(self):
+        """The stream ends as soon as the `erro` message is known."""
+        validator = JSONStreamValidator()
+        self.assertEqual(feed_all(validator, ['{"erro": "Conte', 'údo \\u00e9 pago", ', '"titulo_final": "x"}']), 2)
+        self.assertEqual(validator.rejection, 'Conteúdo é pago')
+        self.assertFalse(validator.complete)
+
+    def test_structural_errors(self):
+        """Prose, unquoted keys, a missing colon and bad nesting fail on the offending chunk."""
+        for chunks in (['Claro! Aqui está'], ['{titulo: 1}'], ['{"a" 1}'], ['{"a": [1}']):
+            with self.subTest(chunks=chunks), self.assertRaises(StreamValidationError):
+                feed_all(JSONStreamValidator(), chunks)
+
+
+class TestStreamedRewrite(unittest.TestCase):
+    """Streaming and field repair in the AIProcessor"""
+
+    def setUp(self):
+        patcher = patch('app.ai_processor.get_rewrite_cache', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.archive = ResponseArchive(tmpdir.name)
+        self.addCleanup(self.archive.close)
+        with patch('app.ai_processor.AI_API_KEYS', ['key-a']):
+            self.processor = AIProcessor(rate_limiter=MagicMock(), response_archive=self.archive)
+
+    def test_only_missing_fields_are_requested(self):
+        """A response without meta_description and one yoast key is patched with a small follow-up call."""
+        partial = VALID_RESPONSE.replace('"meta_description": "d", ', '').replace('"_yoast_news_keywords": "k"', '"x": 1')
+        client = MagicMock()
+        client.get_client.return_value.stream_text.return_value = iter([partial[:40], partial[40:]])
+        client.get_client.return_value.generate_text.return_value = (
+            '{"meta_description": "nova", "yoast_meta": {"_yoast_news_keywords": "selic"}}'
+        )
+        with patch('app.ai_processor.ai_client', client):
+            data, reason = self.processor.rewrite_content(title='T', content_html='<p>c</p>', article_id=7)
+
+        self.assertIsNone(reason)
+        self.assertEqual(data['meta_description'], 'nova')
+        self.assertEqual(data['yoast_meta']['_yoast_news_keywords'], 'selic')
+        self.assertEqual(data['yoast_meta']['_yoast_wpseo_title'], 'T')
+        repair_prompt = client.get_client.return_value.generate_text.call_args.args[0]
+        self.assertIn('meta_description, yoast_meta._yoast_news_keywords', repair_prompt)
+        self.assertEqual([r['outcome'] for r in self.archive.find(7)], ['repair', 'success'])
+
+    def test_invalid_stream_is_aborted(self):
+        """Output that is not JSON stops the stream after the first chunk."""
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(['Desculpe, não posso', ' ajudar.'])
+        client = MagicMock()
+        client.get_client.return_value.stream_text.return_value = stream
+        with patch('app.ai_processor.ai_client', client):
+            data, reason = self.processor.rewrite_content(title='T', content_html='<p>c</p>', article_id=8)
+
+        self.assertIsNone(data)
+        self.assertIn('JSON object', reason)
+        stream.close.assert_called_once()
+        [record] = self.archive.find(8)
+        self.assertEqual((record['outcome'], record['text']), ('aborted', 'Desculpe, não posso'))
+
+
+if __name__ == '__main__':
+    unittest.main()
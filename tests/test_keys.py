@@ -0,0 +1,163 @@
+"""
+Unit tests for the keys module
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from google.api_core.exceptions import ResourceExhausted
+from app.ai_processor import AIProcessor
+from app.exceptions import AllKeysFailedError
+from app.keys import KeyScheduler, OUTCOME_INVALID, OUTCOME_RATE_LIMITED, OUTCOME_SUCCESS
+from app.store import Database
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+VALID_RESPONSE = (
+    '{"titulo_final": "T", "conteudo_final": "<p>c</p>", "meta_description": "d", '
+    '"focus_keyphrase": "k", "tags_sugeridas": [], "yoast_meta": {"_yoast_wpseo_title": "T", '
+    '"_yoast_wpseo_metadesc": "d", "_yoast_wpseo_focuskw": "k", "_yoast_news_keywords": "k"}}'
+)
+
+
+class TestKeyScheduler(unittest.TestCase):
+    """Test cases for the KeyScheduler class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'test.db')
+        self.db = Database(self.db_path)
+        self.db.initialize()
+        self.clock = FakeClock()
+        cache_patcher = patch('app.ai_processor.get_rewrite_cache', return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _scheduler(self):
+        return KeyScheduler(['key-a', 'key-b', 'key-c'], db=self.db, base_cooldown_seconds=60,
+                            max_cooldown_seconds=3600, clock=self.clock)
+
+    def test_least_loaded_then_healthiest(self):
+        """In-flight requests spread over keys; a failing key drops behind the healthy ones."""
+        scheduler = self._scheduler()
+        first, second = scheduler.acquire(), scheduler.acquire()
+        self.assertNotEqual(first, second)
+        scheduler.release(first, 'error')
+        scheduler.release(second, OUTCOME_SUCCESS)
+
+        self.clock.now += 1
+        picked = [scheduler.acquire() for _ in range(3)]
+        self.assertEqual(picked[-1], first)
+        self.assertIsNone(scheduler.acquire(exclude=[0, 1, 2]))
+
+    def test_cooldown_survives_restart(self):
+        """A 429 cools the key down exponentially, and a new scheduler restores that state."""
+        scheduler = self._scheduler()
+        for _ in range(2):
+            index = scheduler.acquire(exclude=[1, 2])
+            self.assertEqual(index, 0)
+            scheduler.release(index, OUTCOME_RATE_LIMITED)
+            self.clock.now += 61
+
+        self.db.close()
+        self.db = Database(self.db_path)
+        self.db.initialize()
+        restored = self._scheduler()
+        self.assertIsNone(restored.acquire(exclude=[1, 2]))
+        self.assertAlmostEqual(restored.next_available_in(), 0)
+        self.assertEqual(restored.snapshot()[0]['consecutive_failures'], 2)
+        self.assertEqual(restored.snapshot()[0]['api_key'], '...ey-a')
+
+        self.clock.now += 60
+        self.assertEqual(restored.acquire(exclude=[1, 2]), 0)
+
+    def test_rejected_key_cools_down_instead_of_disabling(self):
+        """A rejected key comes back after the long cooldown, and a success makes it valid again."""
+        scheduler = KeyScheduler(['key-a'], db=self.db, invalid_cooldown_seconds=6 * 3600, clock=self.clock)
+        scheduler.release(scheduler.acquire(), OUTCOME_INVALID)
+        self.assertIsNone(scheduler.acquire())
+        self.assertAlmostEqual(scheduler.next_available_in(), 6 * 3600)
+
+        restored = KeyScheduler(['key-a'], db=self.db, invalid_cooldown_seconds=6 * 3600, clock=self.clock)
+        self.assertIsNone(restored.acquire())
+        self.clock.now += 6 * 3600
+        index = restored.acquire()
+        self.assertEqual(index, 0)
+        restored.release(index, OUTCOME_SUCCESS)
+        self.assertTrue(restored.snapshot()[0]['is_valid'])
+
+        # Rows left disabled by earlier versions (no cooldown) are retried at startup
+        row = restored.snapshot()[0]
+        self.db.save_api_key_status({**row, 'is_valid': False, 'cooldown_until': None})
+        self.assertEqual(KeyScheduler(['key-a'], db=self.db, clock=self.clock).acquire(), 0)
+
+    def test_processor_fails_over_without_sleeping(self):
+        """A 429 moves the request to the next key at once; with every key cooling down the article is deferred."""
+        scheduler = KeyScheduler(['key-a', 'key-b'], clock=self.clock)
+        with patch('app.ai_processor.AI_API_KEYS', ['key-a', 'key-b']):
+            processor = AIProcessor(rate_limiter=MagicMock(), key_scheduler=scheduler, response_archive=MagicMock())
+
+        client = MagicMock()
+        client.get_client.return_value.stream_text.side_effect = [ResourceExhausted('quota'), iter([VALID_RESPONSE])]
+        with patch('app.ai_processor.ai_client', client), patch('time.sleep') as sleep:
+            data, reason = processor.rewrite_content(title='T', content_html='<p>c</p>')
+            self.assertEqual(data['titulo_final'], 'T')
+            self.assertEqual(client.get_client.call_args_list[-1].args, ('key-b',))
+            sleep.assert_not_called()
+
+            index = scheduler.acquire()
+            self.assertEqual(index, 1)
+            scheduler.release(index, OUTCOME_RATE_LIMITED)
+            with self.assertRaises(AllKeysFailedError):
+                processor.rewrite_content(title='T', content_html='<p>c</p>')
+        self.assertEqual(client.get_client.return_value.stream_text.call_count, 2)
+
+    def test_concurrent_rewrites_use_one_key_each(self):
+        """Two workers rewrite at the same time on different keys; a third waits for a free key."""
+        scheduler = KeyScheduler(['key-a', 'key-b'], max_in_flight=1, clock=self.clock)
+        with patch('app.ai_processor.AI_API_KEYS', ['key-a', 'key-b']):
+            processor = AIProcessor(rate_limiter=MagicMock(), key_scheduler=scheduler, response_archive=MagicMock())
+
+        barrier = threading.Barrier(2, timeout=5)
+        in_flight, peak, used = [0], [0], []
+        lock = threading.Lock()
+
+        def get_client(api_key):
+            def stream_text(prompt, **kwargs):
+                with lock:
+                    in_flight[0] += 1
+                    peak[0] = max(peak[0], in_flight[0])
+                    used.append(api_key)
+                if len(used) <= 2:
+                    barrier.wait()  # only returns once both keys are busy
+                with lock:
+                    in_flight[0] -= 1
+                return [VALID_RESPONSE]
+            return MagicMock(stream_text=stream_text)
+
+        client = MagicMock(get_client=get_client)
+        with patch('app.ai_processor.ai_client', client), \
+                ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda _: processor.rewrite_content(title='T'), range(3)))
+
+        self.assertTrue(all(data for data, _ in results))
+        self.assertEqual(sorted(used[:2]), ['key-a', 'key-b'])
+        self.assertEqual(peak[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
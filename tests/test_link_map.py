@@ -0,0 +1,219 @@
+"""
+Unit tests for the link_map module
+"""
+
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from app.exceptions import WordPressPublisherError
+from app.internal_linking import add_internal_links
+from app.link_map import LinkMapLoader, build_link_map, load_link_map_artifact
+
+
+class TestLinkMapLoader(unittest.TestCase):
+    """Test cases for the LinkMapLoader class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmpdir.name, 'internal_links.json')
+        self.artifact_path = os.path.join(self.tmpdir.name, 'internal_links.pkl')
+        self._write_map('https://x.com/selic', ['Selic'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_map(self, link, keywords, mtime=1_000_000):
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'posts': [{'link': link, 'keywords': keywords, 'categories': [1]}]}, f)
+        os.utime(self.json_path, (mtime, mtime))
+
+    def test_compiles_once_and_reloads_on_change(self):
+        """The JSON is compiled into the artifact once; later calls reuse it until a file changes."""
+        loader = LinkMapLoader(self.json_path, self.artifact_path)
+        matcher = loader.get()
+        self.assertTrue(os.path.exists(self.artifact_path))
+        with patch('app.link_map.load_link_map_artifact') as load:
+            self.assertIs(loader.get(), matcher)
+            load.assert_not_called()
+
+        # A fresh process reads the artifact instead of the JSON
+        with patch('app.link_map.compile_link_map') as compile_map:
+            fresh = LinkMapLoader(self.json_path, self.artifact_path).get()
+            compile_map.assert_not_called()
+        self.assertEqual(add_internal_links('<p>A Selic caiu.</p>', fresh),
+                         '<p>A <a href="https://x.com/selic">Selic</a> caiu.</p>')
+
+        self._write_map('https://x.com/ipca', ['IPCA'], mtime=2_000_000_000)
+        self.assertEqual(loader.get().links, ['https://x.com/ipca'])
+
+    def test_old_format_is_rebuilt(self):
+        with open(self.artifact_path, 'wb') as f:
+            pickle.dump({'version': 0, 'matcher': None}, f)
+        self.assertIsNone(load_link_map_artifact(self.artifact_path))
+        self.assertEqual(LinkMapLoader(self.json_path, self.artifact_path).get().links, ['https://x.com/selic'])
+        self.assertIsNotNone(load_link_map_artifact(self.artifact_path))
+
+    def test_missing_map(self):
+        os.remove(self.json_path)
+        self.assertIsNone(LinkMapLoader(self.json_path, self.artifact_path).get())
+
+
+
+def _post(post_id, title, date, modified=None, tags=()):
+    return {
+        'id': post_id,
+        'title': {'rendered': title},
+        'link': f'https://x.com/{post_id}',
+        'categories': [1],
+        'tags': list(tags),
+        'date': date,
+        'modified': modified or date,
+    }
+
+
+class TestBuildLinkMap(unittest.TestCase):
+    """Test cases for the incremental link map build"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = {
+            'json_path': os.path.join(self.tmpdir.name, 'internal_links.json'),
+            'artifact_path': os.path.join(self.tmpdir.name, 'internal_links.pkl'),
+            'tag_cache_path': os.path.join(self.tmpdir.name, 'tag_names.json'),
+        }
+        self.client = MagicMock()
+        self.client.get_tags_map_by_ids.side_effect = lambda ids: {i: f'Tag {i}' for i in ids}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read_map(self):
+        with open(self.paths['json_path'], encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_incremental_merge(self):
+        """Later builds only fetch modified posts, only resolve unknown tags and merge by ID."""
+        self.client.get_published_posts.return_value = [
+            _post(2, 'IPCA sobe', '2024-05-02T09:00:00', tags=[10]),
+            _post(1, 'Selic cai', '2024-05-01T09:00:00', tags=[10, 11]),
+        ]
+        self.assertEqual(build_link_map(self.client, **self.paths), 2)
+        self.assertIsNone(self.client.get_published_posts.call_args.kwargs['modified_after'])
+        self.assertEqual(self._read_map()['posts'][1]['keywords'], ['Selic cai', 'Tag 10', 'Tag 11'])
+
+        self.client.get_tags_map_by_ids.reset_mock()
+        self.client.get_published_posts.return_value = [
+            _post(3, 'Dólar recua', '2024-05-03T09:00:00', tags=[10, 12]),
+            _post(1, 'Selic cai de novo', '2024-05-01T09:00:00', '2024-05-03T10:00:00', tags=[11]),
+        ]
+        self.assertEqual(build_link_map(self.client, **self.paths), 2)
+        self.assertEqual(self.client.get_published_posts.call_args.kwargs['modified_after'], '2024-05-02T09:00:00')
+        self.client.get_tags_map_by_ids.assert_called_once_with([12])
+
+        link_map = self._read_map()
+        self.assertEqual(link_map['last_modified'], '2024-05-03T10:00:00')
+        self.assertEqual([p['id'] for p in link_map['posts']], [3, 2, 1])
+        self.assertEqual(link_map['posts'][2]['keywords'], ['Selic cai de novo', 'Tag 11'])
+        self.assertEqual(load_link_map_artifact(self.paths['artifact_path']).links,
+                         ['https://x.com/3', 'https://x.com/2', 'https://x.com/1'])
+
+    def test_nothing_modified_leaves_files_untouched(self):
+        self.client.get_published_posts.return_value = [_post(1, 'Selic cai', '2024-05-01T09:00:00')]
+        build_link_map(self.client, **self.paths)
+        os.utime(self.paths['json_path'], (1_000_000, 1_000_000))
+
+        self.client.get_published_posts.return_value = []
+        self.assertEqual(build_link_map(self.client, **self.paths), 0)
+        self.assertEqual(os.stat(self.paths['json_path']).st_mtime, 1_000_000)
+
+    def test_failed_page_does_not_advance_last_modified(self):
+        """A refresh that could not fetch every page keeps the map, so the next one asks again."""
+        self.client.get_published_posts.return_value = [_post(1, 'Selic cai', '2024-05-01T09:00:00')]
+        build_link_map(self.client, **self.paths)
+
+        self.client.get_published_posts.side_effect = WordPressPublisherError('Could not fetch page 2')
+        self.assertEqual(build_link_map(self.client, **self.paths), 0)
+        self.assertEqual(self._read_map()['last_modified'], '2024-05-01T09:00:00')
+
+        self.client.get_published_posts.side_effect = None
+        self.client.get_published_posts.return_value = [_post(2, 'IPCA sobe', '2024-05-02T09:00:00')]
+        build_link_map(self.client, **self.paths)
+        self.assertEqual(self.client.get_published_posts.call_args.kwargs['modified_after'], '2024-05-01T09:00:00')
+
+    def test_map_without_ids_gets_a_full_build(self):
+        with open(self.paths['json_path'], 'w', encoding='utf-8') as f:
+            json.dump({'posts': [{'link': 'https://x.com/old', 'keywords': ['Old'], 'categories': []}]}, f)
+        self.client.get_published_posts.return_value = [_post(1, 'Selic cai', '2024-05-01T09:00:00')]
+
+        build_link_map(self.client, max_posts=500, **self.paths)
+
+        self.assertIsNone(self.client.get_published_posts.call_args.kwargs['modified_after'])
+        self.assertEqual([p['link'] for p in self._read_map()['posts']], ['https://x.com/1'])
+
+
+
+class TestLiveLinkMapUpdates(unittest.TestCase):
+    """Test cases for LinkMapLoader.add_published_post"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmpdir.name, 'internal_links.json')
+        self.artifact_path = os.path.join(self.tmpdir.name, 'internal_links.pkl')
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_modified': '2024-05-02T09:00:00', 'posts': [
+                {'id': 2, 'link': 'https://x.com/2', 'keywords': ['IPCA'], 'categories': [1],
+                 'date': '2024-05-02T09:00:00', 'modified': '2024-05-02T09:00:00'},
+                {'id': 1, 'link': 'https://x.com/1', 'keywords': ['Selic'], 'categories': [1],
+                 'date': '2024-05-01T09:00:00', 'modified': '2024-05-01T09:00:00'},
+            ]}, f)
+        self.loader = LinkMapLoader(self.json_path, self.artifact_path)
+        self.loader.get()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_new_post_is_linked_immediately(self):
+        """A published post is a link target at once, without touching the files until flush()."""
+        post = _post(3, 'Dólar recua', '2024-05-03T09:00:00')
+        tags = ['dólar recua', 'Câmbio', 'Câmbio', 'x', 'Real', 'Euro']
+        json_mtime = os.stat(self.json_path).st_mtime
+        with patch('app.link_map.compile_link_map') as compile_map:
+            self.assertTrue(self.loader.add_published_post(post, tags, max_keywords=3))
+            compile_map.assert_not_called()
+        self.assertTrue(self.loader.dirty)
+        self.assertEqual(os.stat(self.json_path).st_mtime, json_mtime)
+
+        matcher = self.loader.get()
+        self.assertEqual(len(matcher), 3)
+        self.assertEqual(add_internal_links('<p>O Câmbio mudou.</p><p>A Selic caiu.</p>', matcher, [1]),
+                         '<p>O <a href="https://x.com/3">Câmbio</a> mudou.</p>'
+                         '<p>A <a href="https://x.com/1">Selic</a> caiu.</p>')
+
+        self.assertEqual(self.loader.flush(), 1)
+        self.assertFalse(self.loader.dirty)
+        with open(self.json_path, encoding='utf-8') as f:
+            link_map = json.load(f)
+        self.assertEqual(link_map['posts'][0]['keywords'], ['Dólar recua', 'Câmbio', 'Real'])
+        # Left for the next incremental build to pick up edits made elsewhere
+        self.assertEqual(link_map['last_modified'], '2024-05-02T09:00:00')
+        self.assertEqual(load_link_map_artifact(self.artifact_path).links[0], 'https://x.com/3')
+        self.assertEqual(self.loader.get().links, ['https://x.com/3', 'https://x.com/2', 'https://x.com/1'])
+
+    def test_same_post_is_replaced_and_size_is_capped(self):
+        """A republished post hides its old entry; flush keeps the newest max_posts."""
+        self.loader.add_published_post(_post(1, 'Juros em queda', '2024-05-04T09:00:00'), [])
+        matcher = self.loader.get()
+        self.assertEqual(len(matcher), 2)
+        self.assertEqual(add_internal_links('<p>A Selic caiu.</p>', matcher), '<p>A Selic caiu.</p>')
+        self.assertIn('href="https://x.com/1"', add_internal_links('<p>Juros em queda.</p>', matcher))
+
+        self.loader.add_published_post(_post(3, 'Dólar recua', '2024-05-03T09:00:00'), [])
+        self.assertEqual(self.loader.flush(max_posts=2), 2)
+        self.assertEqual(self.loader.get().links, ['https://x.com/1', 'https://x.com/3'])
+        self.assertEqual(self.loader.flush(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Unit tests for the precleaner module
+"""
+
+import unittest
+from bs4 import BeautifulSoup
+from app.precleaner import (
+    PreCleaner,
+    RULE_RELATED_HEADING,
+    RULE_RELATED_LINK,
+    RULE_SRDB_TEXT,
+    get_precleaner,
+)
+
+
+class TestPreCleaner(unittest.TestCase):
+    """Test cases for the compiled single-pass cleaner"""
+
+    def test_removes_matches_and_counts_per_rule(self):
+        """Each selector kind is matched and only outermost removals are counted."""
+        html = (
+            '<body><header>menu</header>'
+            '<div class="ad-slot"><div class="banner">x</div></div>'
+            '<div id="sidebar-right">s</div>'
+            '<div data-ad="1">d</div>'
+            '<section aria-label="Leia mais">l</section>'
+            '<p>keep <a class="leia-mais" href="#">r</a></p>'
+            '<p class="note">powered by SRDB</p>'
+            '<p>conteúdo</p></body>'
+        )
+        soup = BeautifulSoup(html, 'lxml')
+        removed = get_precleaner('').clean(soup)
+
+        self.assertEqual(soup.body.get_text(" ", strip=True), "keep conteúdo")
+        self.assertEqual(removed['header'], 1)
+        self.assertEqual(removed['[class*="ad-"]'], 1)
+        self.assertEqual(removed['.banner'], 0)
+        self.assertEqual(removed['[id*="sidebar"]'], 1)
+        self.assertEqual(removed['[data-ad]'], 1)
+        self.assertEqual(removed["section[aria-label*='Leia']"], 1)
+        self.assertEqual(removed[RULE_RELATED_LINK], 1)
+        self.assertEqual(removed[RULE_SRDB_TEXT], 1)
+
+    def test_related_heading_removes_small_container(self):
+        """A 'Leia também' heading takes its container along, even one matched by another rule."""
+        html = (
+            '<body><div><div class="box"><h3 class="related-title">Leia também</h3>'
+            '<ul><li>a</li></ul></div></div><p>texto</p></body>'
+        )
+        soup = BeautifulSoup(html, 'lxml')
+        removed = PreCleaner(['[class*="related"]']).clean(soup)
+
+        self.assertEqual(soup.body.get_text(strip=True), "texto")
+        self.assertEqual(removed[RULE_RELATED_HEADING], 1)
+        self.assertEqual(sum(removed.values()), 1)
+
+    def test_site_rules_are_merged_per_host(self):
+        """Site-specific selectors only apply to their host and cleaners are cached."""
+        html = '<body><div class="see-also">s</div><p>t</p></body>'
+
+        soup = BeautifulSoup(html, 'lxml')
+        get_precleaner('example.com').clean(soup)
+        self.assertIsNotNone(soup.find(class_='see-also'))
+
+        soup = BeautifulSoup(html, 'lxml')
+        removed = get_precleaner('www.estadao.com.br').clean(soup)
+        self.assertIsNone(soup.find(class_='see-also'))
+        self.assertEqual(removed['.see-also'], 1)
+        self.assertIs(get_precleaner('www.estadao.com.br'), get_precleaner('www.estadao.com.br'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Unit tests for the prompt_builder module
+"""
+
+import unittest
+from app.prompt_builder import PromptTemplate, count_tokens, prepare_content
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """Test cases for the prompt builder"""
+
+    def test_template_keeps_literal_braces(self):
+        """Only known fields are placeholders; JSON examples in the template stay untouched."""
+        template = PromptTemplate('{"titulo": "..."} {titulo_original} {desconhecido} {content}', ('titulo_original', 'content'))
+        self.assertEqual(
+            template.render({'titulo_original': 'T {x}', 'content': None}),
+            '{"titulo": "..."} T {x} {desconhecido} '
+        )
+
+    def test_markup_and_boilerplate_are_stripped(self):
+        """Attributes, scripts, boilerplate, repeated blocks and repeated images are dropped."""
+        html = (
+            '<div class="materia"><p style="x">Lead com <b>dados</b>.</p><script>track()</script>'
+            '<p>Leia também: outra matéria</p><p>Lead com dados.</p>'
+            '<figure class="foto"><img src="a.jpg" alt="A" data-lazy="1"><figcaption>Foto: <i>Ag</i></figcaption></figure>'
+            '<div>Texto <a href="/x" class="c">solto</a></div><img src="a.jpg"></div>'
+        )
+        self.assertEqual(prepare_content(html, 0).split('\n'), [
+            '<p>Lead com <b>dados</b>.</p>',
+            '<figure><img alt="A" src="a.jpg"/><figcaption>Foto: Ag</figcaption></figure>',
+            '<p>Texto <a href="/x">solto</a></p>',
+        ])
+
+    def test_bare_text_is_escaped(self):
+        """Loose text and captions keep their entities when wrapped in new elements."""
+        html = ('<div><p>Lead.</p>P&amp;G sobe se a &lt; b'
+                '<figure><img src="a.jpg"><figcaption>Foto: A&amp;B</figcaption></figure></div>')
+        self.assertEqual(prepare_content(html, 0).split('\n'), [
+            '<p>Lead.</p>',
+            '<p>P&amp;G sobe se a &lt; b</p>',
+            '<figure><img src="a.jpg"/><figcaption>Foto: A&amp;B</figcaption></figure>',
+        ])
+
+    def test_budget_keeps_lead_figures_and_media(self):
+        """Over budget, the lead and the paragraphs with numbers survive, in the original order."""
+        filler = 'Analistas comentaram o cenário com cautela e sem grandes novidades. ' * 3
+        html = (
+            '<p>O Copom manteve a Selic nesta quarta.</p>'
+            f'<p>{filler}</p>'
+            '<p>A taxa ficou em 10,50% ao ano e o IPCA acumulou 4,2% em 12 meses.</p>'
+            '<img src="grafico.png">'
+            f'<p>{filler} Mais opinião.</p>'
+        )
+        result = prepare_content(html, 80, lead_blocks=1)
+        self.assertEqual(result.split('\n'), [
+            '<p>O Copom manteve a Selic nesta quarta.</p>',
+            '<p>A taxa ficou em 10,50% ao ano e o IPCA acumulou 4,2% em 12 meses.</p>',
+            '<img src="grafico.png"/>',
+        ])
+        self.assertLessEqual(count_tokens(result), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Unit tests for the rate_limit module
+"""
+
+import unittest
+from app.rate_limit import TokenBucket, RateLimiter
+
+
+class FakeClock:
+    """Manually advanced clock; sleeping simply moves time forward."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the TokenBucket class"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=0.5, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_then_wait(self):
+        """The first `capacity` calls pass immediately, the next one waits 1/rate seconds."""
+        self.assertEqual(self.bucket.acquire(), 0.0)
+        self.assertEqual(self.bucket.acquire(), 0.0)
+        self.assertAlmostEqual(self.bucket.acquire(), 2.0)
+        self.assertEqual(self.clock.slept, [2.0])
+
+    def test_refill_over_time(self):
+        """Tokens come back as time passes, up to the capacity."""
+        self.bucket.acquire()
+        self.bucket.acquire()
+        self.assertFalse(self.bucket.try_acquire())
+        self.clock.now += 10
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertFalse(self.bucket.try_acquire())
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the RateLimiter registry"""
+
+    def test_buckets_are_per_name_and_grouped(self):
+        limiter = RateLimiter({'gemini': {'per_minute': 6, 'burst': 1}})
+        first = limiter.bucket('gemini:0')
+        self.assertIs(first, limiter.bucket('gemini:0'))
+        self.assertIsNot(first, limiter.bucket('gemini:1'))
+        self.assertAlmostEqual(first.rate, 0.1)
+
+    def test_unconfigured_group_is_unlimited(self):
+        limiter = RateLimiter({})
+        self.assertIsNone(limiter.bucket('host:example.com'))
+        self.assertEqual(limiter.acquire('host:example.com'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
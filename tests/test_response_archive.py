@@ -0,0 +1,73 @@
+"""
+Unit tests for the response_archive module
+"""
+
+import os
+import tempfile
+import unittest
+from app.response_archive import ResponseArchive
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseArchive(unittest.TestCase):
+    """Test cases for the ResponseArchive class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _archive(self, **kwargs):
+        archive = ResponseArchive(self.tmpdir.name, clock=self.clock, **kwargs)
+        self.addCleanup(archive.close)
+        return archive
+
+    def test_records_are_indexed_by_article(self):
+        """Each response is read back from its own offset, across segment rotations."""
+        archive = self._archive(segment_max_bytes=200)
+        for i in range(6):
+            archive.record(f'{{"titulo_final": "{i}"}}' * 20, article_id=i % 2, key_index=i)
+        archive.flush()
+
+        self.assertGreater(len(archive._segments()), 1)
+        self.assertEqual([r['key_index'] for r in archive.find(1)], [1, 3, 5])
+        self.assertEqual(archive.find(0)[2]['text'], '{"titulo_final": "4"}' * 20)
+        self.assertEqual(archive.find(99), [])
+
+    def test_sampling_keeps_failures(self):
+        """With sampling at 0 only non-success responses are archived."""
+        archive = self._archive(sample_rate=0)
+        self.assertFalse(archive.record('{}', article_id=1))
+        self.assertTrue(archive.record('oops', article_id=1, outcome='error'))
+        self.assertEqual([r['text'] for r in archive.find(1)], ['oops'])
+
+    def test_retention_by_size_and_age(self):
+        """Old segments and their index rows go; the segment being written stays."""
+        archive = self._archive(segment_max_bytes=1, max_total_bytes=10 ** 6, retention_seconds=3600)
+        for i in range(3):
+            archive.record('x' * 100, article_id=i)
+            archive.flush()
+        segments = archive._segments()
+        self.assertEqual(len(segments), 3)
+
+        os.utime(segments[0], (self.clock.now - 7200, self.clock.now - 7200))
+        self.assertEqual(archive.enforce_retention(), 1)
+        self.assertEqual(archive.find(0), [])
+
+        archive.max_total_bytes = 0
+        self.assertEqual(archive.enforce_retention(), 1)
+        self.assertEqual(archive._segments(), [archive._segment])
+        self.assertEqual(len(archive.find(2)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Unit tests for the rewrite_cache module
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from app.ai_processor import AIProcessor
+from app.keys import KeyScheduler
+from app.rewrite_cache import RewriteCache, content_key
+from tests.test_keys import VALID_RESPONSE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRewriteCache(unittest.TestCase):
+    """Test cases for the RewriteCache class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = RewriteCache(os.path.join(self.tmpdir.name, 'rewrites.db'),
+                                  ttl_seconds=3600, clock=self.clock)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_key_ignores_markup_and_formatting(self):
+        """Syndicated copies that differ only in markup, images, case or accents share a key."""
+        a = content_key('Copom mantém a Selic', '<p>O Banco Central manteve a taxa.</p><figure><img src="a.jpg"></figure>', 'v1')
+        b = content_key('COPOM MANTEM A SELIC', '<div>O Banco  Central manteve a taxa</div>\n<img src="b.jpg">', 'v1')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, content_key('Copom mantém a Selic', '<p>O Banco Central manteve a taxa.</p>', 'v2'))
+        self.assertNotEqual(a, content_key('Copom mantém a Selic', '<p>O Banco Central subiu a taxa.</p>', 'v1'))
+
+    def test_ttl_and_size_eviction(self):
+        """Expired entries are not served; over max_bytes the least recently used go first."""
+        self.cache.put('old', {'titulo_final': 'old'})
+        self.clock.now += 7200
+        self.assertIsNone(self.cache.get('old'))
+
+        self.cache.put('k1', {'titulo_final': 'x' * 500})
+        self.clock.now += 1
+        self.cache.put('k2', {'titulo_final': 'y' * 500})
+        self.clock.now += 1
+        self.cache.get('k1')  # k2 is now the least recently used
+
+        self.cache.max_bytes = self.cache.conn.execute('SELECT MAX(size) FROM rewrites').fetchone()[0]
+        self.assertEqual(self.cache.evict(), 2)
+        self.assertIsNone(self.cache.get('k2'))
+        self.assertEqual(self.cache.get('k1'), {'titulo_final': 'x' * 500})
+
+    def test_processor_reuses_cached_rewrite(self):
+        """The same story with the same context is served from the cache without calling the model."""
+        processor, client = self._processor()
+        with patch('app.ai_processor.ai_client', client):
+            first, _ = processor.rewrite_content(title='Título', content_html='<p>Texto</p>',
+                                                 source_url='https://a.com/1', category='Economia')
+            second, _ = processor.rewrite_content(title='título', content_html='<div>Texto</div>',
+                                                  source_url='https://a.com/1', category='Economia')
+        self.assertEqual(first, second)
+        self.assertEqual(client.get_client.return_value.stream_text.call_count, 1)
+
+    def test_other_source_or_category_misses_cache(self):
+        """The same text from another source or in another category is rewritten with its own context."""
+        processor, client = self._processor()
+        article = {'title': 'Título', 'content_html': '<p>Texto</p>'}
+        with patch('app.ai_processor.ai_client', client):
+            processor.rewrite_content(**article, source_url='https://a.com/1', category='Economia')
+            processor.rewrite_content(**article, source_url='https://b.com/2', category='Economia')
+            processor.rewrite_content(**article, source_url='https://a.com/1', category='Política')
+            processor.rewrite_content(**article, source_url='https://a.com/1', category='Economia', tags=['Selic'])
+        self.assertEqual(client.get_client.return_value.stream_text.call_count, 4)
+
+    def _processor(self):
+        with patch('app.ai_processor.AI_API_KEYS', ['key-a']):
+            processor = AIProcessor(rate_limiter=MagicMock(), key_scheduler=KeyScheduler(['key-a']),
+                                    rewrite_cache=self.cache, response_archive=MagicMock())
+        client = MagicMock()
+        client.get_client.return_value.stream_text.side_effect = lambda *a, **kw: iter([VALID_RESPONSE])
+        return processor, client
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+"""
+Unit tests for the store module
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from app.config import RETRY_CONFIG
+from app.simhash import hamming_distance, simhash
+from app.store import ConnectionPool, Database, read_connection
+
+
+class TestDatabase(unittest.TestCase):
+    """Test cases for the Database class"""
+
+    def setUp(self):
+        """Create a throwaway database file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmpdir.name, 'test.db'))
+        self.db.initialize()
+        items = [{'id': 'a1', 'url': 'https://example.com/a1', 'title': 'A1'}]
+        self.article_id = self.db.filter_new_articles('valor_financas', items)[0]['db_id']
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_stage_artifacts_roundtrip(self):
+        """Stage outputs are persisted and the status follows the last stage."""
+        self.db.save_stage_artifact(self.article_id, 'FETCHED', {'html': '<p>olá</p>'})
+        self.db.save_stage_artifact(self.article_id, 'EXTRACTED', {'title': 'T', 'content': '<p>c</p>'})
+
+        artifacts = self.db.load_stage_artifacts(self.article_id)
+        self.assertEqual(artifacts['FETCHED']['html'], '<p>olá</p>')
+        self.assertEqual(self.db.last_completed_stage(artifacts), 'EXTRACTED')
+
+        due = self.db.get_articles_to_process('valor_financas', limit=10)
+        self.assertEqual([row['id'] for row in due], [self.article_id])
+        self.assertEqual(due[0]['status'], 'EXTRACTED')
+
+    def test_publish_clears_artifacts(self):
+        """Publishing removes the intermediate artifacts and the article stops being resumable."""
+        self.db.save_stage_artifact(self.article_id, 'REWRITTEN', {'titulo_final': 'T'})
+        self.db.save_processed_post(self.article_id, 42)
+        self.db.flush()  # write-behind: committed with the next batch
+
+        self.assertEqual(self.db.load_stage_artifacts(self.article_id), {})
+        self.assertEqual(self.db.get_articles_to_process('valor_financas', limit=10), [])
+
+    def test_defer_article_backoff(self):
+        """Deferred articles are not due until retry_at and give up after max_attempts."""
+        with patch.dict(RETRY_CONFIG, {'base_delay_seconds': 60, 'max_delay_seconds': 600, 'max_attempts': 3}):
+            self.assertEqual(self.db.defer_article(self.article_id, 'HTTP 429'), 'DEFERRED')
+            self.assertEqual(self.db.get_articles_to_process('valor_financas', limit=10), [])
+
+            row = self.db.conn.execute(
+                "SELECT fail_count, retry_at FROM seen_articles WHERE id = ?", (self.article_id,)
+            ).fetchone()
+            self.assertEqual(row['fail_count'], 1)
+            self.assertGreater(datetime.fromisoformat(row['retry_at']), datetime.utcnow() + timedelta(seconds=50))
+
+            # Once due, the deferred article comes back ahead of new ones
+            self.db.conn.execute(
+                "UPDATE seen_articles SET retry_at = ? WHERE id = ?",
+                (datetime.utcnow() - timedelta(seconds=1), self.article_id)
+            )
+            self.db.filter_new_articles('valor_financas', [{'id': 'b2', 'url': 'https://example.com/b2'}])
+            due = self.db.get_articles_to_process('valor_financas', limit=10)
+            self.assertEqual(due[0]['id'], self.article_id)
+            self.assertEqual(due[0]['status'], 'DEFERRED')
+
+            self.assertEqual(self.db.defer_article(self.article_id, 'HTTP 429'), 'DEFERRED')
+            self.assertEqual(self.db.defer_article(self.article_id, 'HTTP 429'), 'FAILED')
+
+    def test_filter_new_articles_batch(self):
+        """Only unseen items come back, in feed order; recently seen keys skip SQLite."""
+        items = [
+            {'id': 'a1', 'url': 'https://example.com/a1'},  # inserted in setUp
+            {'id': 'n1', 'url': 'https://example.com/n1'},
+            {'id': 'n1', 'url': 'https://example.com/n1-dup'},
+            {'url': 'https://example.com/no-id'},
+            {'title': 'no id and no url'},
+        ]
+        with patch('app.store.INSERT_BATCH_SIZE', 1):
+            new = self.db.filter_new_articles('valor_financas', items)
+        self.assertEqual([a['url'] for a in new], ['https://example.com/n1', 'https://example.com/no-id'])
+        self.assertTrue(all(a['db_id'] for a in new))
+
+        with patch.object(self.db, '_get_cursor', side_effect=AssertionError('hit SQLite')):
+            self.assertEqual(self.db.filter_new_articles('valor_financas', items[:4]), [])
+
+    def test_filter_new_articles_reports_failure(self):
+        """A database error returns None, not an empty list, so the feed is not marked as read."""
+        with patch.object(self.db, '_get_cursor', side_effect=sqlite3.OperationalError('disk I/O error')):
+            self.assertIsNone(self.db.filter_new_articles('valor_financas', [{'id': 'z1', 'url': 'https://example.com/z1'}]))
+
+    def test_pooled_reads_do_not_wait_for_writer(self):
+        """In WAL mode pooled read connections see committed data while a write is open."""
+        self.assertEqual(self.db.conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.db.conn.execute("BEGIN IMMEDIATE")
+        self.db.conn.execute("UPDATE seen_articles SET status = 'FAILED' WHERE id = ?", (self.article_id,))
+
+        due = self.db.get_articles_to_process('valor_financas', limit=10)
+        self.assertEqual([row['status'] for row in due], ['NEW'])
+        with read_connection(self.db.db_path) as conn:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM posts")
+        self.db.conn.rollback()
+
+    def test_exhausted_pool_raises_operational_error(self):
+        """A read that finds every pooled connection busy fails with a clear sqlite3 error."""
+        pool = ConnectionPool(self.db.db_path, size=1)
+        with patch('app.store.BUSY_TIMEOUT_SECONDS', 0.01), pool.connection():
+            with self.assertRaisesRegex(sqlite3.OperationalError, 'Read pool exhausted'):
+                with pool.connection():
+                    pass
+        pool.close()
+
+    def test_write_behind_keeps_order_and_replays_journal(self):
+        """Queued statuses are journaled, applied before synchronous writes, and replayed on startup."""
+        self.db.update_article_status(self.article_id, 'PROCESSING')
+        with open(self.db._journal_path, encoding='utf-8') as f:
+            self.assertIn('"PROCESSING"', f.read())
+        self.db.save_stage_artifact(self.article_id, 'FETCHED', {'html': '<p></p>'})
+        self.db.flush()
+        status = self.db.conn.execute("SELECT status FROM seen_articles WHERE id = ?", (self.article_id,)).fetchone()[0]
+        self.assertEqual(status, 'FETCHED')
+        self.db.close()
+
+        # A process that died before flushing leaves its operations in the journal
+        journal_path = os.path.join(self.tmpdir.name, 'test.db-status.journal')
+        with open(journal_path, 'w', encoding='utf-8') as f:
+            f.write('{"op": "post", "article_id": %d, "wp_post_id": 7}\n{"op": "sta' % self.article_id)
+        self.db = Database(os.path.join(self.tmpdir.name, 'test.db'))
+        self.db.initialize()
+        row = self.db.conn.execute("SELECT status FROM seen_articles WHERE id = ?", (self.article_id,)).fetchone()
+        self.assertEqual(row['status'], 'PUBLISHED')
+        self.assertEqual(self.db.conn.execute("SELECT wp_post_id FROM posts").fetchone()[0], 7)
+        self.assertEqual(os.path.getsize(journal_path), 0)
+
+    def test_journal_replay_is_idempotent(self):
+        """A journal whose batch was already committed can be replayed without double effects."""
+        self.db.update_article_status(self.article_id, 'DEFERRED', reason='HTTP 503')
+        self.db.update_article_status(self.article_id, 'DEFERRED', reason='HTTP 503')
+        self.db.save_processed_post(self.article_id, 7)
+        with open(self.db._journal_path, encoding='utf-8') as f:
+            journal = f.read()
+        self.db.flush()
+        self.db.close()
+
+        # Died after the commit but before the journal was truncated
+        journal_path = os.path.join(self.tmpdir.name, 'test.db-status.journal')
+        with open(journal_path, 'w', encoding='utf-8') as f:
+            f.write(journal)
+        self.db = Database(os.path.join(self.tmpdir.name, 'test.db'))
+        self.db.initialize()
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0], 1)
+        row = self.db.conn.execute("SELECT fail_count FROM seen_articles WHERE id = ?", (self.article_id,)).fetchone()
+        self.assertEqual(row['fail_count'], 2)
+
+    def test_old_posts_table_gets_unique_index(self):
+        """Duplicate post rows left by earlier replays are dropped when the unique index is added."""
+        path = os.path.join(self.tmpdir.name, 'old.db')
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE posts (id INTEGER PRIMARY KEY AUTOINCREMENT, seen_article_id INTEGER, "
+                     "wp_post_id INTEGER, created_at DATETIME)")
+        conn.executemany("INSERT INTO posts (seen_article_id, wp_post_id) VALUES (?, ?)", [(1, 7), (1, 7), (2, 8)])
+        conn.commit()
+        conn.close()
+
+        db = Database(path)
+        db.initialize()
+        try:
+            self.assertEqual([r[0] for r in db.conn.execute("SELECT seen_article_id FROM posts ORDER BY id")], [1, 2])
+            with self.assertRaises(sqlite3.IntegrityError):
+                db.conn.execute("INSERT INTO posts (seen_article_id, wp_post_id) VALUES (1, 9)")
+        finally:
+            db.close()
+
+    def test_claim_story_fingerprint(self):
+        """A near-identical story from another source matches; unrelated or failed ones don't."""
+        words = [f"palavra{i % 97} termo{i % 13}" for i in range(200)]
+        story = ' '.join(words)
+        copy = ' '.join(words[:100] + ['Fonte: Agência Estado'] + words[100:])
+        other = ' '.join(f"outro{i % 89} texto{i % 7}" for i in range(200))
+        fp_story, fp_copy, fp_other = simhash(story), simhash(copy), simhash(other)
+        self.assertLessEqual(hamming_distance(fp_story, fp_copy), 3)
+        self.assertGreater(hamming_distance(fp_story, fp_other), 3)
+
+        new = self.db.filter_new_articles('g1_economia', [
+            {'id': 'c1', 'url': 'https://example.com/c1'},
+            {'id': 'c2', 'url': 'https://example.com/c2'},
+        ])
+        copy_id, other_id = new[0]['db_id'], new[1]['db_id']
+        self.assertIsNone(self.db.claim_story_fingerprint(self.article_id, fp_story))
+        self.assertIsNone(self.db.claim_story_fingerprint(self.article_id, fp_story))  # resumed: no self-match
+        self.assertEqual(self.db.claim_story_fingerprint(copy_id, fp_copy), self.article_id)
+        self.assertIsNone(self.db.claim_story_fingerprint(other_id, fp_other))
+
+        # The original failed before publishing: the copy gets its chance
+        self.db.update_article_status(self.article_id, 'FAILED')
+        self.assertIsNone(self.db.claim_story_fingerprint(copy_id, fp_copy))
+
+    def test_duplicate_published_when_original_fails(self):
+        """A copy skipped as a duplicate is requeued and published once the original ends FAILED."""
+        words = [f"palavra{i % 97} termo{i % 13}" for i in range(200)]
+        fp = simhash(' '.join(words))
+        new = self.db.filter_new_articles('g1_economia', [
+            {'id': 'c1', 'url': 'https://example.com/c1'},
+            {'id': 'c2', 'url': 'https://example.com/c2'},
+        ])
+        copy_id, second_id = new[0]['db_id'], new[1]['db_id']
+        for article_id in (self.article_id, copy_id, second_id):
+            self.db.save_stage_artifact(article_id, 'EXTRACTED', {'title': 'T', 'content': 'C'})
+
+        self.assertIsNone(self.db.claim_story_fingerprint(self.article_id, fp))
+        self.assertEqual(self.db.claim_story_fingerprint(copy_id, fp), self.article_id)
+        self.assertEqual(self.db.claim_story_fingerprint(second_id, fp), self.article_id)
+        self.db.flush()
+        status = lambda i: self.db.conn.execute("SELECT status FROM seen_articles WHERE id = ?", (i,)).fetchone()[0]
+        self.assertEqual(status(copy_id), 'DUPLICATE')
+
+        # The original hits the deferral cap
+        with patch.dict(RETRY_CONFIG, {'max_attempts': 1}):
+            self.assertEqual(self.db.defer_article(self.article_id, 'WordPress down'), 'FAILED')
+        queued = [row['id'] for row in self.db.get_articles_to_process('g1_economia', 10)]
+        self.assertIn(copy_id, queued)
+        self.assertIn(second_id, queued)
+
+        # The first copy to resume takes the story over; the other stays a duplicate of it
+        self.assertIsNone(self.db.claim_story_fingerprint(copy_id, fp))
+        self.assertEqual(self.db.claim_story_fingerprint(second_id, fp), copy_id)
+        self.db.save_processed_post(copy_id, 555)
+        self.db.flush()
+        self.assertEqual(status(copy_id), 'PUBLISHED')
+        self.assertEqual(status(second_id), 'DUPLICATE')
+
+    def test_unknown_stage_rejected(self):
+        with self.assertRaises(ValueError):
+            self.db.save_stage_artifact(self.article_id, 'PUBLISHED', {})
+
+
+if __name__ == '__main__':
+    unittest.main()
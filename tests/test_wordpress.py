@@ -4,6 +4,8 @@ Unit tests for the wordpress module
 
 import unittest
 from unittest.mock import Mock, patch
+import requests
+from app.exceptions import TransientError, WordPressPublisherError
 from app.wordpress import WordPressClient
 
 class TestWordPressClient(unittest.TestCase):
@@ -21,7 +23,7 @@ class TestWordPressClient(unittest.TestCase):
             'Futebol Internacional': 9,
             'Outros Esportes': 10,
         }
-        self.client = WordPressClient(self.wp_config, self.wp_categories)
+        self.client = WordPressClient(self.wp_config, self.wp_categories, rate_limiter=Mock())
 
     def test_get_domain(self):
         """Test domain extraction from the WordPress URL."""
@@ -129,6 +131,106 @@ class TestWordPressClient(unittest.TestCase):
         final_payload = mock_post.call_args.kwargs['json']
         self.assertEqual(final_payload['tags'], [101, 102])
 
+    @patch('requests.Session.get')
+    def test_get_published_posts_fetches_pages_concurrently(self, mock_get):
+        """Once page 1 reports the page count, the other pages are fetched in parallel, in page order."""
+        def page_response(url, params, timeout):
+            page = params['page']
+            response = Mock(status_code=200, headers={'X-WP-TotalPages': '3'})
+            size = 100 if page < 3 else 20
+            response.json.return_value = [{'id': page * 1000 + i} for i in range(size)]
+            return response
+        mock_get.side_effect = page_response
+
+        posts = self.client.get_published_posts(['id'], max_posts=1000, modified_after='2024-05-01T10:00:00', workers=4)
+
+        self.assertEqual(len(posts), 220)
+        self.assertEqual([p['id'] for p in posts[::100]], [1000, 2000, 3000])
+        self.assertEqual(sorted(c.kwargs['params']['page'] for c in mock_get.call_args_list), [1, 2, 3])
+        self.assertEqual(mock_get.call_args.kwargs['params']['modified_after'], '2024-05-01T10:00:00')
+
+    @patch('requests.Session.get')
+    def test_get_published_posts_reports_failed_page(self, mock_get):
+        """A page that fails raises instead of silently returning the other pages."""
+        def page_response(url, params, timeout):
+            response = Mock(status_code=200, headers={'X-WP-TotalPages': '3'})
+            response.json.return_value = [{'id': i} for i in range(100)]
+            if params['page'] == 2:
+                response.raise_for_status.side_effect = requests.HTTPError('502', response=Mock(text='Bad Gateway'))
+            return response
+        mock_get.side_effect = page_response
+
+        for workers in (1, 4):
+            with self.assertRaises(WordPressPublisherError):
+                self.client.get_published_posts(['id'], max_posts=1000, workers=workers)
+
+    @patch('requests.Session.get')
+    def test_get_published_posts_respects_max_posts(self, mock_get):
+        """Pages beyond max_posts are not requested."""
+        response = Mock(status_code=200, headers={'X-WP-TotalPages': '10'})
+        response.json.return_value = [{'id': i} for i in range(100)]
+        mock_get.return_value = response
+
+        posts = self.client.get_published_posts(['id'], max_posts=150, workers=4)
+
+        self.assertEqual(len(posts), 150)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('app.wordpress.WordPressClient._ensure_tag_ids')
+    @patch('requests.Session.post')
+    def test_create_post_notifies_listener(self, mock_post, mock_ensure_tags):
+        """on_post_created gets the created post and the tag names; its failures don't fail the publish."""
+        listener = Mock(side_effect=RuntimeError('disk full'))
+        client = WordPressClient(self.wp_config, self.wp_categories, on_post_created=listener)
+        mock_ensure_tags.return_value = [101, 102]
+        created = {'id': 789, 'link': 'https://example.com/post-789', 'title': {'rendered': 'Test Title'}}
+        mock_post.return_value = Mock(status_code=201, json=Mock(return_value=created))
+
+        post_id = client.create_post({'title': 'Test Title', 'content': '<p>Content</p>', 'tags': ['tag1', 'tag2']})
+
+        self.assertEqual(post_id, 789)
+        listener.assert_called_once_with(created, ['tag1', 'tag2'])
+
+    @patch('app.wordpress.WordPressClient._ensure_tag_ids', return_value=[])
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_create_post_ignores_failed_meta_check(self, mock_post, mock_get, mock_ensure_tags):
+        """Once the post exists, a failing follow-up call returns the ID instead of a retryable error."""
+        mock_post.return_value = Mock(status_code=201, json=Mock(return_value={'id': 789}))
+        mock_get.side_effect = requests.Timeout('read timed out')
+
+        post_id = self.client.create_post({'title': 'T', 'content': '<p>C</p>', 'meta': {'_yoast_wpseo_title': 'T'}})
+
+        self.assertEqual(post_id, 789)
+
+    @patch('app.wordpress.WordPressClient._ensure_tag_ids', return_value=[])
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_create_post_timeout_finds_created_post(self, mock_post, mock_get, mock_ensure_tags):
+        """A timed-out POST that did create the post is found by slug and not retried."""
+        mock_post.side_effect = requests.Timeout('read timed out')
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value=[{'id': 790, 'slug': 'selic-sobe'}]))
+
+        post_id = self.client.create_post({'title': 'T', 'content': '<p>C</p>', 'slug': 'selic-sobe'})
+
+        self.assertEqual(post_id, 790)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(mock_get.call_args.kwargs['params']['slug'], 'selic-sobe')
+
+    @patch('app.wordpress.WordPressClient._ensure_tag_ids', return_value=[])
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_create_post_timeout_without_post(self, mock_post, mock_get, mock_ensure_tags):
+        """A timed-out POST is only retryable when the post is known not to exist."""
+        mock_post.side_effect = requests.Timeout('read timed out')
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value=[]))
+        with self.assertRaises(TransientError):
+            self.client.create_post({'title': 'T', 'content': '<p>C</p>', 'slug': 'selic-sobe'})
+
+        mock_get.side_effect = requests.ConnectionError('refused')
+        self.assertIsNone(self.client.create_post({'title': 'T', 'content': '<p>C</p>', 'slug': 'selic-sobe'}))
+        self.assertIsNone(self.client.create_post({'title': 'T', 'content': '<p>C</p>'}))
+
     def test_close_session(self):
         """Test that the session is closed."""
         with patch.object(self.client.session, 'close') as mock_close: